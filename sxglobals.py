@@ -8,6 +8,8 @@
 #                           object or component selections,
 #                           the project configuration, and
 #                           methods for saving and loading prefs
+#   profiler              - timings of the refresh phases, tools
+#                           and export stages
 #   setup                 - creates the necessary materials and shaders
 #                           to view the color-layered object. Also creates
 #                           primVars on layered objects to enable
@@ -19,28 +21,94 @@
 #                           such as occlusion baking, applying gradients etc.
 #   layers                - methods required for working with
 #                           vertex color layers
+#   compositor            - vectorized blending of color layers
+#                           into the composite color set
+#   topology              - cached face vertex indices of layered shapes
+#   primvars              - cached layer visibility, blend mode and
+#                           shading mode attributes of layered shapes
+#   layerstats            - cached alpha statistics of color layers
+#                           for the layer list flags
+#   library               - searchable index of the master palette
+#                           and material libraries
+#   selection             - snapshot of the active selection and
+#                           cached history checks of selected objects
+#   validation            - objects and shapes already verified against
+#                           the project layers and primVars
 #   ui                    - the layouts of the SX Tool UI elements and
 #                           context-sensitive selection modes
 #   core                  - the core loop, filters user input and refreshes
 #                           the user interface
+#
+#   setup and export, and the ShaderFX modules used by setup, are only
+#   imported when first used. startupTimes records the import and init
+#   time of each subsystem for printStartupTimes.
 # ----------------------------------------------------------------------------
 
+import collections
+import importlib
+import timeit
+
+startupTimes = collections.OrderedDict()
+
+
+def loadSubsystem(name, moduleName, className):
+    startTime = timeit.default_timer()
+    module = importlib.import_module(moduleName)
+    instance = getattr(module, className)()
+    startupTimes[name] = timeit.default_timer() - startTime
+    return instance
+
+
+# Stands in for a subsystem until its first use, then
+# imports it and replaces itself with the instance
+class LazySubsystem(object):
+    def __init__(self, name, moduleName, className):
+        self.__dict__['lazyArgs'] = (name, moduleName, className)
+
+    def load(self):
+        name = self.__dict__['lazyArgs'][0]
+        if globals().get(name) is self:
+            globals()[name] = loadSubsystem(*self.__dict__['lazyArgs'])
+        return globals()[name]
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self.load(), attr, value)
+
+    # Checking for a subsystem does not load it
+    def __nonzero__(self):
+        return True
+
 
 def initialize():
-    from sxlib.settings import Settings
-    from sxlib.setup import SceneSetup
-    from sxlib.export import Export
-    from sxlib.tools import ToolActions
-    from sxlib.layers import LayerManagement
-    from sxlib.ui import UI
-    from sxlib.core import Core
-
-    global dockID, settings, setup, export, tools, layers, ui, core
+    global dockID, settings, profiler, setup, export, tools, layers, compositor, topology, primvars, layerstats, library, selection, validation, ui, core
+    startupTimes.clear()
     dockID = 'SXToolsUI'
-    settings = Settings()
-    setup = SceneSetup()
-    export = Export()
-    tools = ToolActions()
-    layers = LayerManagement()
-    ui = UI()
-    core = Core()
+    settings = loadSubsystem('settings', 'sxlib.settings', 'Settings')
+    profiler = loadSubsystem('profiler', 'sxlib.profiler', 'Profiler')
+    setup = LazySubsystem('setup', 'sxlib.setup', 'SceneSetup')
+    export = LazySubsystem('export', 'sxlib.export', 'Export')
+    tools = loadSubsystem('tools', 'sxlib.tools', 'ToolActions')
+    layers = loadSubsystem('layers', 'sxlib.layers', 'LayerManagement')
+    compositor = loadSubsystem('compositor', 'sxlib.compositor', 'Compositor')
+    topology = loadSubsystem('topology', 'sxlib.topology', 'TopologyCache')
+    primvars = loadSubsystem('primvars', 'sxlib.primvars', 'PrimVarCache')
+    layerstats = loadSubsystem('layerstats', 'sxlib.layerstats', 'LayerStats')
+    library = loadSubsystem('library', 'sxlib.library', 'PaletteLibrary')
+    selection = loadSubsystem('selection', 'sxlib.selection', 'SelectionCache')
+    validation = loadSubsystem('validation', 'sxlib.validation', 'ValidationCache')
+    ui = loadSubsystem('ui', 'sxlib.ui', 'UI')
+    core = loadSubsystem('core', 'sxlib.core', 'Core')
+
+
+# Import and init times of the subsystems loaded so far,
+# and the time until the dock was shown
+def printStartupTimes():
+    total = 0.0
+    for name, duration in startupTimes.items():
+        print('SX Tools: Startup ' + name + ' ' + str(round(duration, 4)))
+        if name != 'start':
+            total += duration
+    print('SX Tools: Startup subsystems total ' + str(round(total, 4)))
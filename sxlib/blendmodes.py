@@ -0,0 +1,174 @@
+# ----------------------------------------------------------------------------
+#   SX Tools - Maya vertex painting toolkit
+#   (c) 2017-2019  Jani Kahrama / Secret Exit Ltd
+#   Released under MIT license
+#
+#   Blend mode registry shared by layer compositing and layer merging.
+#   The index of a mode in blendModes is the value stored in the
+#   layerNBlendMode attributes. Kernels blend the RGB of float64
+#   (N, 3) arrays with the (N, 1) source alpha and return the result.
+#
+#   This module does not import Maya, so the kernels can be checked
+#   and timed with a plain Python interpreter:
+#   python blendmodes.py
+# ----------------------------------------------------------------------------
+
+import time
+import numpy as np
+
+
+def alphaBlend(target, source, alpha):
+    return source * alpha + target * (1 - alpha)
+
+
+def additiveBlend(target, source, alpha):
+    return target + source * alpha
+
+
+def multiplyBlend(target, source, alpha):
+    # source lerp with white using (1-alpha), multiply with target.
+    # The lerp is rounded to float32 like the original per-channel code.
+    source = (source * alpha + (1 - alpha)).astype(np.float32)
+    return source.astype(np.float64) * target
+
+
+def overlayBlend(target, source, alpha):
+    blend = np.where(
+        target < 0.5,
+        2 * target * source,
+        1 - 2 * (1 - target) * (1 - source))
+    return blend * alpha + target * (1 - alpha)
+
+
+def screenBlend(target, source, alpha):
+    blend = 1 - (1 - target) * (1 - source)
+    return blend * alpha + target * (1 - alpha)
+
+
+# Clamped at zero, negative colors do not survive export
+def subtractBlend(target, source, alpha):
+    return np.maximum(target - source * alpha, 0.0)
+
+
+def maxBlend(target, source, alpha):
+    return np.maximum(target, source) * alpha + target * (1 - alpha)
+
+
+def minBlend(target, source, alpha):
+    return np.minimum(target, source) * alpha + target * (1 - alpha)
+
+
+# (label, kernel, source alpha accumulates to target when merging)
+blendModes = (
+    ('Alpha', alphaBlend, True),
+    ('Add', additiveBlend, True),
+    ('Multiply', multiplyBlend, False),
+    ('Overlay', overlayBlend, True),
+    ('Screen', screenBlend, True),
+    ('Subtract', subtractBlend, True),
+    ('Max', maxBlend, True),
+    ('Min', minBlend, True))
+
+
+def isValid(mode):
+    return mode in range(len(blendModes))
+
+
+# Blends float32 (N, 4) source onto target in place.
+# Math is done in double precision and stored back to float32.
+# With mergeAlpha, the source alpha of accumulating modes is added
+# to the target alpha, as when merging two layers into one.
+# Returns False on unknown modes.
+def blendLayer(target, source, mode, mergeAlpha=False):
+    if not isValid(mode):
+        return False
+
+    label, kernel, accumulate = blendModes[mode]
+    alpha = source[:, 3:4].astype(np.float64)
+    target[:, :3] = kernel(
+        target[:, :3].astype(np.float64),
+        source[:, :3].astype(np.float64),
+        alpha)
+
+    if mergeAlpha and accumulate:
+        target[:, 3] = np.minimum(
+            target[:, 3].astype(np.float64) + alpha[:, 0], 1.0)
+    return True
+
+
+# Prints the time per blend of every mode on count random colors
+def benchmark(count=1000000, repeats=5):
+    random = np.random.RandomState(0)
+    target = random.rand(count, 4).astype(np.float32)
+    source = random.rand(count, 4).astype(np.float32)
+
+    for mode in range(len(blendModes)):
+        times = []
+        for i in range(repeats):
+            result = target.copy()
+            startTime = time.time()
+            blendLayer(result, source, mode)
+            times.append(time.time() - startTime)
+        print(
+            'SX Tools: ' + blendModes[mode][0] + ' blend of ' +
+            str(count) + ' colors: ' + str(round(min(times) * 1000.0, 3)) +
+            ' ms')
+
+
+# Hand-calculated results of blending goldenSource onto goldenTarget
+goldenTarget = (
+    (0.25, 0.5, 0.75, 1.0),
+    (0.8, 0.2, 0.0, 0.5),
+    (0.5, 0.5, 0.5, 0.25))
+goldenSource = (
+    (0.5, 0.5, 0.5, 1.0),
+    (1.0, 0.0, 0.5, 0.5),
+    (0.2, 0.4, 0.6, 0.0))
+goldenValues = {
+    0: ((0.5, 0.5, 0.5), (0.9, 0.1, 0.25), (0.5, 0.5, 0.5)),
+    1: ((0.75, 1.0, 1.25), (1.3, 0.2, 0.25), (0.5, 0.5, 0.5)),
+    2: ((0.125, 0.25, 0.375), (0.8, 0.1, 0.0), (0.5, 0.5, 0.5)),
+    3: ((0.25, 0.5, 0.75), (0.9, 0.1, 0.0), (0.5, 0.5, 0.5)),
+    4: ((0.625, 0.75, 0.875), (0.9, 0.2, 0.25), (0.5, 0.5, 0.5)),
+    5: ((0.0, 0.0, 0.25), (0.3, 0.2, 0.0), (0.5, 0.5, 0.5)),
+    6: ((0.5, 0.5, 0.75), (0.9, 0.2, 0.25), (0.5, 0.5, 0.5)),
+    7: ((0.25, 0.5, 0.5), (0.8, 0.1, 0.0), (0.5, 0.5, 0.5))}
+# Target alpha after merging, for accumulating and other modes
+goldenMergeAlpha = ((1.0, 1.0, 0.25), (1.0, 0.5, 0.25))
+
+
+# Blends the golden arrays with every mode, prints any mismatches
+# and returns True if all modes match
+def checkGoldenValues():
+    source = np.array(goldenSource, dtype=np.float32)
+    success = True
+
+    for mode in range(len(blendModes)):
+        label, kernel, accumulate = blendModes[mode]
+        for mergeAlpha in (False, True):
+            target = np.array(goldenTarget, dtype=np.float32)
+            blendLayer(target, source, mode, mergeAlpha)
+
+            expected = np.array(goldenTarget, dtype=np.float32)
+            expected[:, :3] = goldenValues[mode]
+            if mergeAlpha:
+                expected[:, 3] = goldenMergeAlpha[0 if accumulate else 1]
+
+            if not np.allclose(target, expected, atol=1e-6):
+                print(
+                    'SX Tools Error: ' + label + ' blend golden values do not'
+                    ' match (mergeAlpha=' + str(mergeAlpha) + ')')
+                success = False
+
+    if blendLayer(np.array(goldenTarget, dtype=np.float32), source, len(blendModes)):
+        print('SX Tools Error: Unknown blend mode accepted')
+        success = False
+
+    if success:
+        print('SX Tools: Blend mode golden values match')
+    return success
+
+
+if __name__ == '__main__':
+    checkGoldenValues()
+    benchmark()
@@ -0,0 +1,550 @@
+# ----------------------------------------------------------------------------
+#   SX Tools - Maya vertex painting toolkit
+#   (c) 2017-2019  Jani Kahrama / Secret Exit Ltd
+#   Released under MIT license
+#
+#   Layer colors are read into float32 (N, 4) NumPy arrays, one row
+#   per face vertex, and blended as whole arrays with the kernels of
+#   the blendmodes registry. The blend math is evaluated in double
+#   precision and stored back to float32 after every layer, which is
+#   exactly what assigning to MColor channels one at a time used to do.
+#
+#   The partial composites below every layer are kept per shape, so
+#   an edit to layer k only re-blends layers k..N. Callers pass the
+#   layers they changed; visibility and blend mode changes are found
+#   by comparing against the layer state of the previous composite.
+#   Layer edits the caller did not report, such as brush painting and
+#   undo, are picked up by a dirty plug callback on the colorSets.
+#   Component edits can also pass the face vertex indices they touched,
+#   in which case only those rows are re-blended and written back.
+#
+#   Multi-shape composites read every shape's layers first, blend the
+#   shapes in a thread pool of settings.tools['compositeWorkers']
+#   threads, and write the results back once all blends are done.
+#
+#   Finished composites are also kept in a result cache keyed by the
+#   mesh topology, the layer state and a hash of every visible layer.
+#   Refreshes that find their key there skip blending, and skip the
+#   write too if the 'composite' colorSet already holds the result.
+#   The cache is bounded to settings.tools['compositeCacheSize'] MB
+#   and evicts the least recently used composites first.
+# ----------------------------------------------------------------------------
+
+import hashlib
+import multiprocessing
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+import maya.cmds
+import maya.api.OpenMaya as OM
+import numpy as np
+import sxlib.blendmodes as blendmodes
+import sxglobals
+
+
+class Compositor(object):
+    def __init__(self):
+        self.prefixDict = {}
+        self.dirtyDict = {}
+        self.callbackDict = {}
+        self.resultCache = OrderedDict()
+        self.resultCacheBytes = 0
+        self.cacheStats = {'hits': 0, 'misses': 0, 'skippedWrites': 0}
+        self.timings = {}
+        self.pool = None
+        self.poolSize = 0
+        return None
+
+    def __del__(self):
+        self.clear()
+        self.closePool()
+        print('SX Tools: Exiting compositor')
+
+    def getMesh(self, shape):
+        selectionList = OM.MSelectionList()
+        selectionList.add(shape)
+        nodeDagPath = selectionList.getDagPath(0)
+        return (nodeDagPath, OM.MFnMesh(nodeDagPath))
+
+    # Returns the face vertex colors of a color set as a float32 array,
+    # optionally only the rows of the given face vertex indices
+    def getColorArray(self, MFnMesh, colorSet, indices=None):
+        colorArray = MFnMesh.getFaceVertexColors(colorSet=colorSet)
+        if indices is not None:
+            colorArray = [colorArray[i] for i in indices.tolist()]
+        return np.array(
+            [(color.r, color.g, color.b, color.a) for color in colorArray],
+            dtype=np.float32).reshape(-1, 4)
+
+    def toColorArray(self, colors):
+        return OM.MColorArray([OM.MColor(color) for color in colors.tolist()])
+
+    def getLayerHash(self, colors):
+        return hashlib.md5(colors.tobytes()).digest()
+
+    # Returns a cached composite and marks it most recently used
+    def getResult(self, key):
+        composite = self.resultCache.pop(key, None)
+        if composite is not None:
+            self.resultCache[key] = composite
+        return composite
+
+    def addResult(self, key, composite):
+        limit = sxglobals.settings.tools['compositeCacheSize'] * 1048576
+        if (key not in self.resultCache) and (composite.nbytes <= limit):
+            # Prefixes are patched in place by component edits
+            composite = composite.copy()
+            self.resultCache[key] = composite
+            self.resultCacheBytes += composite.nbytes
+
+        # The limit may also have been lowered since the last call
+        while self.resultCacheBytes > limit:
+            key, oldComposite = self.resultCache.popitem(last=False)
+            self.resultCacheBytes -= oldComposite.nbytes
+
+    # Returns the zero-based stack index of a layer name,
+    # or None for color sets that are not composited
+    def getLayerIndex(self, layer, numLayers):
+        layer = str(layer)
+        if layer.startswith('layer') and layer[5:].isdigit():
+            index = int(layer[5:]) - 1
+            if 0 <= index < numLayers:
+                return index
+        return None
+
+    # Logical index of the colorSet element a plug belongs to,
+    # or None for plugs outside the colorSet array
+    def getColorSetIndex(self, plug):
+        while True:
+            if (plug.isElement and
+               (OM.MFnAttribute(plug.attribute()).name == 'colorSet')):
+                return plug.logicalIndex()
+            if plug.isChild:
+                plug = plug.parent()
+            elif plug.isElement:
+                plug = plug.array()
+            else:
+                return None
+
+    # Records the colorSets written since the last composite.
+    # Callbacks are registered once per node, as in TopologyCache.
+    def addCallbacks(self, mObject):
+        handle = OM.MObjectHandle(mObject)
+        hashCode = handle.hashCode()
+        if hashCode in self.callbackDict:
+            oldHandle, callbackIDs = self.callbackDict[hashCode]
+            if oldHandle.isValid() and (oldHandle.object() == mObject):
+                return
+            self.removeCallbacks(callbackIDs)
+        self.dirtyDict[hashCode] = set()
+        self.callbackDict[hashCode] = (
+            handle, (
+                OM.MNodeMessage.addNodeDirtyPlugCallback(
+                    mObject,
+                    lambda node, plug, *args: self.plugDirty(hashCode, plug)),
+                OM.MNodeMessage.addNodePreRemovalCallback(
+                    mObject,
+                    lambda *args: self.dirtyDict.pop(hashCode, None))))
+
+    def removeCallbacks(self, callbackIDs):
+        for callbackID in callbackIDs:
+            # Callbacks of deleted nodes are already gone
+            try:
+                OM.MMessage.removeCallback(callbackID)
+            except RuntimeError:
+                pass
+
+    def plugDirty(self, hashCode, plug):
+        index = self.getColorSetIndex(plug)
+        if index is not None:
+            self.dirtyDict.setdefault(hashCode, set()).add(index)
+
+    # Names of the layers of a mesh reported dirty by its callback
+    # since the last call. Writes to 'composite' are reported too,
+    # but are not layers and do not invalidate any prefix.
+    def getReportedLayers(self, MFnMesh, numLayers):
+        mObject = MFnMesh.object()
+        self.addCallbacks(mObject)
+        hashCode = OM.MObjectHandle(mObject).hashCode()
+        indices = self.dirtyDict.get(hashCode)
+        if not indices:
+            return []
+
+        MFnDependencyNode = OM.MFnDependencyNode(mObject)
+        colorSets = MFnDependencyNode.findPlug('colorSet', False)
+        nameAttr = MFnDependencyNode.attribute('colorName')
+        layers = []
+        for index in indices:
+            layer = colorSets.elementByLogicalIndex(index).child(
+                nameAttr).asString()
+            if self.getLayerIndex(layer, numLayers) is not None:
+                layers.append(layer)
+        indices.clear()
+        return layers
+
+    # Index of the lowest layer whose cached prefix is no longer valid
+    def getFirstDirtyLayer(self, cache, state, topology, dirtyLayers, numLayers):
+        if ((dirtyLayers is None) or
+           (cache is None) or
+           (cache['topology'] is not topology) or
+           (len(cache['state']) != numLayers)):
+            return 0
+
+        first = numLayers
+        for layer in dirtyLayers:
+            index = self.getLayerIndex(layer, numLayers)
+            if index is not None:
+                first = min(first, index)
+
+        # Visibility and blend mode changes invalidate
+        # the prefixes from the changed layer upwards
+        for i in range(first):
+            if cache['state'][i] != state[i]:
+                return i
+        return first
+
+    # Reads the layer arrays needed to re-blend the stack of one shape
+    # from its first dirty layer upwards. prefixes[i] is the result
+    # of blending layers 1..i+1.
+    def readStack(self, shape, MFnMesh, numLayers, dirtyLayers):
+        topology = sxglobals.topology.getTopology(shape, MFnMesh)
+        state = sxglobals.primvars.getLayerState(shape, numLayers)
+        cache = self.prefixDict.get(shape)
+        reported = self.getReportedLayers(MFnMesh, numLayers)
+        if dirtyLayers is not None:
+            dirtyLayers = list(dirtyLayers) + reported
+
+        first = self.getFirstDirtyLayer(
+            cache, state, topology, dirtyLayers, numLayers)
+        if first == 0:
+            # Set layer1 to black if hidden
+            target = self.getColorArray(MFnMesh, 'layer1')
+            if state[0][0]:
+                hashes = [self.getLayerHash(target), ]
+            else:
+                target[:] = (0.0, 0.0, 0.0, 1.0)
+                hashes = [None, ]
+            prefixes = [target, ]
+            first = 1
+        else:
+            prefixes = cache['prefixes'][:first]
+            # Layers patched by component edits are re-hashed
+            hashes = cache['hashes'][:first]
+            for i in range(len(hashes), first):
+                if state[i][0]:
+                    hashes.append(self.getLayerHash(
+                        self.getColorArray(MFnMesh, 'layer' + str(i + 1))))
+                else:
+                    hashes.append(None)
+
+        sources = {}
+        for i in range(first, numLayers):
+            if state[i][0]:
+                sources[i] = self.getColorArray(MFnMesh, 'layer' + str(i + 1))
+                hashes.append(self.getLayerHash(sources[i]))
+            else:
+                hashes.append(None)
+
+        key = (topology['connectivityHash'], tuple(state), tuple(hashes))
+        composite = self.getResult(key)
+        if composite is not None:
+            self.cacheStats['hits'] += 1
+            # Prefixes of another layer state can not be re-used
+            if (cache is not None) and (cache['key'] != key):
+                self.prefixDict.pop(shape, None)
+            return {
+                'shape': shape,
+                'MFnMesh': MFnMesh,
+                'composite': composite,
+                'indices': None,
+                'cached': True}
+
+        self.cacheStats['misses'] += 1
+        return {
+            'shape': shape,
+            'MFnMesh': MFnMesh,
+            'topology': topology,
+            'state': state,
+            'prefixes': prefixes,
+            'sources': sources,
+            'hashes': hashes,
+            'key': key,
+            'indices': None}
+
+    # Blends the layers read by readStack. Only touches NumPy arrays,
+    # so it can run in the worker threads.
+    def blendStack(self, job):
+        prefixes = job['prefixes']
+        target = prefixes[-1]
+
+        for i in range(len(prefixes), len(job['state'])):
+            visible, mode = job['state'][i]
+            if visible:
+                target = target.copy()
+                if not blendmodes.blendLayer(target, job['sources'][i], mode):
+                    return None
+            prefixes.append(target)
+
+        return target
+
+    # Re-blends only the given face vertices of a layer edit,
+    # and patches the cached prefixes at those rows
+    def compositeComponents(self, MFnMesh, cache, first, indices):
+        prefixes = cache['prefixes']
+        if first == 0:
+            target = self.getColorArray(MFnMesh, 'layer1', indices)
+            if not cache['state'][0][0]:
+                target[:] = (0.0, 0.0, 0.0, 1.0)
+            prefixes[0][indices] = target
+            first = 1
+        else:
+            target = prefixes[first - 1][indices]
+
+        for i in range(first, len(prefixes)):
+            visible, mode = cache['state'][i]
+            if visible:
+                source = self.getColorArray(
+                    MFnMesh, 'layer' + str(i + 1), indices)
+                blendmodes.blendLayer(target, source, mode)
+            # Hidden layers share the array below them,
+            # so the rows written are the same either way
+            prefixes[i][indices] = target
+
+        return target
+
+    # Reads everything needed to composite one shape in the active
+    # shading mode. Component edits and the single-layer shading modes
+    # are cheap enough to finish here, full layer stacks are left
+    # for blendJob.
+    def readShape(self, shape, MFnMesh, numLayers, dirtyLayers=None, indices=None):
+        shading = int(sxglobals.primvars.getAttr(shape, 'shadingMode'))
+
+        if shading == 0:
+            # Component edits only need their own rows re-blended
+            # when the rest of the layer stack is unchanged
+            if (indices is not None) and (dirtyLayers is not None):
+                topology = sxglobals.topology.getTopology(shape, MFnMesh)
+                cache = self.prefixDict.get(shape)
+                state = sxglobals.primvars.getLayerState(shape, numLayers)
+                # Layers the caller did not edit need a full read
+                reported = self.getReportedLayers(MFnMesh, numLayers)
+                dirtyLayers = list(dirtyLayers)
+                if ((cache is not None) and
+                   (cache['topology'] is topology) and
+                   (cache['state'] == state) and
+                   set(reported).issubset(set(dirtyLayers))):
+                    first = self.getFirstDirtyLayer(
+                        cache, state, topology, dirtyLayers, numLayers)
+                    if first == numLayers:
+                        composite = cache['prefixes'][-1][indices]
+                    else:
+                        composite = self.compositeComponents(
+                            MFnMesh, cache, first, indices)
+                        # Edited layers are hashed on the next full read
+                        cache['hashes'] = cache['hashes'][:first]
+                        cache['key'] = None
+                    return {
+                        'shape': shape,
+                        'MFnMesh': MFnMesh,
+                        'composite': composite,
+                        'indices': indices}
+                dirtyLayers += reported
+
+            return self.readStack(shape, MFnMesh, numLayers, dirtyLayers)
+
+        # Layer edits made in the other shading modes
+        # are not tracked, rebuild when returning to mode 0
+        self.prefixDict.pop(shape, None)
+        target = self.getColorArray(
+            MFnMesh, sxglobals.settings.tools['selectedLayer'])
+
+        if shading == 1:
+            target[target[:, 3] == 0.0, :3] = 0.0
+
+        elif shading == 2:
+            target[:, :3] = target[:, 3:4]
+            target[:, 3] = 1.0
+
+        return {
+            'shape': shape,
+            'MFnMesh': MFnMesh,
+            'composite': target,
+            'indices': None}
+
+    def blendJob(self, job):
+        if 'composite' in job:
+            return job['composite']
+        return self.blendStack(job)
+
+    # Stores the prefixes of a blended stack, returns False on failure
+    def finishJob(self, job, composite):
+        if composite is None:
+            print('SX Tools Error: Invalid blend mode')
+            self.prefixDict.pop(job['shape'], None)
+            return False
+
+        if 'sources' in job:
+            self.prefixDict[job['shape']] = {
+                'topology': job['topology'],
+                'state': job['state'],
+                'prefixes': job['prefixes'],
+                'hashes': job['hashes'],
+                'key': job['key']}
+            self.addResult(job['key'], composite)
+        return True
+
+    # Calculates the 'composite' colors of one shape in the active
+    # shading mode. Returns the colors and the face vertex indices
+    # they were calculated for (None for the whole mesh),
+    # or None on failure.
+    def compositeShape(self, shape, MFnMesh, numLayers, dirtyLayers=None, indices=None):
+        job = self.readShape(shape, MFnMesh, numLayers, dirtyLayers, indices)
+        composite = self.blendJob(job)
+        if not self.finishJob(job, composite):
+            return None
+        return (composite, job['indices'])
+
+    def getPool(self, workers):
+        if (self.pool is None) or (self.poolSize != workers):
+            self.closePool()
+            self.pool = ThreadPool(workers)
+            self.poolSize = workers
+        return self.pool
+
+    def closePool(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+            self.poolSize = 0
+
+    # Blends the jobs of several shapes, in parallel when
+    # more than one worker is allowed. NumPy releases the GIL
+    # inside the array kernels, so threads are enough.
+    def blendJobs(self, jobs, workers):
+        stackJobs = [job for job in jobs if 'composite' not in job]
+        if (workers <= 1) or (len(stackJobs) <= 1):
+            return [self.blendJob(job) for job in jobs]
+        return self.getPool(workers).map(self.blendJob, jobs)
+
+    def writeJob(self, job, composite):
+        MFnMesh = job['MFnMesh']
+        topology = sxglobals.topology.getTopology(job['shape'], MFnMesh)
+        indices = job['indices']
+        if job.get('cached'):
+            # Nothing to write if the colorSet is already up to date
+            if np.array_equal(
+               self.getColorArray(MFnMesh, 'composite'), composite):
+                self.cacheStats['skippedWrites'] += 1
+                return
+
+        if indices is None:
+            MFnMesh.setFaceVertexColors(
+                self.toColorArray(composite),
+                topology['faceIdArray'],
+                topology['vtxIdArray'])
+        elif len(indices) > 0:
+            MFnMesh.setFaceVertexColors(
+                self.toColorArray(composite),
+                OM.MIntArray(topology['faceIds'][indices].tolist()),
+                OM.MIntArray(topology['vtxIds'][indices].tolist()))
+
+    # dirtyLayers lists the layers whose colors have changed
+    # since the last composite, None marks every layer dirty.
+    # components optionally maps shapes to the face vertex indices
+    # that were edited, only those are then re-blended and written.
+    # Layer arrays are read and written on the main thread,
+    # the blending of all shapes happens in between.
+    def compositeShapes(self, shapes, dirtyLayers=None, components=None, workers=None):
+        numLayers = sxglobals.settings.project['LayerCount']
+        if workers is None:
+            workers = sxglobals.settings.tools['compositeWorkers']
+
+        startTime = maya.cmds.timerX()
+        sxglobals.primvars.snapshot(shapes)
+        jobs = []
+        for shape in shapes:
+            nodeDagPath, MFnMesh = self.getMesh(shape)
+            shape = MFnMesh.fullPathName()
+
+            indices = None
+            if (components is not None) and (shape in components):
+                indices = np.unique(
+                    np.asarray(components[shape], dtype=np.int32))
+
+            jobs.append(self.readShape(
+                shape, MFnMesh, numLayers, dirtyLayers, indices))
+        self.timings['read'] = maya.cmds.timerX(startTime=startTime)
+        sxglobals.profiler.record('compositor.read', self.timings['read'])
+
+        startTime = maya.cmds.timerX()
+        composites = self.blendJobs(jobs, workers)
+        self.timings['blend'] = maya.cmds.timerX(startTime=startTime)
+        sxglobals.profiler.record('compositor.blend', self.timings['blend'])
+
+        for job, composite in zip(jobs, composites):
+            if not self.finishJob(job, composite):
+                return
+
+        startTime = maya.cmds.timerX()
+        sxglobals.layerstats.suspended = True
+        try:
+            for job, composite in zip(jobs, composites):
+                self.writeJob(job, composite)
+        finally:
+            sxglobals.layerstats.suspended = False
+        self.timings['write'] = maya.cmds.timerX(startTime=startTime)
+        sxglobals.profiler.record('compositor.write', self.timings['write'])
+
+        # Only keep the prefixes of the shapes being edited
+        shapeList = [job['shape'] for job in jobs]
+        for shape in self.prefixDict.keys():
+            if shape not in shapeList:
+                del self.prefixDict[shape]
+
+    # Prints full composite timings of the selected shapes
+    # with 1..maxWorkers blending threads
+    def benchmark(self, maxWorkers=None):
+        shapes = sxglobals.settings.shapeArray
+        if len(shapes) == 0:
+            print('SX Tools Error: Select objects to benchmark')
+            return
+        if maxWorkers is None:
+            maxWorkers = multiprocessing.cpu_count()
+
+        maya.cmds.polyColorSet(shapes, currentColorSet=True, colorSet='composite')
+        for workers in range(1, maxWorkers + 1):
+            self.clear()
+            self.clearResults()
+            startTime = maya.cmds.timerX()
+            self.compositeShapes(shapes, workers=workers)
+            totalTime = maya.cmds.timerX(startTime=startTime)
+            print(
+                'SX Tools: Compositing ' + str(len(shapes)) + ' shapes with ' +
+                str(workers) + ' workers: ' + str(totalTime) + ' (read ' +
+                str(self.timings['read']) + ', blend ' +
+                str(self.timings['blend']) + ', write ' +
+                str(self.timings['write']) + ')')
+        self.closePool()
+
+    def printCacheStats(self):
+        print(
+            'SX Tools: Composite cache ' + str(self.cacheStats['hits']) +
+            ' hits, ' + str(self.cacheStats['misses']) + ' misses, ' +
+            str(self.cacheStats['skippedWrites']) + ' skipped writes, ' +
+            str(len(self.resultCache)) + ' composites in ' +
+            str(round(self.resultCacheBytes / 1048576.0, 2)) + ' MB')
+
+    # Results are keyed by layer content, not by shape,
+    # so they stay valid across scene changes
+    def clearResults(self):
+        self.resultCache.clear()
+        self.resultCacheBytes = 0
+        for stat in self.cacheStats:
+            self.cacheStats[stat] = 0
+
+    def clear(self):
+        self.prefixDict.clear()
+        self.dirtyDict.clear()
+        for handle, callbackIDs in self.callbackDict.values():
+            self.removeCallbacks(callbackIDs)
+        self.callbackDict.clear()
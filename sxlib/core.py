@@ -6,11 +6,25 @@
 
 import maya.cmds
 import maya.mel as mel
+import maya.api.OpenMaya as OM
+import sxlib.profiler as profiler
 import sxglobals
 
 
 class Core(object):
     def __init__(self):
+        # Scene events are merged into one deferred refresh,
+        # refreshes of older generations are dropped
+        self.generation = 0
+        self.refreshPending = False
+        self.rebuildPending = False
+        self.pendingEvents = 0
+        self.refreshStats = {
+            'events': 0, 'refreshes': 0, 'merged': 0, 'stale': 0}
+        # Lights, sets and display layers are created once per
+        # scene, deleting any of them runs the bootstrap again
+        self.sceneReady = False
+        self.callbackIDs = []
         return None
 
     def __del__(self):
@@ -47,7 +61,7 @@ class Core(object):
         maya.cmds.workspaceControl(
             sxglobals.dockID,
             label='SX Tools',
-            uiScript=('sxtools.sxglobals.core.updateSXTools()'),
+            uiScript=('sxtools.sxglobals.core.requestUpdate(True)'),
             retain=False,
             floating=False,
             dockToControl=('Outliner', 'right'),
@@ -63,31 +77,45 @@ class Core(object):
                 parent=sxglobals.dockID,
                 event=[
                     'SelectionChanged',
-                    'sxtools.sxglobals.core.updateSXTools()'])
+                    'sxtools.sxglobals.core.requestUpdate()'])
             self.job2ID = maya.cmds.scriptJob(
                 parent=sxglobals.dockID,
                 event=[
                     'Undo',
-                    'sxtools.sxglobals.core.updateSXTools()'])
+                    'sxtools.sxglobals.core.requestUpdate()'])
             self.job3ID = maya.cmds.scriptJob(
                 parent=sxglobals.dockID,
                 event=[
                     'NameChanged',
-                    'sxtools.sxglobals.core.updateSXTools()'])
+                    'sxtools.sxglobals.core.requestUpdate()'])
             self.job4ID = maya.cmds.scriptJob(
                 parent=sxglobals.dockID,
                 event=[
                     'SceneOpened',
                     'sxtools.sxglobals.settings.frames["setupCollapse"]=False\n'
                     'sxtools.sxglobals.settings.setPreferences()\n'
-                    'sxtools.sxglobals.core.updateSXTools()'])
+                    'sxtools.sxglobals.topology.clear()\n'
+                    'sxtools.sxglobals.compositor.clear()\n'
+                    'sxtools.sxglobals.primvars.clear()\n'
+                    'sxtools.sxglobals.layerstats.clear()\n'
+                    'sxtools.sxglobals.selection.clear()\n'
+                    'sxtools.sxglobals.validation.clear()\n'
+                    'sxtools.sxglobals.core.resetScene()\n'
+                    'sxtools.sxglobals.core.requestUpdate(True)'])
             self.job5ID = maya.cmds.scriptJob(
                 parent=sxglobals.dockID,
                 event=[
                     'NewSceneOpened',
                     'sxtools.sxglobals.settings.frames["setupCollapse"]=False\n'
                     'sxtools.sxglobals.settings.setPreferences()\n'
-                    'sxtools.sxglobals.core.updateSXTools()'])
+                    'sxtools.sxglobals.topology.clear()\n'
+                    'sxtools.sxglobals.compositor.clear()\n'
+                    'sxtools.sxglobals.primvars.clear()\n'
+                    'sxtools.sxglobals.layerstats.clear()\n'
+                    'sxtools.sxglobals.selection.clear()\n'
+                    'sxtools.sxglobals.validation.clear()\n'
+                    'sxtools.sxglobals.core.resetScene()\n'
+                    'sxtools.sxglobals.core.requestUpdate(True)'])
         maya.cmds.scriptJob(
             runOnce=True,
             uiDeleted=[
@@ -104,17 +132,60 @@ class Core(object):
         mel.eval('DisplayLight;')
         maya.cmds.modelEditor('modelPanel4', edit=True, udm=False)
 
+    # Called by the scene event scriptJobs. Bursts of events,
+    # such as a marquee selection or repeated undos, only
+    # schedule one refresh that runs when Maya is idle.
+    # Unless a rebuild is requested, the refresh keeps the
+    # existing layer tools UI if its layout still fits.
+    def requestUpdate(self, rebuild=False):
+        self.refreshStats['events'] += 1
+        self.pendingEvents += 1
+        self.rebuildPending = self.rebuildPending or rebuild
+        if self.refreshPending:
+            return
+
+        self.refreshPending = True
+        maya.cmds.evalDeferred(
+            "if hasattr(sxtools.sxglobals, 'core'):\n"
+            "    sxtools.sxglobals.core.deferredUpdate(" +
+            str(self.generation) + ")",
+            lowestPriority=True)
+
+    def deferredUpdate(self, generation):
+        # A direct update has already refreshed the tool
+        if generation != self.generation:
+            self.refreshStats['stale'] += 1
+            return
+
+        # One of the pending events gets this refresh,
+        # the rest are counted as merged
+        self.pendingEvents -= 1
+        self.updateSXTools(self.rebuildPending)
+
+    def printRefreshStats(self):
+        print(
+            'SX Tools: ' + str(self.refreshStats['events']) +
+            ' scene events, ' + str(self.refreshStats['refreshes']) +
+            ' refreshes, ' + str(self.refreshStats['merged']) +
+            ' events merged, ' + str(self.refreshStats['stale']) +
+            ' stale refreshes dropped')
+
     # Avoids UI refresh from being included in the undo list
-    # Called by the "jobID" scriptJob whenever the user clicks a selection.
-    def updateSXTools(self):
-        # startTimeOcc = maya.cmds.timerX()
+    # Tools call this directly after edits, which also
+    # supersedes any refresh that is still scheduled.
+    @profiler.profile('core.updateSXTools')
+    def updateSXTools(self, rebuild=True):
+        self.generation += 1
+        self.refreshStats['merged'] += self.pendingEvents
+        self.refreshStats['refreshes'] += 1
+        self.refreshPending = False
+        self.rebuildPending = False
+        self.pendingEvents = 0
         maya.cmds.undoInfo(stateWithoutFlush=False)
         self.selectionManager()
-        self.refreshSXTools()
+        self.refreshSXTools(rebuild)
         self.verifySceneState()
         maya.cmds.undoInfo(stateWithoutFlush=True)
-        # totalTime = maya.cmds.timerX(startTime=startTimeOcc)
-        # print('Update ' + str(totalTime))
 
     def exitSXTools(self):
         scriptJobs = maya.cmds.scriptJob(listJobs=True)
@@ -124,6 +195,9 @@ class Core(object):
                 maya.cmds.scriptJob(kill=index)
         if sxglobals.settings:
             del sxglobals.settings
+        if sxglobals.profiler:
+            sxglobals.profiler.clear()
+            del sxglobals.profiler
         if sxglobals.setup:
             del sxglobals.setup
         if sxglobals.export:
@@ -132,9 +206,30 @@ class Core(object):
             del sxglobals.tools
         if sxglobals.layers:
             del sxglobals.layers
+        if sxglobals.compositor:
+            del sxglobals.compositor
+        if sxglobals.topology:
+            sxglobals.topology.clear()
+            del sxglobals.topology
+        if sxglobals.primvars:
+            sxglobals.primvars.clear()
+            del sxglobals.primvars
+        if sxglobals.layerstats:
+            sxglobals.layerstats.clear()
+            del sxglobals.layerstats
+        if sxglobals.library:
+            sxglobals.library.clear()
+            del sxglobals.library
+        if sxglobals.selection:
+            sxglobals.selection.clear()
+            del sxglobals.selection
+        if sxglobals.validation:
+            sxglobals.validation.clear()
+            del sxglobals.validation
         if sxglobals.ui:
             del sxglobals.ui
         if sxglobals.core:
+            sxglobals.core.resetScene()
             del sxglobals.core
 
     def resetSXTools(self):
@@ -146,58 +241,22 @@ class Core(object):
 
     # The user can have various different types of objects selected.
     # The selections are filtered for the tool.
+    # Tools read the selection from the settings arrays,
+    # which are copied from one selection snapshot
+    @profiler.profile('core.selectionManager')
     def selectionManager(self):
-        sxglobals.settings.selectionArray = maya.cmds.ls(sl=True)
-        sxglobals.settings.shapeArray = maya.cmds.listRelatives(
-            sxglobals.settings.selectionArray,
-            type='mesh',
-            allDescendents=True,
-            fullPath=True)
-        sxglobals.settings.objectArray = list(set(maya.cmds.ls(
-            maya.cmds.listRelatives(
-                sxglobals.settings.shapeArray,
-                parent=True,
-                fullPath=True))))
-        sxglobals.settings.componentArray = maya.cmds.filterExpand(
-            sxglobals.settings.selectionArray, sm=(31, 32, 34, 70))
-
-        # If only shape nodes are selected
-        onlyShapes = True
-        for selection in sxglobals.settings.selectionArray:
-            if 'Shape' not in str(selection):
-                onlyShapes = False
-        if onlyShapes:
-            sxglobals.settings.shapeArray = sxglobals.settings.selectionArray
-            sxglobals.settings.objectArray = maya.cmds.listRelatives(
-                sxglobals.settings.shapeArray, parent=True, fullPath=True)
-
-        # Maintain correct object selection
-        # even if only components are selected
-        if ((sxglobals.settings.shapeArray is None) and
-           (sxglobals.settings.componentArray is not None)):
-            sxglobals.settings.shapeArray = maya.cmds.ls(
-                sxglobals.settings.selectionArray,
-                o=True, dag=True, type='mesh', long=True)
-            sxglobals.settings.objectArray = maya.cmds.listRelatives(
-                sxglobals.settings.shapeArray, parent=True, fullPath=True)
-
-        # The case when the user selects a component set
-        if ((len(maya.cmds.ls(sl=True, type='objectSet')) > 0) and
-           (sxglobals.settings.componentArray is not None)):
-            del sxglobals.settings.componentArray[:]
-
-        if sxglobals.settings.shapeArray is None:
-            sxglobals.settings.shapeArray = []
-
-        if sxglobals.settings.objectArray is None:
-            sxglobals.settings.objectArray = []
-
-        if sxglobals.settings.componentArray is None:
-            sxglobals.settings.componentArray = []
-
-        sxglobals.tools.checkHistory(sxglobals.settings.objectArray)
-
-    def verifySceneState(self):
+        snapshot = sxglobals.selection.update()
+        sxglobals.settings.selectionArray = list(snapshot.selection)
+        sxglobals.settings.shapeArray = list(snapshot.shapes)
+        sxglobals.settings.objectArray = list(snapshot.objects)
+        sxglobals.settings.componentArray = list(snapshot.components)
+        sxglobals.settings.multiShapeArray = list(snapshot.multiShapeShapes)
+        sxglobals.ui.history = snapshot.history
+        sxglobals.ui.multiShapes = snapshot.multiShapes
+
+    # Creates the lights, crease and subMesh sets and
+    # display layers the tools rely on
+    def bootstrapScene(self):
         x1 = sxglobals.setup.createDefaultLights()
         x2 = sxglobals.setup.createCreaseSets()
         x3 = sxglobals.setup.createSubMeshSets()
@@ -214,38 +273,136 @@ class Core(object):
         # maya.cmds.outlinerEditor('outlinerPanel1', edit=True, refresh=True)
         # maya.cmds.outlinerEditor('outlinerPanel1', edit=True, filter='')
 
-        # Make sure selected things are using the correct material
-        if maya.cmds.getAttr('assetsLayer.visibility') and len(sxglobals.settings.shapeArray) > 0:
-            maya.cmds.colorManagementPrefs(edit=True, cmEnabled=0)
-            maya.cmds.sets(
-                sxglobals.settings.shapeArray, e=True, forceElement='SXShaderSG')
-
-            # Vertex color display with the custom
-            # shader requires textured mode
-            maya.cmds.modelEditor(
-                'modelPanel4',
-                edit=True,
-                useDefaultMaterial=False,
-                displayLights='all',
-                lights=True,
-                shadows=False,
-                displayTextures=True,
-                vtn='Raw')
+        if len(self.callbackIDs) == 0:
+            for nodeType in ('light', 'objectSet', 'partition', 'displayLayer'):
+                self.callbackIDs.append(
+                    OM.MDGMessage.addNodeRemovedCallback(
+                        self.sceneNodeRemoved, nodeType))
+        self.sceneReady = True
+
+    def sceneNodeRemoved(self, node, *args):
+        if node.hasFn(OM.MFn.kLight):
+            self.sceneReady = False
+            return
+        name = OM.MFnDependencyNode(node).name()
+        if (name.startswith('sxCrease') or
+           name.startswith('sxSubMesh') or
+           (name in ('assetsLayer', 'skinMeshLayer', 'exportsLayer'))):
+            self.sceneReady = False
+
+    def resetScene(self):
+        self.sceneReady = False
+        for callbackID in self.callbackIDs:
+            try:
+                OM.MMessage.removeCallback(callbackID)
+            except RuntimeError:
+                pass
+        self.callbackIDs = []
+
+    @profiler.profile('core.verifySceneState')
+    def verifySceneState(self):
+        if not self.sceneReady:
+            self.bootstrapScene()
 
-        maya.cmds.setAttr('hardwareRenderingGlobals.ssaoEnable', 0)
+        # Make sure selected things are using the correct material,
+        # shapes already in SXShaderSG are left untouched
+        if maya.cmds.getAttr('assetsLayer.visibility') and len(sxglobals.settings.shapeArray) > 0:
+            newShapes = [
+                shape for shape in sxglobals.settings.shapeArray
+                if not maya.cmds.sets(shape, isMember='SXShaderSG')]
+            if len(newShapes) > 0:
+                maya.cmds.colorManagementPrefs(edit=True, cmEnabled=0)
+                maya.cmds.sets(
+                    newShapes, e=True, forceElement='SXShaderSG')
+
+                # Vertex color display with the custom
+                # shader requires textured mode
+                maya.cmds.modelEditor(
+                    'modelPanel4',
+                    edit=True,
+                    useDefaultMaterial=False,
+                    displayLights='all',
+                    lights=True,
+                    shadows=False,
+                    displayTextures=True,
+                    vtn='Raw')
+
+        if maya.cmds.getAttr('hardwareRenderingGlobals.ssaoEnable'):
+            maya.cmds.setAttr('hardwareRenderingGlobals.ssaoEnable', 0)
 
         # Adjust viewport crease levels based on
         # the subdivision level of the selected object
         if sxglobals.settings.tools['matchSubdivision']:
             if maya.cmds.getAttr(sxglobals.settings.objectArray[0] + '.subdivisionLevel') > 0:
                 sdl = maya.cmds.getAttr(sxglobals.settings.objectArray[0] + '.subdivisionLevel')
-                maya.cmds.setAttr('sxCrease1.creaseLevel', sdl * 0.25)
-                maya.cmds.setAttr('sxCrease2.creaseLevel', sdl * 0.5)
-                maya.cmds.setAttr('sxCrease3.creaseLevel', sdl * 0.75)
-                maya.cmds.setAttr('sxCrease4.creaseLevel', 10)
+                creaseLevels = (sdl * 0.25, sdl * 0.5, sdl * 0.75, 10)
+                for i, creaseLevel in enumerate(creaseLevels):
+                    setName = 'sxCrease' + str(i + 1)
+                    if maya.cmds.getAttr(setName + '.creaseLevel') != creaseLevel:
+                        maya.cmds.setAttr(setName + '.creaseLevel', creaseLevel)
+
+    # Returns the view matching the current selection
+    def getViewMode(self):
+        # If nothing selected, or defaults not set, construct setup view
+        if ((len(sxglobals.settings.shapeArray) == 0) or
+           not (maya.cmds.optionVar(exists='SXToolsSettingsFile')) or
+           ('LayerData' not in sxglobals.settings.project)):
+            return 'setup'
+        elif sxglobals.export.checkExported(sxglobals.settings.objectArray):
+            return 'exported'
+        elif sxglobals.tools.checkSkinMesh(sxglobals.settings.objectArray):
+            return 'skinMesh'
+
+        layerState = sxglobals.layers.verifyObjectLayers(sxglobals.settings.shapeArray)[0]
+        if layerState == 1:
+            return 'emptyObjects'
+        elif layerState == 2:
+            return 'mismatchingObjects'
+        return 'layers'
+
+    # Only edits the display layers if the selected objects
+    # are not already shown in the current assetsLayer
+    def showAssetsLayer(self):
+        members = set(maya.cmds.editDisplayLayerMembers(
+            'assetsLayer', query=True, fullNames=True) or [])
+        objects = maya.cmds.ls(sxglobals.settings.objectArray, long=True)
+        if ((not set(objects).issubset(members)) or
+           maya.cmds.getAttr('exportsLayer.visibility') or
+           maya.cmds.getAttr('skinMeshLayer.visibility') or
+           not maya.cmds.getAttr('assetsLayer.visibility') or
+           (maya.cmds.editDisplayLayerGlobals(query=True, cdl=True) != 'assetsLayer')):
+            maya.cmds.editDisplayLayerMembers(
+                'assetsLayer',
+                sxglobals.settings.objectArray)
+            maya.cmds.setAttr('exportsLayer.visibility', 0)
+            maya.cmds.setAttr('skinMeshLayer.visibility', 0)
+            maya.cmds.setAttr('assetsLayer.visibility', 1)
+            maya.cmds.editDisplayLayerGlobals(cdl='assetsLayer')
+            # hacky hack to refresh the layer editor
+            maya.cmds.delete(maya.cmds.createDisplayLayer(empty=True))
+
+    # Re-draws the UI dynamically for different selection types.
+    # With rebuild disabled, selection changes between layered
+    # objects keep the existing layer tools UI and only
+    # update the values shown in its controls
+    @profiler.profile('core.refreshSXTools')
+    def refreshSXTools(self, rebuild=True):
+        viewMode = self.getViewMode()
+
+        if ((not rebuild) and
+           (viewMode == 'layers') and
+           (sxglobals.ui.layoutKey == sxglobals.ui.getLayoutKey()) and
+           maya.cmds.layout('canvas', exists=True)):
+            sxglobals.settings.tools['compositeEnabled'] = True
+            self.showAssetsLayer()
+            sxglobals.ui.updateLayerToolsUI()
+            sxglobals.layers.refreshLayerList()
+            sxglobals.layers.compositeLayers()
+            maya.cmds.setFocus('MayaWindow')
+            return
+
+        sxglobals.ui.layoutKey = None
 
-    # Re-draws the UI dynamically for different selection types
-    def refreshSXTools(self):
         # base canvases for all SX Tools UI
         if maya.cmds.layout('canvasPanes', exists=True):
             maya.cmds.deleteUI('canvasPanes')
@@ -272,15 +429,12 @@ class Core(object):
             verticalScrollBarThickness=16,
             verticalScrollBarAlwaysVisible=False)
 
-        # If nothing selected, or defaults not set, construct setup view
-        if ((len(sxglobals.settings.shapeArray) == 0) or
-           not (maya.cmds.optionVar(exists='SXToolsSettingsFile')) or
-           ('LayerData' not in sxglobals.settings.project)):
+        if viewMode == 'setup':
             sxglobals.settings.tools['compositeEnabled'] = False
             sxglobals.ui.setupProjectUI()
 
         # If exported objects selected, construct message
-        elif sxglobals.export.checkExported(sxglobals.settings.objectArray):
+        elif viewMode == 'exported':
             sxglobals.settings.tools['compositeEnabled'] = False
             maya.cmds.setAttr('exportsLayer.visibility', 1)
             maya.cmds.setAttr('skinMeshLayer.visibility', 0)
@@ -303,7 +457,7 @@ class Core(object):
             sxglobals.ui.exportObjectsUI()
 
         # If skinned meshes are selected, construct message
-        elif sxglobals.tools.checkSkinMesh(sxglobals.settings.objectArray):
+        elif viewMode == 'skinMesh':
             sxglobals.settings.tools['compositeEnabled'] = False
             maya.cmds.setAttr('exportsLayer.visibility', 0)
             maya.cmds.setAttr('skinMeshLayer.visibility', 1)
@@ -314,12 +468,12 @@ class Core(object):
             sxglobals.ui.skinMeshUI()
 
         # If objects have empty color sets, construct error message
-        elif sxglobals.layers.verifyObjectLayers(sxglobals.settings.shapeArray)[0] == 1:
+        elif viewMode == 'emptyObjects':
             sxglobals.settings.tools['compositeEnabled'] = False
             sxglobals.ui.emptyObjectsUI()
 
         # If objects have mismatching color sets, construct error message
-        elif sxglobals.layers.verifyObjectLayers(sxglobals.settings.shapeArray)[0] == 2:
+        elif viewMode == 'mismatchingObjects':
             sxglobals.settings.tools['compositeEnabled'] = False
             sxglobals.ui.mismatchingObjectsUI()
 
@@ -342,15 +496,7 @@ class Core(object):
                 verticalScrollBarThickness=16,
                 verticalScrollBarAlwaysVisible=False)
 
-            maya.cmds.editDisplayLayerMembers(
-                'assetsLayer',
-                sxglobals.settings.objectArray)
-            maya.cmds.setAttr('exportsLayer.visibility', 0)
-            maya.cmds.setAttr('skinMeshLayer.visibility', 0)
-            maya.cmds.setAttr('assetsLayer.visibility', 1)
-            maya.cmds.editDisplayLayerGlobals(cdl='assetsLayer')
-            # hacky hack to refresh the layer editor
-            maya.cmds.delete(maya.cmds.createDisplayLayer(empty=True))
+            self.showAssetsLayer()
 
             if sxglobals.ui.history:
                 sxglobals.ui.historyUI()
@@ -367,7 +513,10 @@ class Core(object):
             sxglobals.ui.assignCreaseToolUI()
             sxglobals.ui.createSkinMeshUI()
             sxglobals.ui.exportFlagsUI()
+            if sxglobals.settings.tools['profilerEnable']:
+                sxglobals.ui.profilerUI()
             sxglobals.ui.exportButtonUI()
+            sxglobals.ui.layoutKey = sxglobals.ui.getLayoutKey()
 
             sxglobals.layers.refreshLayerList()
             sxglobals.layers.compositeLayers()
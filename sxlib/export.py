@@ -22,6 +22,7 @@
 import maya.cmds
 import maya.mel as mel
 import maya.api.OpenMaya as OM
+import sxlib.profiler as profiler
 import sxglobals
 
 
@@ -32,6 +33,7 @@ class Export(object):
     def __del__(self):
         print('SX Tools: Exiting export')
 
+    @profiler.profile('export.initUVs')
     def initUVs(self, selected, UVSetName):
         maya.cmds.polyUVSet(selected, create=True, uvSet=UVSetName)
         maya.cmds.polyUVSet(selected, currentUVSet=True, uvSet=UVSetName)
@@ -51,6 +53,7 @@ class Export(object):
     # 1) Store edge loop information from crease sets into a color set
     # 2) Bevel edge loops per crease set, fixing the broken edge loops
     # TODO: Handle continous edges that are not a loop
+    @profiler.profile('export.creaseBevels')
     def creaseBevels(self, shape):
         maya.cmds.polyColorSet(
             shape,
@@ -187,6 +190,7 @@ class Export(object):
             delete=True,
             colorSet='creases')
 
+    @profiler.profile('export.flattenLayers')
     def flattenLayers(self, selected, numLayers):
         if numLayers > 1:
             for i in range(1, numLayers):
@@ -194,6 +198,7 @@ class Export(object):
                 sxglobals.layers.mergeLayers(
                     [selected, ], sourceLayer, 'layer1', True)
 
+    @profiler.profile('export.dataToUV')
     def dataToUV(self,
                  shape,
                  uSource,
@@ -282,6 +287,7 @@ class Export(object):
         MFnMesh.setUVs(uArray, vArray, targetUVSet)
         MFnMesh.assignUVs(uvIdArray[0], uvIdArray[1], uvSet=targetUVSet)
 
+    @profiler.profile('export.dataToUVChannel')
     def dataToUVChannel(self,
                  shape,
                  sourceColorSet,
@@ -366,6 +372,7 @@ class Export(object):
         MFnMesh.setUVs(uArray, vArray, uvSetName)
         MFnMesh.assignUVs(uvIdArray[0], uvIdArray[1], uvSet=uvSetName)
 
+    @profiler.profile('export.overlayToUV')
     def overlayToUV(self, selected, layers, targetUVSetList):
         for idx, layer in enumerate(layers):
             selectionList = OM.MSelectionList()
@@ -419,10 +426,8 @@ class Export(object):
     # 3) Call the mesh processing functions
     # 4) Delete history on the processed meshes.
     # 5) Treat deforming meshes as a special case
+    @profiler.profile('export.processObjects')
     def processObjects(self, selectionArray):
-        # Timer for evaluating script performance
-        startTime0 = maya.cmds.timerX()
-
         sourceArray = []
         alphaOverlayArray = [None, None]
         overlay = []
@@ -826,8 +831,6 @@ class Export(object):
                         maya.cmds.select(hardEdges, r=True, ne=True)
                         maya.cmds.polySoftEdge(a=0, ch=0)
 
-        totalTime = maya.cmds.timerX(startTime=startTime0)
-        print('SX Tools: Total time ' + str(totalTime))
         maya.cmds.select('_staticExports', r=True)
         # sxglobals.core.selectionManager()
         maya.cmds.editDisplayLayerMembers(
@@ -837,6 +840,7 @@ class Export(object):
     # Writing FBX files to a user-defined folder
     # includes finding the unique file using their fullpath names,
     # then stripping the path to create a clean name for the file.
+    @profiler.profile('export.exportObjects')
     def exportObjects(self, exportPath):
         exportArray = maya.cmds.listRelatives(
             '_staticExports', children=True, fullPath=True)
@@ -919,6 +923,7 @@ class Export(object):
     # After a selection of meshes has been processed for export,
     # the user has a button in the tool UI
     # that allows an isolated view of the results.
+    @profiler.profile('export.viewExported')
     def viewExported(self):
         exportObjs = ['_staticExports', ]
         rootObjs = maya.cmds.ls(assemblies=True)
@@ -957,6 +962,7 @@ class Export(object):
         else:
             return False
 
+    @profiler.profile('export.viewExportedMaterial')
     def viewExportedMaterial(self):
         if maya.cmds.getAttr(str(sxglobals.settings.objectArray[0]) + '.subMeshes'):
             buttonState1 = False
@@ -1222,6 +1228,7 @@ class Export(object):
                 transforms.append(parent[0])
         return transforms
 
+    @profiler.profile('export.stripPrimVars')
     def stripPrimVars(self, objects):
         attrList = maya.cmds.listAttr(objects[0], ud=True)
         for object in objects:
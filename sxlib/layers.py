@@ -6,6 +6,8 @@
 
 import maya.cmds
 import maya.api.OpenMaya as OM
+import sxlib.blendmodes as blendmodes
+import sxlib.profiler as profiler
 import sxglobals
 
 
@@ -19,166 +21,21 @@ class LayerManagement(object):
     # With hybrid vertex color compositing enabled
     # the 'composite' colorSet will be refreshed
     # after every user action
-    def compositeLayers(self):
-        # startTimeOcc = maya.cmds.timerX()
+    # Tools that only edit some layers pass them as dirtyLayers,
+    # the rest of the layer stack is then re-used from the last composite.
+    # Component edits can also pass a dict of edited face vertex
+    # indices per shape to limit compositing to those face vertices.
+    @profiler.profile('layers.compositeLayers')
+    def compositeLayers(self, dirtyLayers=None, components=None):
         if sxglobals.settings.tools['compositeEnabled']:
-            numLayers = sxglobals.settings.project['LayerCount']
-
             maya.cmds.polyColorSet(
                 sxglobals.settings.shapeArray, currentColorSet=True, colorSet='composite')
 
-            for selected in sxglobals.settings.shapeArray:
-                selectionList = OM.MSelectionList()
-                selectionList.add(selected)
-                nodeDagPath = OM.MDagPath()
-                nodeDagPath = selectionList.getDagPath(0)
-                MFnMesh = OM.MFnMesh(nodeDagPath)
-
-                sourceColorArray = OM.MColorArray()
-                targetColorArray = OM.MColorArray()
-                targetColorArray = MFnMesh.getFaceVertexColors(colorSet='layer1')
-
-                faceIds = OM.MIntArray()
-                vtxIds = OM.MIntArray()
-
-                lenSel = len(targetColorArray)
-
-                faceIds.setLength(lenSel)
-                vtxIds.setLength(lenSel)
-
-                # generate faceID and vertexID arrays
-                fvIt = OM.MItMeshFaceVertex(nodeDagPath)
-                k = 0
-                while not fvIt.isDone():
-                    faceIds[k] = fvIt.faceId()
-                    vtxIds[k] = fvIt.vertexId()
-                    k += 1
-                    fvIt.next()
-
-                sel = str(selected)
-                shading = int(maya.cmds.getAttr(sel + '.shadingMode'))
-
-                # Set layer1 to black if hidden
-                visAttr = '.layer1Visibility'
-                vis = bool(maya.cmds.getAttr(sel + visAttr))
-
-                if not vis:
-                    fvIt = OM.MItMeshFaceVertex(nodeDagPath)
-                    k = 0
-                    while not fvIt.isDone():
-                        targetColorArray[k].r = 0.0
-                        targetColorArray[k].g = 0.0
-                        targetColorArray[k].b = 0.0
-                        targetColorArray[k].a = 1.0
-                        k += 1
-                        fvIt.next()
-
-                # accumulate targetColorArray through the remaining layers
-                if shading == 0:
-                    if numLayers > 1:
-                        for i in range(2, numLayers+1):
-                            sourceLayer = 'layer' + str(i)
-
-                            modeAttr = '.' + sourceLayer + 'BlendMode'
-                            mode = int(maya.cmds.getAttr(sel + modeAttr))
-
-                            visAttr = '.' + sourceLayer + 'Visibility'
-                            vis = bool(maya.cmds.getAttr(sel + visAttr))
-                            sourceColorArray = MFnMesh.getFaceVertexColors(
-                                colorSet=sourceLayer)
-
-                            fvIt = OM.MItMeshFaceVertex(nodeDagPath)
-
-                            if not vis:
-                                continue
-
-                            elif mode == 0:
-                                k = 0
-                                while not fvIt.isDone():
-                                    targetColorArray[k].r = (
-                                        sourceColorArray[k].r * sourceColorArray[k].a +
-                                        targetColorArray[k].r * (1 - sourceColorArray[k].a))
-                                    targetColorArray[k].g = (
-                                        sourceColorArray[k].g * sourceColorArray[k].a +
-                                        targetColorArray[k].g * (1 - sourceColorArray[k].a))
-                                    targetColorArray[k].b = (
-                                        sourceColorArray[k].b * sourceColorArray[k].a +
-                                        targetColorArray[k].b * (1 - sourceColorArray[k].a))
-                                    #targetColorArray[k].a = 1.0
-                                    k += 1
-                                    fvIt.next()
-
-                            elif mode == 1:
-                                k = 0
-                                while not fvIt.isDone():
-                                    targetColorArray[k].r += sourceColorArray[
-                                        k].r * sourceColorArray[k].a
-                                    targetColorArray[k].g += sourceColorArray[
-                                        k].g * sourceColorArray[k].a
-                                    targetColorArray[k].b += sourceColorArray[
-                                        k].b * sourceColorArray[k].a
-                                    #targetColorArray[k].a = 1.0
-                                    k += 1
-                                    fvIt.next()
-
-                            elif mode == 2:
-                                # layer2 lerp with white using (1-alpha), multiply with layer1
-                                k = 0
-                                while not fvIt.isDone():
-                                    sourceColorArray[k].r = (
-                                        (sourceColorArray[k].r * sourceColorArray[k].a) +
-                                        (1.0 * (1 - sourceColorArray[k].a)))
-                                    sourceColorArray[k].g = (
-                                        (sourceColorArray[k].g * sourceColorArray[k].a) +
-                                        (1.0 * (1 - sourceColorArray[k].a)))
-                                    sourceColorArray[k].b = (
-                                        (sourceColorArray[k].b * sourceColorArray[k].a) +
-                                        (1.0 * (1 - sourceColorArray[k].a)))
-
-                                    targetColorArray[k].r = sourceColorArray[
-                                        k].r * targetColorArray[k].r
-                                    targetColorArray[k].g = sourceColorArray[
-                                        k].g * targetColorArray[k].g
-                                    targetColorArray[k].b = sourceColorArray[
-                                        k].b * targetColorArray[k].b
-                                    k += 1
-                                    fvIt.next()
-                            else:
-                                print('SX Tools Error: Invalid blend mode')
-                                return
-
-                elif shading == 1:
-                    targetColorArray = MFnMesh.getFaceVertexColors(colorSet=sxglobals.settings.tools['selectedLayer'])
-                    fvIt = OM.MItMeshFaceVertex(nodeDagPath)
-                    k = 0
-                    while not fvIt.isDone():
-                        if targetColorArray[k].a == 0.0:
-                            targetColorArray[k].r = 0.0
-                            targetColorArray[k].g = 0.0
-                            targetColorArray[k].b = 0.0
-                        k += 1
-                        fvIt.next()
-
-                elif shading == 2:
-                    targetColorArray = MFnMesh.getFaceVertexColors(colorSet=sxglobals.settings.tools['selectedLayer'])
-                    fvIt = OM.MItMeshFaceVertex(nodeDagPath)
-                    k = 0
-                    while not fvIt.isDone():
-                        targetColorArray[k].r = targetColorArray[k].a
-                        targetColorArray[k].g = targetColorArray[k].a
-                        targetColorArray[k].b = targetColorArray[k].a
-                        targetColorArray[k].a = 1.0
-                        k += 1
-                        fvIt.next()
-
-                MFnMesh.setFaceVertexColors(targetColorArray, faceIds, vtxIds)
-
-        # totalTime = maya.cmds.timerX(startTime=startTimeOcc)
-        # print('SX Tools: Layer compositing duration ' + str(totalTime))
+            sxglobals.compositor.compositeShapes(
+                sxglobals.settings.shapeArray, dirtyLayers, components)
 
+    @profiler.profile('layers.mergeLayers')
     def mergeLayers(self, objects, sourceLayer, targetLayer, up):
-        # startTimeOcc = maya.cmds.timerX()
-
         attrA = '.' + str(sourceLayer) + 'BlendMode'
         attrB = '.' + str(targetLayer) + 'BlendMode'
         color = sxglobals.settings.project['LayerData'][sourceLayer][1]
@@ -190,7 +47,7 @@ class LayerManagement(object):
         fillColor.a = color[3]
 
         for obj in objects:
-            mode = int(maya.cmds.getAttr(obj + attrA))
+            mode = int(sxglobals.primvars.getAttr(obj, attrA[1:]))
 
             selectionList = OM.MSelectionList()
             selectionList.add(obj)
@@ -198,101 +55,21 @@ class LayerManagement(object):
             nodeDagPath = selectionList.getDagPath(0)
             MFnMesh = OM.MFnMesh(nodeDagPath)
 
-            sourceColorArray = OM.MColorArray()
-            targetColorArray = OM.MColorArray()
-            fillColorArray = OM.MColorArray()
-            sourceColorArray = MFnMesh.getFaceVertexColors(
-                colorSet=sourceLayer)
-            targetColorArray = MFnMesh.getFaceVertexColors(
-                colorSet=targetLayer)
-            fillColorArray = MFnMesh.getFaceVertexColors(
-                colorSet = sourceLayer)
-            faceIds = OM.MIntArray()
-            vtxIds = OM.MIntArray()
-
-            lenSel = len(sourceColorArray)
-
-            faceIds.setLength(lenSel)
-            vtxIds.setLength(lenSel)
-
-            fvIt = OM.MItMeshFaceVertex(nodeDagPath)
-            k = 0
-            while not fvIt.isDone():
-                faceIds[k] = fvIt.faceId()
-                vtxIds[k] = fvIt.vertexId()
-                fillColorArray[k] = fillColor
-                k += 1
-                fvIt.next()
-
-            fvIt = OM.MItMeshFaceVertex(nodeDagPath)
-
-            # alpha blend
-            if mode == 0:
-                k = 0
-                while not fvIt.isDone():
-                    targetColorArray[k].r = (
-                        sourceColorArray[k].r * sourceColorArray[k].a +
-                        targetColorArray[k].r * (1 - sourceColorArray[k].a))
-                    targetColorArray[k].g = (
-                        sourceColorArray[k].g * sourceColorArray[k].a +
-                        targetColorArray[k].g * (1 - sourceColorArray[k].a))
-                    targetColorArray[k].b = (
-                        sourceColorArray[k].b * sourceColorArray[k].a +
-                        targetColorArray[k].b * (1 - sourceColorArray[k].a))
-                    targetColorArray[k].a += sourceColorArray[k].a
-                    if targetColorArray[k].a > 1.0:
-                       targetColorArray[k].a = 1.0
-                    k += 1
-                    fvIt.next()
-
-            # additive
-            elif mode == 1:
-                k = 0
-                while not fvIt.isDone():
-                    faceIds[k] = fvIt.faceId()
-                    vtxIds[k] = fvIt.vertexId()
-
-                    targetColorArray[k].r += sourceColorArray[
-                        k].r * sourceColorArray[k].a
-                    targetColorArray[k].g += sourceColorArray[
-                        k].g * sourceColorArray[k].a
-                    targetColorArray[k].b += sourceColorArray[
-                        k].b * sourceColorArray[k].a
-                    targetColorArray[k].a += sourceColorArray[k].a
-                    if targetColorArray[k].a > 1.0:
-                       targetColorArray[k].a = 1.0
-                    k += 1
-                    fvIt.next()
-
-            # multiply
-            elif mode == 2:
-                # layer2 lerp with white using (1-alpha), multiply with layer1
-                k = 0
-                while not fvIt.isDone():
-                    faceIds[k] = fvIt.faceId()
-                    vtxIds[k] = fvIt.vertexId()
-
-                    sourceColorArray[k].r = (
-                        (sourceColorArray[k].r * sourceColorArray[k].a) +
-                        (1.0 * (1 - sourceColorArray[k].a)))
-                    sourceColorArray[k].g = (
-                        (sourceColorArray[k].g * sourceColorArray[k].a) +
-                        (1.0 * (1 - sourceColorArray[k].a)))
-                    sourceColorArray[k].b = (
-                        (sourceColorArray[k].b * sourceColorArray[k].a) +
-                        (1.0 * (1 - sourceColorArray[k].a)))
-
-                    targetColorArray[k].r = sourceColorArray[
-                        k].r * targetColorArray[k].r
-                    targetColorArray[k].g = sourceColorArray[
-                        k].g * targetColorArray[k].g
-                    targetColorArray[k].b = sourceColorArray[
-                        k].b * targetColorArray[k].b
-                    k += 1
-                    fvIt.next()
-            else:
+            sourceColors = sxglobals.compositor.getColorArray(
+                MFnMesh, sourceLayer)
+            targetColors = sxglobals.compositor.getColorArray(
+                MFnMesh, targetLayer)
+            topology = sxglobals.topology.getTopology(obj, MFnMesh)
+            faceIds = topology['faceIdArray']
+            vtxIds = topology['vtxIdArray']
+
+            fillColorArray = OM.MColorArray(len(targetColors), fillColor)
+
+            if not blendmodes.blendLayer(
+                    targetColors, sourceColors, mode, mergeAlpha=True):
                 print('SX Tools Error: Invalid blend mode')
                 return
+            targetColorArray = sxglobals.compositor.toColorArray(targetColors)
 
             if up:
                 maya.cmds.polyColorSet(
@@ -312,14 +89,11 @@ class LayerManagement(object):
             maya.cmds.setAttr(str(obj) + attrA, 0)
             maya.cmds.setAttr(str(obj) + attrB, 0)
 
-        # totalTime = maya.cmds.timerX(startTime=startTimeOcc)
-        # print('SX Tools: Mergelayers duration ' + str(totalTime))
-
     # If mesh color sets don't match the reference layers.
     # Sorts the existing color sets to the correct order,
     # and fills the missing slots with default layers.
+    @profiler.profile('layers.patchLayers')
     def patchLayers(self, objects):
-        startTimeOcc = maya.cmds.timerX()
         noColorSetObject = []
 
         refLayers = self.sortLayers(
@@ -384,13 +158,11 @@ class LayerManagement(object):
         if len(noColorSetObject) > 0:
             self.resetLayers(noColorSetObject)
 
-        totalTime = maya.cmds.timerX(startTime=startTimeOcc)
-        print('SX Tools: Patchlayers duration ' + str(totalTime))
         # maya.cmds.select(sxglobals.settings.selectionArray)
 
     # Resulting blended layer is set to Alpha blending mode
+    @profiler.profile('layers.mergeLayerDirection')
     def mergeLayerDirection(self, shapes, up):
-        startTimeOcc = maya.cmds.timerX()
         sourceLayer = sxglobals.settings.tools['selectedLayer']
         if (str(sourceLayer) == 'layer1') and up:
             print('SX Tools Error: Cannot merge layer1')
@@ -423,11 +195,10 @@ class LayerManagement(object):
                 targetLayer, up)
 
         self.refreshLayerList()
-        totalTime = maya.cmds.timerX(startTime=startTimeOcc)
-        print('SX Tools: Mergelayerdirection duration ' + str(totalTime))
 
     # IF mesh has no color sets at all,
     # or non-matching color set names.
+    @profiler.profile('layers.resetLayers')
     def resetLayers(self, objects):
         for obj in objects:
             # Remove existing color sets, if any
@@ -460,6 +231,7 @@ class LayerManagement(object):
         var = int(maya.cmds.getAttr(obj + '.numLayerSets'))
         return var
 
+    @profiler.profile('layers.addLayerSet')
     def addLayerSet(self, objects, varIdx):
         for object in objects:
             num = int(maya.cmds.getAttr(object + '.numLayerSets'))
@@ -488,6 +260,7 @@ class LayerManagement(object):
         for object in objects:
             maya.cmds.setAttr(object + '.numLayerSets', var)
 
+    @profiler.profile('layers.clearLayer')
     def clearLayer(self, layers, objList=None):
         objects = []
         if 'composite' in layers:
@@ -525,22 +298,19 @@ class LayerManagement(object):
             for obj in objects:
                 maya.cmds.setAttr(str(obj) + attr, 0)
 
+    # Returns True if the visibility of any selected shape changed
     def toggleLayer(self, layer):
         object = sxglobals.settings.shapeArray[len(sxglobals.settings.shapeArray)-1]
-        checkState = maya.cmds.getAttr(
-            str(object) + '.' + str(layer) + 'Visibility')
+        checkState = sxglobals.primvars.getAttr(
+            object, str(layer) + 'Visibility')
+        changed = False
         for shape in sxglobals.settings.shapeArray:
-            maya.cmds.setAttr(
-                str(shape) + '.' + str(layer) + 'Visibility', not checkState)
-        state = self.verifyLayerState(layer)
-        layerIndex = int(maya.cmds.textScrollList(
-            'layerList', query=True, selectIndexedItem=True)[0])
-        maya.cmds.textScrollList(
-            'layerList', edit=True, removeIndexedItem=layerIndex)
-        maya.cmds.textScrollList(
-            'layerList', edit=True, appendPosition=(layerIndex, state))
-        maya.cmds.textScrollList(
-            'layerList', edit=True, selectIndexedItem=layerIndex)
+            if bool(sxglobals.primvars.getAttr(
+                    shape, str(layer) + 'Visibility')) != (not checkState):
+                maya.cmds.setAttr(
+                    str(shape) + '.' + str(layer) + 'Visibility', not checkState)
+                changed = True
+        return changed
 
     # Called when the user double-clicks a layer in the tool UI
     def toggleAllLayers(self, selLayer):
@@ -551,15 +321,27 @@ class LayerManagement(object):
             layers = self.sortLayers(
                 sxglobals.settings.project['LayerData'].keys())
             layers.remove('composite')
+            toggledLayers = []
             for layer in layers:
-                if layer != selLayer:
-                    self.toggleLayer(layer)
+                if (layer != selLayer) and self.toggleLayer(layer):
+                    toggledLayers.append(layer)
 
         elif not shift:
-            self.toggleLayer(selLayer)
+            toggledLayers = []
+            if self.toggleLayer(selLayer):
+                toggledLayers.append(selLayer)
 
         self.refreshLayerList()
-        self.compositeLayers()
+
+        # A hidden layer1 turns the composite black, other layers
+        # without any alpha do not contribute to the composite
+        stats = sxglobals.layerstats.getStats(
+            sxglobals.settings.shapeArray, toggledLayers)
+        compositeLayers = [
+            layer for layer in toggledLayers
+            if (layer == 'layer1') or (stats[layer]['alphaMax'] > 0)]
+        if len(compositeLayers) > 0:
+            self.compositeLayers(compositeLayers)
 
     # Updates the selected color set to match the highlighted layer in the UI
     def setColorSet(self, highlightedLayer):
@@ -569,25 +351,22 @@ class LayerManagement(object):
             colorSet=highlightedLayer)
 
     # This function populates the layer list in the tool UI.
-    # Any state change in a list item requires a list rebuild
-    # since the text in a single item can not be changed
-    # after creation
+    # The text of a list item can not be changed after creation,
+    # so items whose state changed are removed and inserted again.
+    # The list is only rebuilt when the number of layers changes
+    # or the layer list control has been recreated.
+    @profiler.profile('layers.refreshLayerList')
     def refreshLayerList(self):
-        if maya.cmds.textScrollList('layerList', exists=True):
-            maya.cmds.textScrollList('layerList', edit=True, removeAll=True)
-
         layers = self.sortLayers(
             sxglobals.settings.project['LayerData'].keys())
         layers.remove('composite')
+        # Reads all layers that are not cached in one pass
+        sxglobals.layerstats.getStats(sxglobals.settings.shapeArray, layers)
         states = []
         for layer in layers:
             states.append(self.verifyLayerState(layer))
 
-        maya.cmds.textScrollList(
-            'layerList',
-            edit=True,
-            append=states,
-            selectIndexedItem=sxglobals.settings.tools['selectedLayerIndex'])
+        self.updateLayerItems(states)
 
         maya.cmds.text(
             'layerBlendModeLabel',
@@ -607,6 +386,26 @@ class LayerManagement(object):
                 len(sxglobals.settings.shapeArray)-1],
                 sxglobals.settings.tools['selectedLayer'])
 
+    # Edits only the list items that differ from states
+    def updateLayerItems(self, states):
+        items = maya.cmds.textScrollList(
+            'layerList', query=True, allItems=True) or []
+        if len(items) != len(states):
+            maya.cmds.textScrollList('layerList', edit=True, removeAll=True)
+            maya.cmds.textScrollList('layerList', edit=True, append=states)
+        else:
+            for idx, state in enumerate(states):
+                if items[idx] != state:
+                    maya.cmds.textScrollList(
+                        'layerList', edit=True, removeIndexedItem=idx+1)
+                    maya.cmds.textScrollList(
+                        'layerList', edit=True, appendPosition=(idx+1, state))
+
+        selectedIndex = sxglobals.settings.tools['selectedLayerIndex']
+        if selectedIndex <= len(states):
+            maya.cmds.textScrollList(
+                'layerList', edit=True, selectIndexedItem=selectedIndex)
+
     def sortLayers(self, layers):
         sortedLayers = []
         if layers is not None:
@@ -620,27 +419,16 @@ class LayerManagement(object):
             return
         else:
             obj = sxglobals.settings.shapeArray[len(sxglobals.settings.shapeArray)-1]
-            selectionList = OM.MSelectionList()
-            selectionList.add(obj)
-            nodeDagPath = OM.MDagPath()
-            nodeDagPath = selectionList.getDagPath(0)
-            MFnMesh = OM.MFnMesh(nodeDagPath)
-
-            layerColors = OM.MColorArray()
-            layerColors = MFnMesh.getFaceVertexColors(colorSet=layer)
+            # Mask and adjustment flags are set if any selected shape has them
+            stats = sxglobals.layerstats.getStats(
+                sxglobals.settings.shapeArray, [layer, ])[layer]
 
             # States: visibility, mask, adjustment
             state = [False, False, False]
-            state[0] = (bool(maya.cmds.getAttr(str(obj) +
-                        '.' + str(layer) + 'Visibility')))
-
-            for k in range(len(layerColors)):
-                if ((layerColors[k].a > 0) and
-                   (layerColors[k].a < sxglobals.settings.project['AlphaTolerance'])):
-                    state[2] = True
-                elif ((layerColors[k].a >= sxglobals.settings.project['AlphaTolerance']) and
-                      (layerColors[k].a <= 1)):
-                    state[1] = True
+            state[0] = (bool(sxglobals.primvars.getAttr(
+                        obj, str(layer) + 'Visibility')))
+            state[1] = stats['mask']
+            state[2] = stats['adjustment']
 
             if not state[0]:
                 hidden = 'H'
@@ -662,27 +450,46 @@ class LayerManagement(object):
     # Color sets of any selected object are checked
     # to see if they match the reference set.
     # Also verifies subdivision mode.
+    @profiler.profile('layers.verifyObjectLayers')
     def verifyObjectLayers(self, objects):
         refLayers = self.sortLayers(
             sxglobals.settings.project['LayerData'].keys())
         nonStdObjs = []
         empty = False
 
-        sxglobals.setup.setPrimVars()
+        # Only objects and shapes that are new or changed since
+        # the last check are verified and patched
+        staleObjects = sxglobals.validation.getStale(
+            sxglobals.settings.objectArray)
+        staleShapes = sxglobals.validation.getStale(
+            list(set(objects) | set(sxglobals.settings.shapeArray)))
+        if (len(staleObjects) > 0) or (len(staleShapes) > 0):
+            sxglobals.setup.setPrimVars(staleObjects, staleShapes)
+        sxglobals.validation.setState(staleObjects)
+
+        for shape in staleShapes:
+            if maya.cmds.getAttr(str(shape)+'.useGlobalSmoothDrawType'):
+                maya.cmds.setAttr(str(shape)+'.useGlobalSmoothDrawType', False)
+            if maya.cmds.getAttr(str(shape)+'.smoothDrawType') != 2:
+                maya.cmds.setAttr(str(shape)+'.smoothDrawType', 2)
 
-        for shape in sxglobals.settings.shapeArray:
-            maya.cmds.setAttr(str(shape)+'.useGlobalSmoothDrawType', False)
-            maya.cmds.setAttr(str(shape)+'.smoothDrawType', 2)
-
-        for object in objects:
             testLayers = maya.cmds.polyColorSet(
-                object,
+                shape,
                 query=True,
                 allColorSets=True)
             if testLayers is None:
+                sxglobals.validation.setState([shape, ], 1)
+            elif not set(refLayers).issubset(testLayers):
+                sxglobals.validation.setState([shape, ], 2)
+            else:
+                sxglobals.validation.setState([shape, ], 0)
+
+        for object in objects:
+            layerState = sxglobals.validation.getState(object)
+            if layerState == 1:
                 nonStdObjs.append(object)
                 empty = True
-            elif not set(refLayers).issubset(testLayers):
+            elif layerState == 2:
                 nonStdObjs.append(object)
                 empty = False
 
@@ -693,39 +500,12 @@ class LayerManagement(object):
         else:
             return 0, None
 
+    @profiler.profile('layers.getLayerPaletteAndOpacity')
     def getLayerPaletteAndOpacity(self, obj, layer):
-        selectionList = OM.MSelectionList()
-        selectionList.add(obj)
-        nodeDagPath = OM.MDagPath()
-        nodeDagPath = selectionList.getDagPath(0)
-        MFnMesh = OM.MFnMesh(nodeDagPath)
-
-        layerColorArray = OM.MColorArray()
-        layerColorArray = MFnMesh.getFaceVertexColors(colorSet=layer)
-        black = OM.MColor()
-        black = (0, 0, 0, 1)
-
-        layerPaletteArray = OM.MColorArray()
-        layerPaletteArray.setLength(8)
-        for k in range(0, 8):
-            layerPaletteArray[k] = black
-
-        n = 0
-        alphaMax = 0
-        for k in range(len(layerColorArray)):
-            match = False
-            for p in range(0, 8):
-                if ((layerColorArray[k].r == layerPaletteArray[p].r) and
-                   (layerColorArray[k].g == layerPaletteArray[p].g) and
-                   (layerColorArray[k].b == layerPaletteArray[p].b)):
-                    match = True
-
-            if (not match) and (n < 8):
-                layerPaletteArray[n] = layerColorArray[k]
-                n += 1
-
-            if layerColorArray[k].a > alphaMax:
-                alphaMax = layerColorArray[k].a
+        # The eight most common colors of the layer. Palettes are
+        # cached per mesh node and dropped when the mesh is edited
+        # or removed, so they are not kept here between refreshes.
+        layerPalette, alphaMax = sxglobals.layerstats.getPalette(obj, layer, 8)
 
         if maya.cmds.floatSlider('layerOpacitySlider', exists=True):
             maya.cmds.floatSlider(
@@ -740,10 +520,10 @@ class LayerManagement(object):
                 edit=True,
                 rgb=(
                     k,
-                    layerPaletteArray[k].r,
-                    layerPaletteArray[k].g,
-                    layerPaletteArray[k].b))
-            maya.cmds.palettePort('layerPalette', edit=True, redraw=True)
+                    layerPalette[k][0],
+                    layerPalette[k][1],
+                    layerPalette[k][2]))
+        maya.cmds.palettePort('layerPalette', edit=True, redraw=True)
 
         if 'layer' not in layer:
             if maya.cmds.optionMenu('layerBlendModes', exists=True):
@@ -768,9 +548,9 @@ class LayerManagement(object):
                     enable=True)
 
             attr = (
-                '.' + sxglobals.settings.project['RefNames'][sxglobals.settings.tools['selectedLayerIndex']-1] +
+                sxglobals.settings.project['RefNames'][sxglobals.settings.tools['selectedLayerIndex']-1] +
                 'BlendMode')
-            mode = maya.cmds.getAttr(str(obj) + attr) + 1
+            mode = int(sxglobals.primvars.getAttr(obj, attr)) + 1
             maya.cmds.optionMenu(
                 'layerBlendModes',
                 edit=True,
@@ -830,5 +610,5 @@ class LayerManagement(object):
         if alt:
             maya.cmds.select(sxglobals.tools.getLayerMask())
 
-        if maya.cmds.getAttr(str(sxglobals.settings.shapeArray[0]) + '.shadingMode') != 0:
+        if sxglobals.primvars.getAttr(sxglobals.settings.shapeArray[0], 'shadingMode') != 0:
             self.compositeLayers()
@@ -0,0 +1,217 @@
+# ----------------------------------------------------------------------------
+#   SX Tools - Maya vertex painting toolkit
+#   (c) 2017-2019  Jani Kahrama / Secret Exit Ltd
+#   Released under MIT license
+#
+#   Alpha statistics of color layers, used for the hidden, mask and
+#   adjustment flags of the layer list. The alphas of all requested
+#   layers of a shape are read into one (layers, N) array and the
+#   statistics of every layer are computed in one vectorized pass.
+#   Results are kept per node until a dirty plug callback reports
+#   an edit to the mesh, which also catches brush painting and undo,
+#   or the node is removed.
+#
+#   Layer palettes are found the same way: colors are quantized to
+#   8 bits per channel and packed into one integer key per face vertex,
+#   and the most common keys are picked with a single np.unique.
+# ----------------------------------------------------------------------------
+
+import maya.api.OpenMaya as OM
+import numpy as np
+import sxglobals
+
+
+class LayerStats(object):
+    def __init__(self):
+        self.shapeDict = {}
+        self.paletteDict = {}
+        self.callbackDict = {}
+        self.tolerance = None
+        # Set while the compositor writes the 'composite' colorSet,
+        # which does not change the statistics of any layer
+        self.suspended = False
+        # Mesh attributes that only pick the active or displayed
+        # colorSet, switched by nearly every layer tool
+        self.ignoredPlugs = set([
+            'currentColorSet',
+            'currentUVSet',
+            'displayColors',
+            'displayColorChannel'])
+        return None
+
+    def __del__(self):
+        self.clear()
+        print('SX Tools: Exiting layerstats')
+
+    # Statistics of several layers of one mesh:
+    # alpha min and max, whether any alpha is in the
+    # mask or adjustment range, and the fraction of
+    # face vertices with non-zero alpha
+    def computeStats(self, MFnMesh, layers, tolerance):
+        count = MFnMesh.numFaceVertices
+        alphas = np.empty((len(layers), count), dtype=np.float32)
+        for i, layer in enumerate(layers):
+            alphas[i] = [
+                color.a for color in MFnMesh.getFaceVertexColors(
+                    colorSet=layer)]
+
+        if count == 0:
+            alphaMin = alphaMax = coverage = np.zeros(len(layers))
+        else:
+            alphaMin = alphas.min(axis=1)
+            alphaMax = alphas.max(axis=1)
+            coverage = (alphas > 0).mean(axis=1)
+        adjustment = ((alphas > 0) & (alphas < tolerance)).any(axis=1)
+        mask = ((alphas >= tolerance) & (alphas <= 1)).any(axis=1)
+
+        stats = {}
+        for i, layer in enumerate(layers):
+            stats[layer] = {
+                'alphaMin': float(alphaMin[i]),
+                'alphaMax': float(alphaMax[i]),
+                'mask': bool(mask[i]),
+                'adjustment': bool(adjustment[i]),
+                'coverage': float(coverage[i]),
+                'count': count}
+        return stats
+
+    # Returns the cached values of a mesh in shapeDict or paletteDict.
+    # Entries are keyed by node, and a deleted node can be replaced
+    # by another with the same hash code, so they are also checked
+    # against the node itself.
+    def getEntry(self, cache, MFnMesh):
+        mObject = MFnMesh.object()
+        hashCode = OM.MObjectHandle(mObject).hashCode()
+        entry = cache.get(hashCode)
+        if ((entry is None) or
+           (not entry['handle'].isValid()) or
+           (entry['handle'].object() != mObject)):
+            entry = {'handle': OM.MObjectHandle(mObject), 'values': {}}
+            cache[hashCode] = entry
+        self.addCallbacks(hashCode, mObject)
+        return entry['values']
+
+    # Returns the statistics of the given layers combined
+    # over all given shapes, computing only the layers
+    # that are not cached
+    def getStats(self, shapes, layers):
+        tolerance = sxglobals.settings.project['AlphaTolerance']
+        if tolerance != self.tolerance:
+            self.shapeDict.clear()
+            self.tolerance = tolerance
+
+        shapeStats = []
+        for shape in shapes:
+            selectionList = OM.MSelectionList()
+            selectionList.add(str(shape))
+            MFnMesh = OM.MFnMesh(selectionList.getDagPath(0))
+
+            stats = self.getEntry(self.shapeDict, MFnMesh)
+            missing = [layer for layer in layers if layer not in stats]
+            if len(missing) > 0:
+                stats.update(self.computeStats(MFnMesh, missing, tolerance))
+            shapeStats.append(stats)
+
+        combined = {}
+        for layer in layers:
+            layerStats = [stats[layer] for stats in shapeStats]
+            count = sum([stats['count'] for stats in layerStats])
+            if count == 0:
+                coverage = 0.0
+            else:
+                coverage = sum([
+                    stats['coverage'] * stats['count']
+                    for stats in layerStats]) / float(count)
+            combined[layer] = {
+                'alphaMin': min([stats['alphaMin'] for stats in layerStats] or [0.0]),
+                'alphaMax': max([stats['alphaMax'] for stats in layerStats] or [0.0]),
+                'mask': any([stats['mask'] for stats in layerStats]),
+                'adjustment': any([stats['adjustment'] for stats in layerStats]),
+                'coverage': coverage,
+                'count': count}
+        return combined
+
+    # Returns the numColors most common colors of a float32 (N, 4)
+    # color array as (r, g, b) tuples, most common first, and the
+    # alpha max. Black is left out, unused entries stay black.
+    def getPaletteColors(self, colors, numColors):
+        palette = [(0.0, 0.0, 0.0), ] * numColors
+        if len(colors) == 0:
+            return (palette, 0.0)
+
+        quantized = np.clip(
+            np.round(colors[:, :3] * 255.0), 0, 255).astype(np.int32)
+        keys = (quantized[:, 0] << 16) | (quantized[:, 1] << 8) | quantized[:, 2]
+        uniqueKeys, firstIndices, counts = np.unique(
+            keys, return_index=True, return_counts=True)
+
+        # Most common first, ties in the order the colors appear
+        order = np.lexsort((firstIndices, -counts))
+        order = order[uniqueKeys[order] != 0][:numColors]
+        for i, index in enumerate(firstIndices[order].tolist()):
+            palette[i] = tuple(colors[index, :3].tolist())
+        return (palette, float(max(colors[:, 3].max(), 0.0)))
+
+    # Cached palette and alpha max of one layer of a shape
+    def getPalette(self, shape, layer, numColors=8):
+        selectionList = OM.MSelectionList()
+        selectionList.add(str(shape))
+        MFnMesh = OM.MFnMesh(selectionList.getDagPath(0))
+
+        # Writes to the 'composite' colorSet do not invalidate the cache
+        if layer == 'composite':
+            return self.getPaletteColors(
+                sxglobals.compositor.getColorArray(MFnMesh, layer), numColors)
+
+        palettes = self.getEntry(self.paletteDict, MFnMesh)
+        if (layer, numColors) not in palettes:
+            colors = sxglobals.compositor.getColorArray(MFnMesh, layer)
+            palettes[(layer, numColors)] = self.getPaletteColors(
+                colors, numColors)
+        return palettes[(layer, numColors)]
+
+    # Callbacks are registered once per node. A deleted node
+    # keeps its callbacks until the delete can no longer be
+    # undone, so a node that comes back reuses them.
+    def addCallbacks(self, hashCode, mObject):
+        if hashCode in self.callbackDict:
+            handle, callbackIDs = self.callbackDict[hashCode]
+            if handle.isValid() and (handle.object() == mObject):
+                return
+            self.removeCallbacks(callbackIDs)
+        self.callbackDict[hashCode] = (
+            OM.MObjectHandle(mObject), (
+                OM.MNodeMessage.addNodeDirtyPlugCallback(
+                    mObject,
+                    lambda node, plug, *args: self.plugDirty(hashCode, plug)),
+                OM.MNodeMessage.addNodePreRemovalCallback(
+                    mObject,
+                    lambda *args: self.invalidate(hashCode))))
+
+    def removeCallbacks(self, callbackIDs):
+        for callbackID in callbackIDs:
+            # Callbacks of deleted nodes are already gone
+            try:
+                OM.MMessage.removeCallback(callbackID)
+            except RuntimeError:
+                pass
+
+    # Layer colors are stored in static mesh attributes,
+    # dynamic attributes are the layer primVars
+    def plugDirty(self, hashCode, plug):
+        if self.suspended or plug.isDynamic:
+            return
+        if OM.MFnAttribute(plug.attribute()).name in self.ignoredPlugs:
+            return
+        self.invalidate(hashCode)
+
+    def invalidate(self, hashCode):
+        self.shapeDict.pop(hashCode, None)
+        self.paletteDict.pop(hashCode, None)
+
+    def clear(self):
+        self.shapeDict.clear()
+        self.paletteDict.clear()
+        for handle, callbackIDs in self.callbackDict.values():
+            self.removeCallbacks(callbackIDs)
+        self.callbackDict.clear()
@@ -0,0 +1,114 @@
+# ----------------------------------------------------------------------------
+#   SX Tools - Maya vertex painting toolkit
+#   (c) 2017-2019  Jani Kahrama / Secret Exit Ltd
+#   Released under MIT license
+#
+#   Index of the master palette and material libraries for the
+#   library browsers. Each preset is indexed once with a lowercase
+#   search key, so filtering the library does not walk the loaded
+#   JSON data or query any UI controls. The browsers only build rows
+#   for expanded categories, one page at a time, and all swatches of
+#   a page are set with a single MEL evaluation.
+# ----------------------------------------------------------------------------
+
+import maya.mel as mel
+import sxglobals
+
+
+class PaletteLibrary(object):
+    def __init__(self):
+        # mode 1: master palettes, mode 2: materials
+        self.indexDict = {}
+        self.filterDict = {1: '', 2: ''}
+        self.pageDict = {}
+        return None
+
+    def __del__(self):
+        print('SX Tools: Exiting library')
+
+    def getLibraryArray(self, mode):
+        if mode == 1:
+            return sxglobals.settings.masterPaletteArray
+        else:
+            return sxglobals.settings.materialArray
+
+    # Returns a list of (category, entries) in library order,
+    # where each entry is a dict of category, name, colors and key
+    def getIndex(self, mode):
+        if mode not in self.indexDict:
+            index = []
+            for categoryDict in self.getLibraryArray(mode):
+                category = categoryDict.keys()[0]
+                entries = []
+                for name, colors in categoryDict[category].items():
+                    entries.append({
+                        'category': category,
+                        'name': name,
+                        'colors': colors,
+                        'key': (category + ' ' + name).lower()})
+                index.append((category, entries))
+            self.indexDict[mode] = index
+        return self.indexDict[mode]
+
+    # Returns the index with only the presets matching the
+    # current filter. Every word of the filter must be found
+    # in the category or preset name.
+    def search(self, mode):
+        terms = self.filterDict[mode].lower().split()
+        if len(terms) == 0:
+            return self.getIndex(mode)
+
+        results = []
+        for category, entries in self.getIndex(mode):
+            matches = [
+                entry for entry in entries
+                if all([term in entry['key'] for term in terms])]
+            if len(matches) > 0:
+                results.append((category, matches))
+        return results
+
+    def setFilter(self, mode, text):
+        if text != self.filterDict[mode]:
+            self.filterDict[mode] = text
+            self.pageDict = dict([
+                (key, value) for key, value in self.pageDict.items()
+                if key[0] != mode])
+
+    # Number of rows currently shown in a category
+    def getPageSize(self, mode, category):
+        return self.pageDict.get(
+            (mode, category),
+            sxglobals.settings.tools['libraryPageSize'])
+
+    def nextPage(self, mode, category):
+        self.pageDict[(mode, category)] = (
+            self.getPageSize(mode, category) +
+            sxglobals.settings.tools['libraryPageSize'])
+
+    # Sets the colors of several palettePorts in one call,
+    # swatches is a list of (paletteUI, colors)
+    def setSwatches(self, swatches):
+        commands = []
+        for paletteUI, colors in swatches:
+            for idx, color in enumerate(colors):
+                commands.append(
+                    'palettePort -e -rgb %d %r %r %r "%s";' % (
+                        idx,
+                        float(color[0]),
+                        float(color[1]),
+                        float(color[2]),
+                        paletteUI))
+            commands.append('palettePort -e -redraw "%s";' % paletteUI)
+        if len(commands) > 0:
+            mel.eval('\n'.join(commands))
+
+    # Called whenever the palette or material data changes
+    def invalidate(self, mode=None):
+        if mode is None:
+            self.indexDict.clear()
+        else:
+            self.indexDict.pop(mode, None)
+
+    def clear(self):
+        self.indexDict.clear()
+        self.pageDict.clear()
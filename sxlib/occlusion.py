@@ -0,0 +1,616 @@
+# ----------------------------------------------------------------------------
+#   SX Tools - Maya vertex painting toolkit
+#   (c) 2017-2019  Jani Kahrama / Secret Exit Ltd
+#   Released under MIT license
+#
+#   Ray traced vertex occlusion on the CPU. The triangulated bake mesh
+#   is sorted into a bounding volume hierarchy, and the hemisphere rays
+#   of a batch of vertices are traced through it together: each pass
+#   tests every live (ray, node) pair against its node bounds at once,
+#   and the triangles of the leaves that were reached are intersected
+#   as one array. Rays stop at the first hit, as with anyIntersection.
+#
+#   Rays follow cosine weighted Hammersley or stratified sample sets,
+#   which are cached per ray count and rotated to the tangent frame of
+#   every vertex of a batch at once.
+#
+#   Finished results can be stored in a directory of .npz files, keyed
+#   by hashes of the traced geometry and the bake parameters.
+#
+#   Large meshes are split into chunks of vertices that are traced in
+#   a pool of worker processes. A Tracer starts the pool once per bake
+#   and copies the geometry and the BVH of every large mesh into shared
+#   memory once, so every pass of a progressive bake only sends its
+#   sample set with each chunk. Small meshes are traced serially.
+#
+#   Only uses NumPy, so the module can be imported and tested
+#   outside of Maya, and by the worker processes.
+# ----------------------------------------------------------------------------
+
+import hashlib
+import json
+import math
+import os
+import time
+import multiprocessing
+from multiprocessing.sharedctypes import RawArray
+import numpy as np
+
+
+# Meshes and options of a worker process, set by initWorker
+workerState = {}
+
+
+# Flat BVH arrays. Node 0 is the root, the children of an inner
+# node are child and child + 1. Leaves have child -1 and hold
+# the triangles order[start:start + count]. Bounds are padded
+# float32 rows of min xyz and max xyz for the slab test.
+class BVH(object):
+    def __init__(self, bounds, child, start, count, order):
+        self.bounds = bounds
+        self.child = child
+        self.start = start
+        self.count = count
+        self.order = order
+
+
+# The triangles store rows of v0, edge1 and edge2 xyz in triData
+class Geometry(object):
+    def __init__(self, points, triangles, triData, bvh):
+        self.points = points
+        self.triangles = triangles
+        self.triData = triData
+        self.bvh = bvh
+
+    # Every array read by traceRays, by name
+    def getArrays(self):
+        return {
+            'points': self.points,
+            'triangles': self.triangles,
+            'triData': self.triData,
+            'bounds': self.bvh.bounds,
+            'child': self.bvh.child,
+            'start': self.bvh.start,
+            'count': self.bvh.count,
+            'order': self.bvh.order}
+
+
+def fromArrays(arrays):
+    return Geometry(
+        arrays['points'],
+        arrays['triangles'],
+        arrays['triData'],
+        BVH(
+            arrays['bounds'],
+            arrays['child'],
+            arrays['start'],
+            arrays['count'],
+            arrays['order']))
+
+
+def buildGeometry(points, triangles, leafSize=4):
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    triangles = np.asarray(triangles, dtype=np.int32).reshape(-1, 3)
+    v0 = points[triangles[:, 0]]
+    triData = np.concatenate((
+        v0.T,
+        (points[triangles[:, 1]] - v0).T,
+        (points[triangles[:, 2]] - v0).T))
+    return Geometry(
+        points, triangles, triData, buildBVH(points, triangles, leafSize))
+
+
+# Top-down build that splits every node at the median triangle
+# centroid along its longest axis. All nodes of a tree level
+# are split together with one sort.
+def buildBVH(points, triangles, leafSize=4):
+    corners = points[triangles]
+    triMin = corners.min(axis=1)
+    triMax = corners.max(axis=1)
+    centroids = (triMin + triMax) * 0.5
+    numTris = len(triangles)
+    maxNodes = max(2 * numTris - 1, 1)
+
+    boundsMin = np.zeros((maxNodes, 3), dtype=np.float64)
+    boundsMax = np.zeros((maxNodes, 3), dtype=np.float64)
+    child = np.full(maxNodes, -1, dtype=np.int32)
+    start = np.zeros(maxNodes, dtype=np.int32)
+    count = np.zeros(maxNodes, dtype=np.int32)
+    order = np.arange(numTris, dtype=np.int32)
+
+    nodes = np.zeros(1, dtype=np.int32)
+    start[0] = 0
+    count[0] = numTris
+    numNodes = 1
+
+    while (len(nodes) > 0) and (numTris > 0):
+        counts = count[nodes]
+        offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        labels = np.repeat(np.arange(len(nodes)), counts)
+        positions = (
+            np.repeat(start[nodes] - offsets, counts) +
+            np.arange(counts.sum()))
+        tris = order[positions]
+
+        boundsMin[nodes] = np.minimum.reduceat(triMin[tris], offsets)
+        boundsMax[nodes] = np.maximum.reduceat(triMax[tris], offsets)
+
+        split = counts > leafSize
+        if not split.any():
+            break
+
+        centroidMin = np.minimum.reduceat(centroids[tris], offsets)
+        centroidMax = np.maximum.reduceat(centroids[tris], offsets)
+        axis = np.argmax(centroidMax - centroidMin, axis=1)
+        keys = centroids[tris, axis[labels]]
+        order[positions] = tris[np.lexsort((keys, labels))]
+
+        parents = nodes[split]
+        children = numNodes + 2 * np.arange(len(parents), dtype=np.int32)
+        leftCount = count[parents] // 2
+        child[parents] = children
+        start[children] = start[parents]
+        count[children] = leftCount
+        start[children + 1] = start[parents] + leftCount
+        count[children + 1] = count[parents] - leftCount
+        numNodes += 2 * len(parents)
+        nodes = np.concatenate((children, children + 1))
+
+    # The slab test runs in float32, so the padding grows with the
+    # coordinates to cover the rounding of both the bounds and the
+    # ray origins, and the rounded bounds are stepped outwards
+    boundsMin = boundsMin[:numNodes].T
+    boundsMax = boundsMax[:numNodes].T
+    pad = 1e-5 + np.maximum(np.abs(boundsMin), np.abs(boundsMax)) * 2.0 ** -20
+    bounds = np.empty((6, numNodes), dtype=np.float32)
+    bounds[0:3] = np.nextafter(
+        (boundsMin - pad).astype(np.float32), np.float32(-np.inf))
+    bounds[3:6] = np.nextafter(
+        (boundsMax + pad).astype(np.float32), np.float32(np.inf))
+    return BVH(
+        bounds,
+        child[:numNodes],
+        start[:numNodes],
+        count[:numNodes],
+        order)
+
+
+# Sample sets of the hemisphere, by (method, rayCount, shift)
+sampleSets = {}
+sampleMethods = ('hammersley', 'stratified', 'random')
+
+
+# Van der Corput radical inverse in base 2 of integer indices
+def radicalInverse(indices):
+    result = np.zeros(len(indices), dtype=np.float64)
+    indices = np.array(indices, dtype=np.int64)
+    scale = 0.5
+    while indices.any():
+        result += (indices & 1) * scale
+        indices >>= 1
+        scale *= 0.5
+    return result
+
+
+# Points of the unit square. Hammersley points are the most even,
+# stratified points place one point in every row and column of an
+# N x N grid, and random points are only kept for comparison.
+# Every method is seeded, so the same rayCount gives the same set.
+def getUnitSamples(rayCount, method):
+    indices = np.arange(rayCount)
+    if method == 'hammersley':
+        return ((indices + 0.5) / rayCount, radicalInverse(indices))
+    random = np.random.RandomState(rayCount)
+    if method == 'stratified':
+        return (
+            (indices + random.uniform(0.0, 1.0, rayCount)) / rayCount,
+            (random.permutation(rayCount) +
+             random.uniform(0.0, 1.0, rayCount)) / rayCount)
+    return (
+        random.uniform(0.0, 1.0, rayCount),
+        random.uniform(0.0, 1.0, rayCount))
+
+
+# Cosine weighted directions around +Z, (rayCount, 3). Sets are
+# computed once per ray count and shared, so they are read-only.
+# A shift other than 0 offsets the points along the R2 sequence,
+# giving progressive passes sets that do not repeat earlier rays.
+def getHemisphere(rayCount, method='hammersley', shift=0):
+    key = (method, rayCount, shift)
+    if key not in sampleSets:
+        u1, u2 = getUnitSamples(rayCount, method)
+        u1 = (u1 + shift * 0.7548776662466927) % 1.0
+        u2 = (u2 + shift * 0.5698402909980532) % 1.0
+        r = np.sqrt(u1)
+        theta = 2.0 * math.pi * u2
+        hemisphere = np.column_stack((
+            r * np.cos(theta),
+            r * np.sin(theta),
+            np.sqrt(np.maximum(0.0, 1.0 - u1))))
+        hemisphere.flags.writeable = False
+        sampleSets[key] = hemisphere
+    return sampleSets[key]
+
+
+# Rotates the hemisphere to each normal, (len(normals), rayCount, 3)
+def orientHemisphere(hemisphere, normals):
+    normals = normals / np.maximum(
+        np.linalg.norm(normals, axis=1), 1e-12)[:, None]
+    helper = np.zeros_like(normals)
+    useY = np.abs(normals[:, 0]) > 0.9
+    helper[~useY, 0] = 1.0
+    helper[useY, 1] = 1.0
+    tangents = np.cross(helper, normals)
+    tangents /= np.linalg.norm(tangents, axis=1)[:, None]
+    bitangents = np.cross(normals, tangents)
+    return (
+        hemisphere[None, :, 0:1] * tangents[:, None, :] +
+        hemisphere[None, :, 1:2] * bitangents[:, None, :] +
+        hemisphere[None, :, 2:3] * normals[:, None, :])
+
+
+# Returns a bool array of the rays that hit any triangle
+# within maxDistance. Triangles that share the source vertex
+# of a ray are skipped, a ray leaving a vertex can only
+# touch them at its origin. Per-ray and per-node values are
+# kept in rows, so every gather and arithmetic step works on
+# contiguous arrays.
+def traceRays(geometry, origins, directions, maxDistance, sources=None):
+    bvh = geometry.bvh
+    numRays = len(origins)
+    hits = np.zeros(numRays, dtype=bool)
+    if len(geometry.triangles) == 0:
+        return hits
+
+    rayData = np.empty((6, numRays), dtype=np.float64)
+    rayData[0:3] = origins.T
+    rayData[3:6] = directions.T
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slabData = np.empty((6, numRays), dtype=np.float32)
+        slabData[0:3] = origins.T
+        slabData[3:6] = 1.0 / directions.T
+
+        rays = np.arange(numRays, dtype=np.int32)
+        nodes = np.zeros(numRays, dtype=np.int32)
+        while len(rays) > 0:
+            live = ~np.take(hits, rays)
+            rays = rays[live]
+            nodes = nodes[live]
+
+            # Slab test, NaNs of rays parallel to a slab are ignored
+            ray = np.take(slabData, rays, axis=1)
+            box = np.take(bvh.bounds, nodes, axis=1)
+            t1 = (box[0:3] - ray[0:3]) * ray[3:6]
+            t2 = (box[3:6] - ray[0:3]) * ray[3:6]
+            tMin = np.fmin(t1, t2)
+            tMax = np.fmax(t1, t2)
+            tNear = np.fmax(
+                np.fmax(tMin[0], tMin[1]),
+                np.fmax(tMin[2], 0.0))
+            tFar = np.fmin(np.fmin(tMax[0], tMax[1]), tMax[2])
+            reached = (tNear <= tFar) & (tNear <= maxDistance)
+            rays = rays[reached]
+            nodes = nodes[reached]
+
+            leaf = np.take(bvh.child, nodes) < 0
+            leafRays = rays[leaf]
+            leafNodes = nodes[leaf]
+            if len(leafRays) > 0:
+                counts = np.take(bvh.count, leafNodes)
+                offsets = np.cumsum(counts) - counts
+                pairRays = np.repeat(leafRays, counts)
+                pairTris = np.take(bvh.order, (
+                    np.repeat(np.take(bvh.start, leafNodes) - offsets, counts) +
+                    np.arange(counts.sum())))
+                found = intersectTriangles(
+                    geometry,
+                    np.take(rayData, pairRays, axis=1),
+                    pairTris,
+                    maxDistance)
+                if sources is not None:
+                    found &= (
+                        np.take(geometry.triangles, pairTris, axis=0) !=
+                        np.take(sources, pairRays)[:, None]).all(axis=1)
+                hits[pairRays[found]] = True
+
+            innerRays = rays[~leaf]
+            innerNodes = np.take(bvh.child, nodes[~leaf])
+            rays = np.concatenate((innerRays, innerRays))
+            nodes = np.concatenate((innerNodes, innerNodes + 1))
+
+    return hits
+
+
+# Two-sided Moller-Trumbore test of ray and triangle pairs,
+# rays are rows of origin and direction xyz
+def intersectTriangles(geometry, rays, tris, maxDistance):
+    ox, oy, oz, dx, dy, dz = rays
+    tri = np.take(geometry.triData, tris, axis=1)
+    sx = ox - tri[0]
+    sy = oy - tri[1]
+    sz = oz - tri[2]
+    e1x, e1y, e1z, e2x, e2y, e2z = tri[3:9]
+
+    px = dy * e2z - dz * e2y
+    py = dz * e2x - dx * e2z
+    pz = dx * e2y - dy * e2x
+    det = e1x * px + e1y * py + e1z * pz
+    valid = np.abs(det) > 1e-12
+    invDet = 1.0 / np.where(valid, det, 1.0)
+
+    qx = sy * e1z - sz * e1y
+    qy = sz * e1x - sx * e1z
+    qz = sx * e1y - sy * e1x
+    u = (sx * px + sy * py + sz * pz) * invDet
+    v = (dx * qx + dy * qy + dz * qz) * invDet
+    t = (e2x * qx + e2y * qy + e2z * qz) * invDet
+    return (
+        valid & (u >= 0.0) & (v >= 0.0) & (u + v <= 1.0) &
+        (t > 0.0) & (t <= maxDistance))
+
+
+# Occlusion of the given vertices, 1.0 when no ray hits anything.
+# Rays start at the vertex offset by bias along its normal.
+# progress is called with the number of vertices traced since
+# the last call, and returning False from it cancels the trace
+# and returns None.
+def getOcclusion(geometry, normals, hemisphere, bias, maxDistance, vertices=None, batchSize=256, progress=None):
+    normals = np.asarray(normals, dtype=np.float64).reshape(-1, 3)
+    if vertices is None:
+        vertices = np.arange(len(geometry.points), dtype=np.int32)
+    else:
+        vertices = np.asarray(vertices, dtype=np.int32)
+    rayCount = len(hemisphere)
+    occlusion = np.ones(len(vertices), dtype=np.float64)
+
+    for batchStart in range(0, len(vertices), batchSize):
+        batch = vertices[batchStart:batchStart + batchSize]
+        directions = orientHemisphere(hemisphere, normals[batch])
+        origins = geometry.points[batch] + bias * normals[batch]
+        hits = traceRays(
+            geometry,
+            np.repeat(origins, rayCount, axis=0),
+            directions.reshape(-1, 3),
+            maxDistance,
+            np.repeat(batch, rayCount))
+        occlusion[batchStart:batchStart + len(batch)] = (
+            1.0 - hits.reshape(-1, rayCount).sum(axis=1) / float(rayCount))
+        if (progress is not None) and not progress(len(batch)):
+            return None
+
+    return occlusion
+
+
+# Copies an array into shared memory. Returns the RawArray
+# and the dtype and shape needed to view it again.
+def shareArray(array):
+    array = np.ascontiguousarray(array)
+    raw = RawArray('b', max(array.nbytes, 1))
+    np.frombuffer(raw, dtype=np.uint8, count=array.nbytes)[:] = (
+        array.view(np.uint8).ravel())
+    return (raw, array.dtype.str, array.shape)
+
+
+def viewArray(shared):
+    raw, dtype, shape = shared
+    count = int(np.prod(shape))
+    return np.frombuffer(raw, dtype=dtype, count=count).reshape(shape)
+
+
+# sharedMeshes holds the shared arrays of each mesh by name,
+# or None for the meshes that are traced serially
+def initWorker(sharedMeshes, bias, maxDistance, batchSize):
+    meshes = []
+    for sharedArrays in sharedMeshes:
+        if sharedArrays is None:
+            meshes.append(None)
+            continue
+        arrays = dict([
+            (name, viewArray(shared)) for name, shared in sharedArrays.items()])
+        meshes.append((fromArrays(arrays), arrays))
+    workerState['meshes'] = meshes
+    workerState['options'] = (bias, maxDistance, batchSize)
+
+
+# Traces the vertices[start:end] of the shared vertex list of a mesh
+# with the sample set of the task
+def traceChunk(task):
+    meshIndex, start, end, hemisphere = task
+    geometry, arrays = workerState['meshes'][meshIndex]
+    bias, maxDistance, batchSize = workerState['options']
+    return getOcclusion(
+        geometry,
+        arrays['normals'],
+        hemisphere,
+        bias,
+        maxDistance,
+        arrays['vertices'][start:end],
+        batchSize)
+
+
+# Traces the vertices of several meshes with any number of sample
+# sets, as in the passes of a progressive bake. meshes is a list of
+# (geometry, normals, vertices) tuples, vertices None for all.
+# Meshes with at least minVertices vertices to trace are split into
+# chunks for a pool of worker processes. Workers 0 uses every core.
+# Chunks are at most chunkSize vertices, and smaller if needed to
+# give each worker several chunks to balance the load. The pool is
+# started on the first parallel trace and kept until close().
+# The host application can not be started as a worker on Windows,
+# so a Python executable to run the workers can be given there.
+class Tracer(object):
+    def __init__(self, meshes, bias, maxDistance, batchSize=256, workers=0, chunkSize=1024, executable=None, minVertices=10000):
+        self.meshes = []
+        for geometry, normals, vertices in meshes:
+            if vertices is None:
+                vertices = np.arange(len(geometry.points), dtype=np.int32)
+            self.meshes.append((
+                geometry,
+                np.asarray(normals, dtype=np.float64).reshape(-1, 3),
+                np.asarray(vertices, dtype=np.int32)))
+        self.bias = bias
+        self.maxDistance = maxDistance
+        self.batchSize = batchSize
+        if workers < 1:
+            workers = multiprocessing.cpu_count()
+        self.workers = workers
+        self.chunkSize = chunkSize
+        self.executable = executable
+        self.minVertices = minVertices
+        self.pool = None
+
+    def isParallel(self, meshIndex):
+        return (
+            (self.workers > 1) and
+            (len(self.meshes[meshIndex][2]) >= max(self.minVertices, 1)))
+
+    def getChunks(self, meshIndex):
+        count = len(self.meshes[meshIndex][2])
+        chunkSize = max(64, min(
+            self.chunkSize, int(math.ceil(count / (self.workers * 4.0)))))
+        return [
+            (start, min(start + chunkSize, count))
+            for start in range(0, count, chunkSize)]
+
+    # Shares the arrays of every parallel mesh at once,
+    # since workers only receive them when they start
+    def getPool(self):
+        if self.pool is None:
+            sharedMeshes = []
+            for idx, (geometry, normals, vertices) in enumerate(self.meshes):
+                if not self.isParallel(idx):
+                    sharedMeshes.append(None)
+                    continue
+                arrays = geometry.getArrays()
+                arrays['normals'] = normals
+                arrays['vertices'] = vertices
+                sharedMeshes.append(dict([
+                    (name, shareArray(array)) for name, array in arrays.items()]))
+
+            if self.executable is not None:
+                multiprocessing.set_executable(self.executable)
+            self.pool = multiprocessing.Pool(
+                self.workers,
+                initializer=initWorker,
+                initargs=(sharedMeshes, self.bias, self.maxDistance, self.batchSize))
+        return self.pool
+
+    # Occlusion of the vertices of one mesh, see getOcclusion
+    def trace(self, meshIndex, hemisphere, progress=None):
+        geometry, normals, vertices = self.meshes[meshIndex]
+        chunks = self.getChunks(meshIndex)
+        if (not self.isParallel(meshIndex)) or (len(chunks) <= 1):
+            return getOcclusion(
+                geometry, normals, hemisphere, self.bias, self.maxDistance,
+                vertices, self.batchSize, progress)
+
+        hemisphere = np.asarray(hemisphere, dtype=np.float64)
+        tasks = [
+            (meshIndex, start, end, hemisphere) for start, end in chunks]
+        results = []
+        for task, result in zip(tasks, self.getPool().imap(traceChunk, tasks)):
+            results.append(result)
+            if (progress is not None) and not progress(task[2] - task[1]):
+                # The remaining chunks are stopped by close()
+                return None
+        return np.concatenate(results)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+
+# Hashes of the points, normals and triangles of vertex ranges
+# of a mesh. Each range must hold whole triangles.
+def getPartHashes(geometry, normals, ranges):
+    hashes = []
+    for start, end in ranges:
+        tris = geometry.triangles[
+            (geometry.triangles[:, 0] >= start) &
+            (geometry.triangles[:, 0] < end)]
+        digest = hashlib.sha1()
+        digest.update(np.ascontiguousarray(geometry.points[start:end]).tobytes())
+        digest.update(np.ascontiguousarray(normals[start:end], dtype=np.float64).tobytes())
+        digest.update(np.ascontiguousarray(tris - start).tobytes())
+        hashes.append(digest.hexdigest())
+    return hashes
+
+
+# For each vertex range, the ranges whose bounding boxes come
+# within distance of it. Rays of a range can only reach those.
+def getNeighbors(geometry, ranges, distance):
+    boundsMin = np.array([
+        geometry.points[start:end].min(axis=0) for start, end in ranges])
+    boundsMax = np.array([
+        geometry.points[start:end].max(axis=0) for start, end in ranges])
+    neighbors = []
+    for idx in range(len(ranges)):
+        near = (
+            (boundsMin <= boundsMax[idx] + distance) &
+            (boundsMax >= boundsMin[idx] - distance)).all(axis=1)
+        neighbors.append(np.flatnonzero(near).tolist())
+    return neighbors
+
+
+# JSON encodes str and unicode settings, and tuples and lists,
+# the same way, so equal settings always give the same key
+def getCacheKey(*items):
+    return hashlib.sha1(
+        json.dumps(items, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+# Returns the cached occlusion of key, or None if there is no
+# readable entry with count values
+def loadCache(directory, key, count):
+    path = os.path.join(directory, key + '.npz')
+    if not os.path.isfile(path):
+        return None
+    try:
+        data = np.load(path)
+        values = data['occlusion']
+        data.close()
+    except (IOError, OSError, KeyError, ValueError):
+        return None
+    if len(values) != count:
+        return None
+    return values
+
+
+def saveCache(directory, key, values):
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    np.savez_compressed(
+        os.path.join(directory, key + '.npz'),
+        occlusion=np.asarray(values, dtype=np.float32))
+
+
+# Rays per second of a random triangle soup, comparable between
+# machines and versions. The baker in ToolActions compares this
+# engine against MFnMesh.anyIntersection on real meshes.
+def benchmark(numTris=20000, numVertices=2000, rayCount=64, repeats=3, method='hammersley'):
+    random = np.random.RandomState(0)
+    centers = random.uniform(-1.0, 1.0, (numTris, 1, 3))
+    points = (centers + random.uniform(-0.05, 0.05, (numTris, 3, 3))).reshape(-1, 3)
+    triangles = np.arange(numTris * 3, dtype=np.int32).reshape(-1, 3)
+
+    startTime = time.time()
+    geometry = buildGeometry(points, triangles)
+    buildTime = time.time() - startTime
+
+    normals = random.normal(size=(len(points), 3))
+    vertices = np.arange(numVertices, dtype=np.int32)
+    hemisphere = getHemisphere(rayCount, method)
+    times = []
+    for i in range(repeats):
+        startTime = time.time()
+        getOcclusion(geometry, normals, hemisphere, 0.000001, 10.0, vertices)
+        times.append(time.time() - startTime)
+
+    raysPerSecond = numVertices * rayCount / max(min(times), 1e-9)
+    print(
+        'SX Tools: BVH of ' + str(numTris) + ' triangles built in ' +
+        str(round(buildTime * 1000.0, 3)) + ' ms, ' +
+        str(int(raysPerSecond)) + ' rays per second')
+    return raysPerSecond
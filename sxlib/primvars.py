@@ -0,0 +1,146 @@
+# ----------------------------------------------------------------------------
+#   SX Tools - Maya vertex painting toolkit
+#   (c) 2017-2019  Jani Kahrama / Secret Exit Ltd
+#   Released under MIT license
+#
+#   Snapshot of the layer primVars (visibility, blend mode, shading
+#   mode) of layered shapes. All primVars of a shape are read in one
+#   pass through its dependency node plugs instead of one getAttr
+#   command per value. Entries are keyed by node, not by name, so
+#   renames of the shape or its parents do not affect them, and stay
+#   valid until an attribute changed callback reports a write to one
+#   of the cached primVars or the node is removed.
+# ----------------------------------------------------------------------------
+
+import maya.cmds
+import maya.api.OpenMaya as OM
+import sxglobals
+
+
+class PrimVarCache(object):
+    def __init__(self):
+        self.shapeDict = {}
+        self.callbackDict = {}
+        self.attrNames = set()
+        return None
+
+    def __del__(self):
+        self.clear()
+        print('SX Tools: Exiting primvars')
+
+    def getAttrNames(self):
+        attrNames = set(['shadingMode', ])
+        for layer in sxglobals.settings.refArray:
+            attrNames.add(str(layer) + 'Visibility')
+            attrNames.add(str(layer) + 'BlendMode')
+        return attrNames
+
+    def getNode(self, shape):
+        selectionList = OM.MSelectionList()
+        selectionList.add(str(shape))
+        mObject = selectionList.getDependNode(0)
+        return (OM.MObjectHandle(mObject).hashCode(), mObject)
+
+    # A deleted node can be replaced by another with the same hash code
+    def getEntry(self, hashCode, mObject):
+        entry = self.shapeDict.get(hashCode)
+        if ((entry is None) or
+           (not entry['handle'].isValid()) or
+           (entry['handle'].object() != mObject)):
+            return None
+        return entry
+
+    # Reads the primVars of every given shape that is not cached yet
+    def snapshot(self, shapes):
+        if len(self.attrNames) == 0:
+            self.attrNames = self.getAttrNames()
+
+        for shape in shapes:
+            hashCode, mObject = self.getNode(shape)
+            if self.getEntry(hashCode, mObject) is None:
+                self.addEntry(hashCode, mObject)
+
+    def addEntry(self, hashCode, mObject):
+        MFnDependencyNode = OM.MFnDependencyNode(mObject)
+        values = {}
+        for attrName in self.attrNames:
+            if MFnDependencyNode.hasAttribute(attrName):
+                values[attrName] = MFnDependencyNode.findPlug(
+                    attrName, False).asDouble()
+        self.shapeDict[hashCode] = {
+            'handle': OM.MObjectHandle(mObject),
+            'values': values}
+        self.addCallbacks(hashCode, mObject)
+        return self.shapeDict[hashCode]
+
+    def getShapeVars(self, shape):
+        if len(self.attrNames) == 0:
+            self.attrNames = self.getAttrNames()
+
+        hashCode, mObject = self.getNode(shape)
+        entry = self.getEntry(hashCode, mObject)
+        if entry is None:
+            entry = self.addEntry(hashCode, mObject)
+        return entry['values']
+
+    # Drop-in for maya.cmds.getAttr(shape + '.' + attrName)
+    def getAttr(self, shape, attrName):
+        values = self.getShapeVars(shape)
+        if attrName in values:
+            return values[attrName]
+        return maya.cmds.getAttr(str(shape) + '.' + attrName)
+
+    # Visibility and blend mode of every color layer in the stack
+    def getLayerState(self, shape, numLayers):
+        values = self.getShapeVars(shape)
+        state = []
+        for i in range(1, numLayers + 1):
+            layer = 'layer' + str(i)
+            visible = bool(values[layer + 'Visibility'])
+            if i == 1:
+                mode = 0
+            else:
+                mode = int(values[layer + 'BlendMode'])
+            state.append((visible, mode))
+        return state
+
+    # Callbacks are registered once per node. A deleted node
+    # keeps its callbacks until the delete can no longer be
+    # undone, so a node that comes back reuses them.
+    def addCallbacks(self, hashCode, mObject):
+        if hashCode in self.callbackDict:
+            handle, callbackIDs = self.callbackDict[hashCode]
+            if handle.isValid() and (handle.object() == mObject):
+                return
+            self.removeCallbacks(callbackIDs)
+        self.callbackDict[hashCode] = (
+            OM.MObjectHandle(mObject), (
+                OM.MNodeMessage.addAttributeChangedCallback(
+                    mObject,
+                    lambda msg, plug, *args:
+                        self.attributeChanged(hashCode, plug)),
+                OM.MNodeMessage.addNodePreRemovalCallback(
+                    mObject,
+                    lambda *args: self.invalidate(hashCode))))
+
+    def removeCallbacks(self, callbackIDs):
+        for callbackID in callbackIDs:
+            # Callbacks of deleted nodes are already gone
+            try:
+                OM.MMessage.removeCallback(callbackID)
+            except RuntimeError:
+                pass
+
+    def attributeChanged(self, hashCode, plug):
+        if plug.partialName(useLongNames=True) in self.attrNames:
+            self.invalidate(hashCode)
+
+    def invalidate(self, hashCode):
+        self.shapeDict.pop(hashCode, None)
+
+    def clear(self):
+        self.shapeDict.clear()
+        self.attrNames = set()
+        for handle, callbackIDs in self.callbackDict.values():
+            self.removeCallbacks(callbackIDs)
+        self.callbackDict.clear()
@@ -0,0 +1,169 @@
+# ----------------------------------------------------------------------------
+#   SX Tools - Maya vertex painting toolkit
+#   (c) 2017-2019  Jani Kahrama / Secret Exit Ltd
+#   Released under MIT license
+#
+#   Timing of the refresh phases, compositing, tools and export
+#   stages. Entry points are wrapped with the profile decorator,
+#   and while profiling is enabled every call is recorded with its
+#   wall time, nesting depth and the size of the selected meshes
+#   into a ring buffer of the latest samples. The summary can be
+#   shown in the SX Tools dock, or dumped to JSON or CSV files
+#   for tracking performance between versions.
+# ----------------------------------------------------------------------------
+
+import maya.cmds
+import maya.api.OpenMaya as OM
+import collections
+import contextlib
+import functools
+import timeit
+import time
+import json
+import csv
+import sxglobals
+
+
+# Records the decorated function as the named section
+# when the profiler exists and is enabled
+def profile(name):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            profiler = getattr(sxglobals, 'profiler', None)
+            if (profiler is None) or not profiler.enabled:
+                return function(*args, **kwargs)
+            with profiler.section(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class Profiler(object):
+    def __init__(self):
+        self.enabled = sxglobals.settings.tools['profilerEnable']
+        self.samples = collections.deque(
+            maxlen=sxglobals.settings.tools['profilerSamples'])
+        self.stack = []
+        self.meshSize = (0, 0)
+        return None
+
+    def __del__(self):
+        print('SX Tools: Exiting profiler')
+
+    def setEnabled(self, enabled):
+        self.enabled = enabled
+        sxglobals.settings.tools['profilerEnable'] = enabled
+        maxSamples = sxglobals.settings.tools['profilerSamples']
+        if self.samples.maxlen != maxSamples:
+            self.samples = collections.deque(self.samples, maxlen=maxSamples)
+
+    # Number of shapes and face vertices in the selection,
+    # measured once per outermost section
+    def getMeshSize(self, shapes):
+        faceVertices = 0
+        for shape in shapes:
+            try:
+                selectionList = OM.MSelectionList()
+                selectionList.add(str(shape))
+                faceVertices += OM.MFnMesh(
+                    selectionList.getDagPath(0)).numFaceVertices
+            except RuntimeError:
+                pass
+        return (len(shapes), faceVertices)
+
+    @contextlib.contextmanager
+    def section(self, name):
+        if not self.enabled:
+            yield
+            return
+
+        if len(self.stack) == 0:
+            self.meshSize = self.getMeshSize(sxglobals.settings.shapeArray)
+        self.stack.append(name)
+        startTime = timeit.default_timer()
+        try:
+            yield
+        finally:
+            duration = timeit.default_timer() - startTime
+            self.stack.pop()
+            self.record(name, duration)
+
+    # Adds a sample of a section timed elsewhere
+    def record(self, name, duration):
+        if not self.enabled:
+            return
+        self.samples.append({
+            'time': time.time(),
+            'name': name,
+            'duration': duration,
+            'depth': len(self.stack),
+            'shapes': self.meshSize[0],
+            'faceVertices': self.meshSize[1]})
+
+    # Returns (name, count, total, mean, max) of every
+    # section in the buffer, largest total time first
+    def getSummary(self):
+        sections = collections.OrderedDict()
+        for sample in self.samples:
+            durations = sections.setdefault(sample['name'], [])
+            durations.append(sample['duration'])
+
+        summary = []
+        for name, durations in sections.items():
+            summary.append((
+                name,
+                len(durations),
+                sum(durations),
+                sum(durations) / len(durations),
+                max(durations)))
+        summary.sort(key=lambda item: item[2], reverse=True)
+        return summary
+
+    def getSummaryText(self):
+        lines = ['%-28s %6s %9s %9s %9s' % (
+            'Section', 'Count', 'Total', 'Mean', 'Max')]
+        for name, count, total, mean, maximum in self.getSummary():
+            lines.append('%-28s %6d %9.4f %9.4f %9.4f' % (
+                name, count, total, mean, maximum))
+        return '\n'.join(lines)
+
+    def printSummary(self):
+        print('SX Tools: Profiler summary of ' + str(len(self.samples)) + ' samples')
+        print(self.getSummaryText())
+
+    def dumpJSON(self, filePath):
+        with open(filePath, 'w') as output:
+            json.dump({
+                'samples': list(self.samples),
+                'summary': [
+                    dict(zip(('name', 'count', 'total', 'mean', 'max'), item))
+                    for item in self.getSummary()]},
+                output, indent=4)
+        print('SX Tools: Profiler samples saved to ' + filePath)
+
+    def dumpCSV(self, filePath):
+        fields = ('time', 'name', 'duration', 'depth', 'shapes', 'faceVertices')
+        with open(filePath, 'wb') as output:
+            writer = csv.DictWriter(output, fieldnames=fields)
+            writer.writeheader()
+            for sample in self.samples:
+                writer.writerow(sample)
+        print('SX Tools: Profiler samples saved to ' + filePath)
+
+    def saveSamples(self, fileType):
+        filePath = maya.cmds.fileDialog2(
+            dialogStyle=2,
+            fileMode=0,
+            caption='Save Profiler Samples',
+            fileFilter=fileType.upper() + ' (*.' + fileType + ')')
+        if filePath is None:
+            print('SX Tools: No profiler file selected')
+        elif fileType == 'json':
+            self.dumpJSON(filePath[0])
+        else:
+            self.dumpCSV(filePath[0])
+
+    def clear(self):
+        self.samples.clear()
+        del self.stack[:]
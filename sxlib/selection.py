@@ -0,0 +1,238 @@
+# ----------------------------------------------------------------------------
+#   SX Tools - Maya vertex painting toolkit
+#   (c) 2017-2019  Jani Kahrama / Secret Exit Ltd
+#   Released under MIT license
+#
+#   Snapshot of the active selection. Shapes, transforms and
+#   components are resolved in one pass over the active selection
+#   list instead of a chain of ls, listRelatives and filterExpand
+#   commands. The history and multiple shape checks of each object
+#   are cached until a DAG, connection or name change callback
+#   reports an edit to the scene.
+# ----------------------------------------------------------------------------
+
+import maya.cmds
+import maya.api.OpenMaya as OM
+import collections
+
+
+Snapshot = collections.namedtuple(
+    'Snapshot', [
+        'selection',
+        'shapes',
+        'objects',
+        'components',
+        'history',
+        'multiShapes',
+        'multiShapeShapes'])
+
+
+class SelectionCache(object):
+    def __init__(self):
+        self.snapshot = None
+        self.objectDict = {}
+        self.callbackIDs = []
+        # History nodes that are part of every layered object
+        self.ignoredHistory = (
+            'assetsLayer',
+            'exportsLayer',
+            'sxCrease',
+            'sxSubMesh',
+            'set',
+            'groupId',
+            'topoSymmetrySet')
+        self.componentTypes = (
+            OM.MFn.kMeshVertComponent,
+            OM.MFn.kMeshEdgeComponent,
+            OM.MFn.kMeshPolygonComponent,
+            OM.MFn.kMeshVtxFaceComponent)
+        return None
+
+    def __del__(self):
+        self.clear()
+        print('SX Tools: Exiting selection')
+
+    # Resolves the active selection into a new Snapshot,
+    # following the rules of the former command based selectionManager
+    def update(self):
+        selectionList = OM.MGlobal.getActiveSelectionList()
+        selection = selectionList.getSelectionStrings()
+
+        shapes = []
+        selectedShapes = []
+        componentShapes = []
+        hasComponents = False
+        hasObjectSet = False
+
+        selectionIter = OM.MItSelectionList(selectionList)
+        while not selectionIter.isDone():
+            if selectionIter.itemType() != OM.MItSelectionList.kDagSelectionItem:
+                if selectionIter.getDependNode().hasFn(OM.MFn.kSet):
+                    hasObjectSet = True
+            elif selectionIter.hasComponents():
+                dagPath, component = selectionIter.getComponent()
+                if component.apiType() in self.componentTypes:
+                    hasComponents = True
+                try:
+                    dagPath.extendToShape()
+                except RuntimeError:
+                    pass
+                if dagPath.apiType() == OM.MFn.kMesh:
+                    componentShapes.append(dagPath.fullPathName())
+            else:
+                root = selectionIter.getDagPath()
+                if root.apiType() == OM.MFn.kMesh:
+                    selectedShapes.append(root.fullPathName())
+                dagIter = OM.MItDag(OM.MItDag.kDepthFirst, OM.MFn.kMesh)
+                dagIter.reset(root, OM.MItDag.kDepthFirst, OM.MFn.kMesh)
+                while not dagIter.isDone():
+                    fullPath = dagIter.fullPathName()
+                    if fullPath != root.fullPathName():
+                        shapes.append(fullPath)
+                    dagIter.next()
+            selectionIter.next()
+
+        shapes = self.unique(shapes)
+        objects = self.getParents(shapes, False)
+
+        # If only shape nodes are selected
+        onlyShapes = True
+        for item in selection:
+            if 'Shape' not in str(item):
+                onlyShapes = False
+        if onlyShapes:
+            shapes = list(selection)
+            objects = self.getParents(shapes, True)
+
+        # Maintain correct object selection
+        # even if only components are selected
+        if (len(shapes) == 0) and hasComponents:
+            shapes = self.unique(componentShapes + selectedShapes)
+            objects = self.getParents(shapes, True)
+
+        components = []
+        # The case when the user selects a component set
+        if hasComponents and not hasObjectSet:
+            components = maya.cmds.filterExpand(
+                selection, sm=(31, 32, 34, 70)) or []
+
+        history, multiShapes, multiShapeShapes = self.checkObjects(objects)
+        self.snapshot = Snapshot(
+            tuple(selection),
+            tuple(shapes),
+            tuple(objects),
+            tuple(components),
+            history,
+            multiShapes,
+            tuple(multiShapeShapes))
+        return self.snapshot
+
+    def unique(self, items):
+        seen = set()
+        uniqueItems = []
+        for item in items:
+            if item not in seen:
+                seen.add(item)
+                uniqueItems.append(item)
+        return uniqueItems
+
+    # Parent transforms of shapes, as full paths or
+    # as the shortest unique names like ls returns them
+    def getParents(self, shapes, fullPath):
+        parents = []
+        for shape in shapes:
+            selectionList = OM.MSelectionList()
+            selectionList.add(str(shape))
+            dagPath = selectionList.getDagPath(0)
+            dagPath.pop()
+            if fullPath:
+                parents.append(dagPath.fullPathName())
+            else:
+                parents.append(dagPath.partialPathName())
+        return self.unique(parents)
+
+    # History and multiple shape checks of the selected objects.
+    # Stops at deforming export meshes and skinning meshes.
+    def checkObjects(self, objects):
+        history = False
+        multiShapes = False
+        multiShapeShapes = []
+
+        for obj in objects:
+            objectState = self.getObjectState(obj)
+            if objectState['exportMesh']:
+                print('SX Tools: Deforming export mesh selected')
+                break
+            if '_skinned' in obj:
+                print('SX Tools: Skinning Mesh Selected')
+                break
+
+            if len(objectState['history']) > 0:
+                print('SX Tools: History found: ' + str(objectState['history']))
+                history = True
+
+            if len(objectState['shapes']) > 1:
+                print('SX Tools: Multiple shape nodes in ' + str(obj))
+                multiShapes = True
+                multiShapeShapes.extend(objectState['extraShapes'])
+
+        return (history, multiShapes, multiShapeShapes)
+
+    def getObjectState(self, obj):
+        if obj in self.objectDict:
+            return self.objectDict[obj]
+
+        objName = str(obj).rstrip('0123456789')
+        if '|' in objName:
+            objName = objName.rsplit('|', 1)[1]
+
+        histList = [
+            hist for hist in (maya.cmds.listHistory(obj) or [])
+            if (objName not in str(hist)) and not any(
+                [ignored in str(hist) for ignored in self.ignoredHistory])]
+        shapeList = maya.cmds.listRelatives(
+            obj, shapes=True, fullPath=True) or []
+
+        extraShapes = []
+        if len(shapeList) > 1:
+            for shape in shapeList:
+                if '|' in shape:
+                    shapeShort = shape.rsplit('|', 1)[1]
+                if objName not in shapeShort:
+                    extraShapes.append(shape)
+
+        objectState = {
+            'exportMesh': maya.cmds.attributeQuery(
+                'exportMesh', node=obj, exists=True),
+            'history': histList,
+            'shapes': shapeList,
+            'extraShapes': extraShapes}
+        self.objectDict[obj] = objectState
+        self.addCallbacks()
+        return objectState
+
+    # Any new connection, DAG change or rename can change the
+    # history or the shapes of a cached object
+    def addCallbacks(self):
+        if len(self.callbackIDs) > 0:
+            return
+        self.callbackIDs = [
+            OM.MDGMessage.addConnectionCallback(
+                lambda *args: self.invalidate()),
+            OM.MDagMessage.addAllDagChangesCallback(
+                lambda *args: self.invalidate()),
+            OM.MNodeMessage.addNameChangedCallback(
+                OM.MObject(), lambda *args: self.invalidate())]
+
+    def invalidate(self):
+        self.objectDict.clear()
+
+    def clear(self):
+        self.snapshot = None
+        self.objectDict.clear()
+        for callbackID in self.callbackIDs:
+            try:
+                OM.MMessage.removeCallback(callbackID)
+            except RuntimeError:
+                pass
+        self.callbackIDs = []
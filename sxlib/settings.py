@@ -49,7 +49,8 @@ class Settings(object):
             'gradientCollapse': True,
             'copyLayerCollapse': True,
             'swapLayerSetsCollapse': True,
-            'exportFlagsCollapse': True
+            'exportFlagsCollapse': True,
+            'profilerCollapse': False
         }
         self.tools = {
             'currentTool': None,
@@ -58,6 +59,19 @@ class Settings(object):
             'platform': 'win64',
             'lineHeight': 14.5,
             'compositeEnable': True,
+            'compositeWorkers': 1,
+            'compositeCacheSize': 256,
+            'libraryPageSize': 20,
+            'profilerEnable': False,
+            'profilerSamples': 1000,
+            'startupBudget': 1.0,
+            'occlusionBatchSize': 256,
+            'occlusionWorkers': 0,
+            'occlusionChunkSize': 1024,
+            'occlusionProgressive': True,
+            'occlusionPasses': (16, 64),
+            'occlusionSampling': 'hammersley',
+            'occlusionCache': True,
             'recentPaletteIndex': 1,
             'overwriteAlpha': False,
             'noiseMonochrome': False,
@@ -394,11 +408,13 @@ class Settings(object):
                         tempDict = json.load(input)
                         del self.masterPaletteArray[:]
                         self.masterPaletteArray = tempDict['Palettes']
+                        sxglobals.library.invalidate(1)
                     elif mode == 2:
                         tempDict = {}
                         tempDict = json.load(input)
                         del self.materialArray[:]
                         self.materialArray = tempDict['Materials']
+                        sxglobals.library.invalidate(2)
                     input.close()
             except ValueError:
                 print('SX Tools Error: Invalid ' + modeName + ' file.')
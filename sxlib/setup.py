@@ -5,13 +5,13 @@
 #
 #   ShaderFX network generation based on work by Steve Theodore
 #   https://github.com/theodox/sfx
+#
+#   The sfx modules are imported inside the shader creation methods,
+#   so loading setup does not pull in the ShaderFX node definitions.
 # ----------------------------------------------------------------------------
 
 import maya.cmds
-from sfx import SFXNetwork
-from sfx import StingrayPBSNetwork
-import sfx.sfxnodes as sfxnodes
-import sfx.pbsnodes as pbsnodes
+import sxlib.blendmodes as blendmodes
 import sxglobals
 
 
@@ -29,6 +29,8 @@ class SceneSetup(object):
                        smoothness=False,
                        transmission=False,
                        emission=False):
+        from sfx import SFXNetwork
+        import sfx.sfxnodes as sfxnodes
         if maya.cmds.objExists('SXShader'):
             maya.cmds.delete('SXShader')
             print('SX Tools: Updating default materials')
@@ -288,6 +290,8 @@ class SceneSetup(object):
                 maya.cmds.sets(mesh, e=True, forceElement='SXShaderSG')
 
     def createSXExportShader(self):
+        from sfx import SFXNetwork
+        import sfx.sfxnodes as sfxnodes
         if maya.cmds.objExists('SXExportShader'):
             maya.cmds.delete('SXExportShader')
         if maya.cmds.objExists('SXExportShaderSG'):
@@ -622,6 +626,8 @@ class SceneSetup(object):
 #   'SXExportShader.msg', ':defaultShaderList1.s', na=True)
 
     def createSXExportShader(self):
+        from sfx import SFXNetwork
+        import sfx.sfxnodes as sfxnodes
         if maya.cmds.objExists('SXExportShader'):
             maya.cmds.delete('SXExportShader')
         if maya.cmds.objExists('SXExportShaderSG'):
@@ -934,6 +940,8 @@ class SceneSetup(object):
         #   'SXExportShader.msg', ':defaultShaderList1.s', na=True)
 
     def createSXExportOverlayShader(self):
+        from sfx import SFXNetwork
+        import sfx.sfxnodes as sfxnodes
         if maya.cmds.objExists('SXExportOverlayShader'):
             maya.cmds.delete('SXExportOverlayShader')
         if maya.cmds.objExists('SXExportOverlayShaderSG'):
@@ -1076,6 +1084,8 @@ class SceneSetup(object):
         #   'SXExportShader.msg', ':defaultShaderList1.s', na=True)
 
     def createSXPBShader(self):
+        from sfx import StingrayPBSNetwork
+        import sfx.pbsnodes as pbsnodes
         if maya.cmds.objExists('SXPBShader'):
             maya.cmds.delete('SXPBShader')
         if maya.cmds.objExists('SXPBShaderSG'):
@@ -1368,14 +1378,20 @@ class SceneSetup(object):
             setUpdated = True
         return setUpdated
 
-    def setPrimVars(self):
+    # Adds any missing primVars to the given objects and shapes,
+    # by default to the current selection
+    def setPrimVars(self, objects=None, shapes=None):
+        if objects is None:
+            objects = sxglobals.settings.objectArray
+        if shapes is None:
+            shapes = sxglobals.settings.shapeArray
         refLayers = sxglobals.layers.sortLayers(
             sxglobals.settings.project['LayerData'].keys())
 
         if refLayers == 'layer1':
             refLayers = 'layer1',
 
-        for obj in sxglobals.settings.objectArray:
+        for obj in objects:
             flagList = maya.cmds.listAttr(obj, ud=True)
             if flagList is None:
                 flagList = []
@@ -1415,7 +1431,7 @@ class SceneSetup(object):
                     ln='versionIdentifier',
                     at='byte', min=0, max=255, dv=1)
 
-        for shape in sxglobals.settings.shapeArray:
+        for shape in shapes:
             attrList = maya.cmds.listAttr(shape, ud=True)
             if attrList is None:
                 attrList = []
@@ -1490,6 +1506,7 @@ class SceneSetup(object):
                     ln='emissionBlendMode',
                     at='double', min=0, max=2, dv=0)
 
+            maxBlendMode = len(blendmodes.blendModes) - 1
             for k in range(0, sxglobals.settings.project['LayerCount']):
                 blendName = str(refLayers[k]) + 'BlendMode'
                 visName = str(refLayers[k]) + 'Visibility'
@@ -1497,7 +1514,14 @@ class SceneSetup(object):
                     maya.cmds.addAttr(
                         shape,
                         ln=blendName,
-                        at='double', min=0, max=2, dv=0)
+                        at='double', min=0, max=maxBlendMode, dv=0)
+                # Layers created before new blend modes were added
+                elif maya.cmds.attributeQuery(
+                        blendName, node=shape, maximum=True)[0] < maxBlendMode:
+                    maya.cmds.addAttr(
+                        shape + '.' + blendName,
+                        edit=True,
+                        max=maxBlendMode)
                 if (visName not in attrList):
                     maya.cmds.addAttr(
                         shape,
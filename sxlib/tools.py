@@ -11,6 +11,9 @@ import maya.cmds
 import maya.api.OpenMaya as OM
 import math
 import random
+import os
+import sys
+import sxlib.profiler as profiler
 import sxglobals
 
 
@@ -21,6 +24,7 @@ class ToolActions(object):
     def __del__(self):
         print('SX Tools: Exiting tools')
 
+    @profiler.profile('tools.assignToCreaseSet')
     def assignToCreaseSet(self, setName):
         modifiers = maya.cmds.getModifiers()
         shift = bool((modifiers & 1) > 0)
@@ -64,6 +68,7 @@ class ToolActions(object):
                 maya.cmds.sets(
                     edgeList, forceElement=setName)
 
+    @profiler.profile('tools.clearCreases')
     def clearCreases(self):
         creaseSets = (
             'sxCrease0',
@@ -102,6 +107,7 @@ class ToolActions(object):
 
     # Apply selected crease value to any convex or concave edge
     # beyond a user-adjusted threshold
+    @profiler.profile('tools.curvatureSelect')
     def curvatureSelect(self, objects):
         convexThreshold = maya.cmds.getAttr(
             'SXCreaseRamp.colorEntryList[2].position')
@@ -191,6 +197,7 @@ class ToolActions(object):
 
         maya.cmds.select(selEdges)
 
+    @profiler.profile('tools.calculateCurvature')
     def calculateCurvature(self, objects, returnColors=False, normalize=False):
         objCurvatures = []
         objColors = []
@@ -321,6 +328,374 @@ class ToolActions(object):
 
         return OM.MVector(x, y, math.sqrt(max(0, 1 - u1)))
 
+    # World space points, triangles and vertex normals of a mesh
+    # for the NumPy ray caster in sxlib.occlusion
+    def getOcclusionGeometry(self, MFnMesh, weighted):
+        import numpy as np
+        import sxlib.occlusion as occlusion
+
+        points = np.array(
+            [(point.x, point.y, point.z)
+             for point in MFnMesh.getPoints(OM.MSpace.kWorld)])
+        normals = np.array(
+            [(normal.x, normal.y, normal.z)
+             for normal in MFnMesh.getVertexNormals(weighted, OM.MSpace.kWorld)])
+        triangles = np.array(MFnMesh.getTriangles()[1], dtype=np.int32)
+        return (occlusion.buildGeometry(points, triangles), normals)
+
+    # Tracer of the given (geometry, normals, vertices) bake meshes,
+    # each traced against itself. Meshes with enough vertices are
+    # split across worker processes, started once per tracer.
+    def getOcclusionTracer(self, meshes, bias, max):
+        import sxlib.occlusion as occlusion
+
+        # Workers can not be started with maya.exe
+        executable = None
+        if sys.platform == 'win32':
+            executable = os.path.join(
+                os.path.dirname(sys.executable), 'mayapy.exe')
+
+        return occlusion.Tracer(
+            meshes,
+            bias,
+            max,
+            sxglobals.settings.tools['occlusionBatchSize'],
+            sxglobals.settings.tools['occlusionWorkers'],
+            sxglobals.settings.tools['occlusionChunkSize'],
+            executable)
+
+    # Occlusion of the vertices of one mesh. Returns None
+    # if progress cancels the trace.
+    def getOcclusion(self, geometry, normals, hemisphere, bias, max, vertices=None, progress=None):
+        tracer = self.getOcclusionTracer(
+            [(geometry, normals, vertices), ], bias, max)
+        try:
+            return tracer.trace(0, hemisphere, progress)
+        finally:
+            tracer.close()
+
+    # The former occlusion loop with one anyIntersection call per ray,
+    # kept as the reference for benchmarkOcclusion
+    def getOcclusionAPI(self, MFnMesh, rayCount, bias, max, weighted, vertices):
+        contribution = 1.0/float(rayCount)
+        accelGrid = MFnMesh.autoUniformGridParams()
+        vtxPoints = MFnMesh.getPoints(OM.MSpace.kWorld)
+        vtxFloatNormals = MFnMesh.getVertexNormals(weighted, OM.MSpace.kWorld)
+
+        hemiSphere = OM.MVectorArray()
+        hemiSphere.setLength(rayCount)
+        for idx in xrange(rayCount):
+            hemiSphere[idx] = self.rayRandomizer()
+
+        occValues = []
+        vtxIt = OM.MItMeshVertex(MFnMesh.dagPath())
+        for i in vertices:
+            vtxIt.setIndex(i)
+            vtxNormal = vtxIt.getNormal()
+            point = OM.MFloatPoint(vtxPoints[i])
+            point = point + bias*vtxFloatNormals[i]
+            occValue = 1.0
+            forward = OM.MVector(OM.MVector.kZaxisVector)
+            rotQuat = forward.rotateTo(vtxNormal)
+
+            for e in xrange(rayCount):
+                result = MFnMesh.anyIntersection(
+                    point,
+                    OM.MFloatVector(hemiSphere[e].rotateBy(rotQuat)),
+                    OM.MSpace.kWorld,
+                    max,
+                    False,
+                    accelParams=accelGrid,
+                    tolerance=0.001)
+                if result[2] != -1:
+                    occValue = occValue - contribution
+            occValues.append(occValue)
+
+        MFnMesh.freeCachedIntersectionAccelerator()
+        return occValues
+
+    # Compares the rays per second of both occlusion paths
+    # on a sample of vertices of the last selected shape
+    def benchmarkOcclusion(self, rayCount=250, sampleCount=200):
+        import sxlib.occlusion as occlusion
+
+        shape = sxglobals.settings.shapeArray[len(sxglobals.settings.shapeArray)-1]
+        selectionList = OM.MSelectionList()
+        selectionList.add(shape)
+        MFnMesh = OM.MFnMesh(selectionList.getDagPath(0))
+        step = max(1, MFnMesh.numVertices // sampleCount)
+        vertices = range(0, MFnMesh.numVertices, step)
+        numRays = float(len(vertices) * rayCount)
+
+        bias = sxglobals.settings.tools['bias']
+        maxDistance = sxglobals.settings.tools['maxDistance']
+
+        startTime = maya.cmds.timerX()
+        apiValues = self.getOcclusionAPI(
+            MFnMesh, rayCount, bias, maxDistance, True, vertices)
+        apiTime = maya.cmds.timerX(startTime=startTime)
+
+        startTime = maya.cmds.timerX()
+        geometry, normals = self.getOcclusionGeometry(MFnMesh, True)
+        values = self.getOcclusion(
+            geometry,
+            normals,
+            occlusion.getHemisphere(
+                rayCount, sxglobals.settings.tools['occlusionSampling']),
+            bias,
+            maxDistance,
+            vertices).tolist()
+        totalTime = maya.cmds.timerX(startTime=startTime)
+
+        for label, duration in (('anyIntersection', apiTime), ('BVH', totalTime)):
+            print(
+                'SX Tools: ' + label + ' ' +
+                str(int(numRays / max(duration, 0.001))) + ' rays per second')
+
+        difference = sum(
+            [abs(a - b) for a, b in zip(apiValues, values)]) / len(vertices)
+        print('SX Tools: Mean occlusion difference ' + str(round(difference, 4)))
+
+    def getOcclusionCacheDir(self):
+        return os.path.join(
+            maya.cmds.workspace(query=True, rootDirectory=True),
+            'cache', 'sxtools', 'occlusion')
+
+    def clearOcclusionCache(self):
+        cacheDir = self.getOcclusionCacheDir()
+        if os.path.isdir(cacheDir):
+            for fileName in os.listdir(cacheDir):
+                if fileName.endswith('.npz'):
+                    os.remove(os.path.join(cacheDir, fileName))
+        print('SX Tools: Occlusion cache cleared')
+
+    def setOcclusionColors(self, MFnMesh, values):
+        MFnMesh.setVertexColors(
+            OM.MColorArray(
+                [OM.MColor((value, value, value, 1.0))
+                 for value in values.tolist()]),
+            OM.MIntArray(range(len(values))))
+
+    # Colors of the current colorSet of a mesh, saved before a bake
+    # writes its passes there, so a cancelled bake can put them back
+    def getOriginalColors(self, MFnMesh):
+        return MFnMesh.getFaceVertexColors(
+            colorSet=MFnMesh.currentColorSetName())
+
+    def restoreOriginalColors(self, MFnMesh, colors):
+        topology = sxglobals.topology.getTopology(
+            MFnMesh.fullPathName(), MFnMesh)
+        MFnMesh.setFaceVertexColors(
+            colors, topology['faceIdArray'], topology['vtxIdArray'])
+
+    # Splits the vertices of a bake mesh into parts with their own
+    # cache keys. A local bake is one part. The combo mesh of the
+    # global pass, always the last bake, holds the vertices of the
+    # other bakes in order, followed by the ground plane. The key of
+    # each of its parts covers the parts within ray distance, so an
+    # edit only re-traces the parts that the edited one can occlude.
+    def getOcclusionParts(self, geometry, normals, meshes, isCombo, params, distance):
+        import sxlib.occlusion as occlusion
+
+        numVtx = len(geometry.points)
+        ranges = [(0, numVtx), ]
+        neighbors = [[0, ], ]
+        if isCombo:
+            start = 0
+            comboRanges = []
+            for mesh in meshes:
+                end = start + len(mesh['geometry'].points)
+                comboRanges.append((start, end))
+                start = end
+            if start < numVtx:
+                comboRanges.append((start, numVtx))
+            if start <= numVtx:
+                ranges = comboRanges
+                neighbors = occlusion.getNeighbors(geometry, ranges, distance)
+
+        hashes = occlusion.getPartHashes(geometry, normals, ranges)
+        parts = []
+        for idx, (start, end) in enumerate(ranges):
+            parts.append((start, end, occlusion.getCacheKey(
+                params,
+                isCombo,
+                hashes[idx],
+                [hashes[neighbor] for neighbor in neighbors[idx]])))
+        return parts
+
+    # Traces the bake meshes in passes of increasing ray counts. Each
+    # pass adds a shifted sample set of new rays to the earlier ones,
+    # writes the result to the mesh and redraws the viewport, so the
+    # bake can be watched improving. Cancelling keeps the last finished
+    # pass of each mesh, and returns False with the original colors
+    # restored if a mesh has not finished the first pass. With the
+    # occlusion cache enabled, parts of meshes baked before with the
+    # same geometry and settings are loaded instead of traced, and
+    # finished bakes are stored.
+    def traceOcclusion(self, bakes, rayCount, bias, max, weighted, comboOffset):
+        import numpy as np
+        import sxlib.occlusion as occlusion
+
+        tools = sxglobals.settings.tools
+        passes = [rayCount, ]
+        if tools['occlusionProgressive']:
+            passes = sorted(set(
+                [count for count in tools['occlusionPasses']
+                 if count < rayCount] + passes))
+
+        useCache = tools['occlusionCache']
+        cacheDir = self.getOcclusionCacheDir()
+        # Bake settings that change the result besides the geometry
+        params = (
+            rayCount, bias, max, weighted, comboOffset,
+            tools['occlusionSampling'], tuple(passes),
+            tools['bakeGroundPlane'], tools['bakeGroundScale'],
+            tools['bakeGroundOffset'])
+
+        meshes = []
+        numParts = 0
+        numLoaded = 0
+        for idx, bake in enumerate(bakes):
+            selectionList = OM.MSelectionList()
+            selectionList.add(bake)
+            MFnMesh = OM.MFnMesh(selectionList.getDagPath(0))
+            original = self.getOriginalColors(MFnMesh)
+            geometry, normals = self.getOcclusionGeometry(MFnMesh, weighted)
+            parts = self.getOcclusionParts(
+                geometry, normals, meshes, idx == len(bakes) - 1,
+                params, max + bias)
+
+            values = np.ones(len(geometry.points))
+            missing = []
+            for start, end, key in parts:
+                cached = None
+                if useCache:
+                    cached = occlusion.loadCache(cacheDir, key, end - start)
+                if cached is None:
+                    missing.append((start, end, key))
+                else:
+                    values[start:end] = cached
+                    numLoaded += 1
+            numParts += len(parts)
+
+            vertices = np.arange(0, dtype=np.int32)
+            if len(missing) > 0:
+                vertices = np.concatenate([
+                    np.arange(start, end, dtype=np.int32)
+                    for start, end, key in missing])
+            else:
+                self.setOcclusionColors(MFnMesh, values)
+
+            meshes.append({
+                'MFnMesh': MFnMesh,
+                'original': original,
+                'geometry': geometry,
+                'normals': normals,
+                'values': values,
+                'vertices': vertices,
+                'traced': None,
+                'missing': missing})
+
+        if useCache:
+            print(
+                'SX Tools: Loaded ' + str(numLoaded) + ' of ' +
+                str(numParts) + ' occlusion parts from cache')
+        traceMeshes = [mesh for mesh in meshes if len(mesh['vertices']) > 0]
+
+        interactive = not maya.cmds.about(batch=True)
+        totalRays = float(rayCount * sum(
+            [len(mesh['vertices']) for mesh in traceMeshes])) or 1.0
+        state = {'rays': 0, 'passRays': 0}
+
+        def progress(numVertices):
+            state['rays'] += numVertices * state['passRays']
+            if not interactive:
+                return True
+            maya.cmds.progressWindow(
+                edit=True,
+                progress=int(100 * state['rays'] / totalRays))
+            return not maya.cmds.progressWindow(query=True, isCancelled=True)
+
+        if interactive and (len(traceMeshes) > 0):
+            maya.cmds.progressWindow(
+                title='SX Tools',
+                status='Baking occlusion',
+                progress=0,
+                maxValue=100,
+                isInterruptable=True)
+
+        tracer = self.getOcclusionTracer(
+            [(mesh['geometry'], mesh['normals'], mesh['vertices'])
+             for mesh in traceMeshes],
+            bias,
+            max)
+        rayStart = 0
+        cancelled = False
+        try:
+            for passIndex, rayEnd in enumerate(passes):
+                if len(traceMeshes) == 0:
+                    break
+                state['passRays'] = rayEnd - rayStart
+                hemisphere = occlusion.getHemisphere(
+                    rayEnd - rayStart, tools['occlusionSampling'], passIndex)
+                if interactive:
+                    maya.cmds.progressWindow(
+                        edit=True,
+                        status='Baking occlusion, ' + str(rayEnd) + ' rays')
+                for meshIndex, mesh in enumerate(traceMeshes):
+                    values = tracer.trace(meshIndex, hemisphere, progress)
+                    if values is None:
+                        cancelled = True
+                        break
+                    if mesh['traced'] is not None:
+                        values = (
+                            mesh['traced'] * rayStart +
+                            values * (rayEnd - rayStart)) / float(rayEnd)
+                    mesh['traced'] = values
+                    mesh['values'][mesh['vertices']] = values
+
+                    self.setOcclusionColors(mesh['MFnMesh'], mesh['values'])
+                    if interactive:
+                        maya.cmds.refresh(currentView=True)
+                if cancelled:
+                    break
+                rayStart = rayEnd
+        finally:
+            tracer.close()
+            if interactive and (len(traceMeshes) > 0):
+                maya.cmds.progressWindow(endProgress=True)
+
+        if cancelled:
+            if any([mesh['traced'] is None for mesh in traceMeshes]):
+                for mesh in meshes:
+                    self.restoreOriginalColors(
+                        mesh['MFnMesh'], mesh['original'])
+                print('SX Tools: Occlusion bake cancelled')
+                return False
+            print(
+                'SX Tools: Occlusion bake stopped, '
+                'keeping the results of at least ' + str(rayStart) + ' rays')
+        elif useCache:
+            try:
+                for mesh in traceMeshes:
+                    for start, end, key in mesh['missing']:
+                        occlusion.saveCache(
+                            cacheDir, key, mesh['values'][start:end])
+            except (IOError, OSError):
+                print('SX Tools Error: Occlusion cache could not be written to ' + cacheDir)
+        return True
+
+    # Removes the temporary meshes and color sets of a cancelled bake
+    def cancelOcclusion(self, bakes, globalMesh):
+        maya.cmds.delete(globalMesh)
+        for bake in bakes:
+            if maya.cmds.objExists(bake):
+                maya.cmds.polyColorSet(
+                    bake, delete=True, colorSet='AO_'+str(bake))
+                maya.cmds.polyColorSet(
+                    bake, currentColorSet=True, colorSet='occlusion')
+
+    @profiler.profile('tools.bakeOcclusion')
     def bakeOcclusion(self, rayCount=250, bias=0.000001, max=10.0, weighted=True, comboOffset=0.9):
         sxglobals.settings.localOcclusionDict.clear()
         sxglobals.settings.globalOcclusionDict.clear()
@@ -328,7 +703,6 @@ class ToolActions(object):
         newBboxCoords = []
         selectionCache = sxglobals.settings.selectionArray
         sxglobals.settings.bakeSet = sxglobals.settings.shapeArray
-        contribution = 1.0/float(rayCount)
 
         if sxglobals.settings.project['LayerData']['occlusion'][5]:
             sxglobals.layers.setColorSet('occlusion')
@@ -400,68 +774,18 @@ class ToolActions(object):
                 name='comboOcclusionObject')
             sxglobals.settings.bakeSet.append(globalMesh[0])
 
+        if not self.traceOcclusion(
+                sxglobals.settings.bakeSet, rayCount, bias, max, weighted, comboOffset):
+            sxglobals.settings.bakeSet.remove(globalMesh[0])
+            self.cancelOcclusion(sxglobals.settings.bakeSet, globalMesh)
+            maya.cmds.select(selectionCache)
+            return False
+
         for bake in sxglobals.settings.bakeSet:
             selectionList = OM.MSelectionList()
-            nodeDagPath = OM.MDagPath()
-            vtxPoints = OM.MPointArray()
-            vtxColors = OM.MColorArray()
-            vtxIds = OM.MIntArray()
-            vtxFloatNormals = OM.MFloatVectorArray()
-            vtxNormal = OM.MVector()
-
             selectionList.add(bake)
             nodeDagPath = selectionList.getDagPath(0)
             MFnMesh = OM.MFnMesh(nodeDagPath)
-            accelGrid = MFnMesh.autoUniformGridParams()
-            vtxPoints = MFnMesh.getPoints(OM.MSpace.kWorld)
-            vtxFloatNormals = MFnMesh.getVertexNormals(weighted, OM.MSpace.kWorld)
-            numVtx = MFnMesh.numVertices
-
-            vtxColors.setLength(numVtx)
-            vtxIds.setLength(numVtx)
-
-            hemiSphere = OM.MVectorArray()
-            hemiSphere.setLength(rayCount)
-            for idx in xrange(rayCount):
-                hemiSphere[idx] = self.rayRandomizer()
-
-            vtxIt = OM.MItMeshVertex(nodeDagPath)
-            while not vtxIt.isDone():
-                i = vtxIt.index()
-                vtxIds[i] = i
-                vtxNormal = vtxIt.getNormal()
-                point = OM.MFloatPoint(vtxPoints[i])
-                point = point + bias*vtxFloatNormals[i]
-                occValue = 1.0
-                forward = OM.MVector(OM.MVector.kZaxisVector)
-                rotQuat = forward.rotateTo(vtxNormal)
-                sampleRays = OM.MFloatVectorArray()
-                sampleRays.setLength(rayCount)
-
-                for e in xrange(rayCount):
-                    sampleRays[e] = OM.MFloatVector(
-                        hemiSphere[e].rotateBy(rotQuat))
-                for e in xrange(rayCount):
-                    result = MFnMesh.anyIntersection(
-                        point,
-                        sampleRays[e],
-                        OM.MSpace.kWorld,
-                        max,
-                        False,
-                        accelParams=accelGrid,
-                        tolerance=0.001)
-                    if result[2] != -1:
-                        occValue = occValue - contribution
-
-                vtxColors[i].r = occValue
-                vtxColors[i].g = occValue
-                vtxColors[i].b = occValue
-                vtxColors[i].a = 1.0
-
-                vtxIt.next()
-
-            MFnMesh.setVertexColors(vtxColors, vtxIds)
-            MFnMesh.freeCachedIntersectionAccelerator()
 
             # assign global mesh colors to individual pieces
             if bake == globalMesh[0]:
@@ -567,7 +891,9 @@ class ToolActions(object):
                         colorSet=AOSet)
 
         maya.cmds.select(selectionCache)
+        return True
 
+    @profiler.profile('tools.bakeOcclusionMR')
     def bakeOcclusionMR(self):
         bbox = []
         sxglobals.settings.bakeSet = sxglobals.settings.shapeArray
@@ -647,21 +973,20 @@ class ToolActions(object):
 
         maya.cmds.select(sxglobals.settings.bakeSet)
 
+    @profiler.profile('tools.bakeBlendOcclusion')
     def bakeBlendOcclusion(self):
-        startTimeOcc = maya.cmds.timerX()
-        self.bakeOcclusion(
-            sxglobals.settings.tools['rayCount'],
-            sxglobals.settings.tools['bias'],
-            sxglobals.settings.tools['maxDistance'],
-            True,
-            sxglobals.settings.tools['comboOffset'])
+        if not self.bakeOcclusion(
+                sxglobals.settings.tools['rayCount'],
+                sxglobals.settings.tools['bias'],
+                sxglobals.settings.tools['maxDistance'],
+                True,
+                sxglobals.settings.tools['comboOffset']):
+            return
         sxglobals.settings.tools['blendSlider'] = 0.5
         self.blendOcclusion()
-        totalTime = maya.cmds.timerX(startTime=startTimeOcc)
-        print('SX Tools: Occlusion baking duration ' + str(totalTime))
 
+    @profiler.profile('tools.bakeBlendOcclusionMR')
     def bakeBlendOcclusionMR(self):
-        startTimeOcc = maya.cmds.timerX()
         ground = sxglobals.settings.tools['bakeGroundPlane']
         sxglobals.settings.tools['bakeGroundPlane'] = False
         sxglobals.settings.tools['bakeTogether'] = False
@@ -696,9 +1021,8 @@ class ToolActions(object):
 
         sxglobals.settings.tools['blendSlider'] = 0.5
         self.blendOcclusion()
-        totalTime = maya.cmds.timerX(startTime=startTimeOcc)
-        print('SX Tools: Occlusion baking duration ' + str(totalTime))
 
+    @profiler.profile('tools.blendOcclusion')
     def blendOcclusion(self):
         sliderValue = sxglobals.settings.tools['blendSlider']
 
@@ -708,25 +1032,17 @@ class ToolActions(object):
             localColorArray = OM.MColorArray()
             globalColorArray = OM.MColorArray()
             layerColorArray = OM.MColorArray()
-            faceIds = OM.MIntArray()
-            vtxIds = OM.MIntArray()
             selectionList.add(bake)
             nodeDagPath = selectionList.getDagPath(0)
             MFnMesh = OM.MFnMesh(nodeDagPath)
+            topology = sxglobals.topology.getTopology(bake, MFnMesh)
 
             localColorArray = sxglobals.settings.localOcclusionDict[bake]
             globalColorArray = sxglobals.settings.globalOcclusionDict[bake]
             layerColorArray = MFnMesh.getFaceVertexColors(colorSet='occlusion')
             lenSel = len(layerColorArray)
-            faceIds.setLength(lenSel)
-            vtxIds.setLength(lenSel)
-
-            fvIt = OM.MItMeshFaceVertex(nodeDagPath)
 
-            k = 0
-            while not fvIt.isDone():
-                faceIds[k] = fvIt.faceId()
-                vtxIds[k] = fvIt.vertexId()
+            for k in xrange(lenSel):
                 layerColorArray[k].r = (
                     (1-sliderValue) * localColorArray[k].r +
                     sliderValue * globalColorArray[k].r)
@@ -736,17 +1052,19 @@ class ToolActions(object):
                 layerColorArray[k].b = (
                     (1-sliderValue) * localColorArray[k].b +
                     sliderValue * globalColorArray[k].b)
-                k += 1
-                fvIt.next()
 
             maya.cmds.polyColorSet(
                 bake, currentColorSet=True, colorSet='occlusion')
-            MFnMesh.setFaceVertexColors(layerColorArray, faceIds, vtxIds)
+            MFnMesh.setFaceVertexColors(
+                layerColorArray,
+                topology['faceIdArray'],
+                topology['vtxIdArray'])
 
         sxglobals.layers.getLayerPaletteAndOpacity(
             sxglobals.settings.shapeArray[len(sxglobals.settings.shapeArray)-1],
             sxglobals.settings.tools['selectedLayer'])
 
+    @profiler.profile('tools.applyTexture')
     def applyTexture(self, texture, uvSetName, applyAlpha):
         colors = []
         color = []
@@ -830,9 +1148,8 @@ class ToolActions(object):
             colorShadedDisplay=True)
 
     # NOTE: Master Palette uses the noise settings of Apply Color tool
+    @profiler.profile('tools.applyMasterPalette')
     def applyMasterPalette(self):
-        startTimeOcc = maya.cmds.timerX()
-
         for i in xrange(1, 6):
             targetLayers = sxglobals.settings.project['paletteTarget'+str(i)]
             maya.cmds.palettePort('newPalette', edit=True, scc=i-1)
@@ -843,12 +1160,10 @@ class ToolActions(object):
                 sxglobals.settings.tools['selectedLayer'] = layer
                 self.colorFill(False, True)
 
-        totalTime = maya.cmds.timerX(startTime=startTimeOcc)
-        print('SX Tools: Apply Master Palette duration ' + str(totalTime))
         sxglobals.core.updateSXTools()
 
+    @profiler.profile('tools.applyMaterial')
     def applyMaterial(self):
-        startTimeOcc = maya.cmds.timerX()
         sxglobals.settings.tools['noiseValue'] = 0
         targets = (sxglobals.settings.project['materialTarget'][0], 'metallic', 'smoothness')
 
@@ -860,8 +1175,6 @@ class ToolActions(object):
             print i, targets[i], sxglobals.settings.currentColor
             self.colorFill(True, False)
 
-        totalTime = maya.cmds.timerX(startTime=startTimeOcc)
-        print('SX Tools: Apply Material duration ' + str(totalTime))
         sxglobals.core.updateSXTools()
 
     def calculateBoundingBox(self, selection):
@@ -961,8 +1274,8 @@ class ToolActions(object):
             selectionIter.next()
         return ((xmin,xmax), (ymin,ymax), (zmin,zmax))
 
+    @profiler.profile('tools.gradientFill')
     def gradientFill(self, axis):
-        startTimeOcc = maya.cmds.timerX()
         layer = sxglobals.settings.tools['selectedLayer']
         space = OM.MSpace.kWorld
         mod = OM.MDGModifier()
@@ -995,10 +1308,12 @@ class ToolActions(object):
         fVert = OM.MObject()
         fvColors = OM.MColorArray()
         vtxIds = OM.MIntArray()
-        fvIds = OM.MIntArray()
         faceIds = OM.MIntArray()
         compDagPath = OM.MDagPath()
 
+        # Edited face vertex indices per shape for compositing
+        components = {}
+
         selectionIter = OM.MItSelectionList(selectionList)
         while not selectionIter.isDone():
             # Gather full mesh data to compare selection against
@@ -1007,72 +1322,57 @@ class ToolActions(object):
             # fvColors.clear()
             fvColors = mesh.getFaceVertexColors(colorSet=layer)
             selLen = len(fvColors)
-            vtxIds.setLength(selLen)
-            fvIds.setLength(selLen)
-            faceIds.setLength(selLen)
-
-            meshIter = OM.MItMeshFaceVertex(selDagPath)
-            i = 0
-            while not meshIter.isDone():
-                vtxIds[i] = meshIter.vertexId()
-                faceIds[i] = meshIter.faceId()
-                fvIds[i] = meshIter.faceVertexId()
-                i += 1
-                meshIter.next()
+            topology = sxglobals.topology.getTopology(selDagPath, mesh)
+            faceIds = topology['faceIdArray']
+            vtxIds = topology['vtxIdArray']
 
             if selectionIter.hasComponents():
                 (compDagPath, fVert) = selectionIter.getComponent()
+                indices = components.setdefault(
+                    selDagPath.fullPathName(), [])
                 # Iterate through selected face vertices on current selection
                 fvIt = OM.MItMeshFaceVertex(selDagPath, fVert)
                 while not fvIt.isDone():
-                    faceId = fvIt.faceId()
-                    fvId = fvIt.faceVertexId()
-                    vtxId = fvIt.vertexId()
-                    for idx in xrange(selLen):
-                        if (faceId == faceIds[idx] and
-                           fvId == fvIds[idx] and
-                           vtxId == vtxIds[idx] and
-                           compDagPath == selDagPath):
-                            ratioRaw = None
-                            ratio = None
-                            fvPos = fvIt.position(space)
-                            if axis == 1:
-                                ratioRaw = (
-                                    (fvPos[0] - xmin) /
-                                    float(xmax - xmin))
-                            elif axis == 2:
-                                ratioRaw = (
-                                    (fvPos[1] - ymin) /
-                                    float(ymax - ymin))
-                            elif axis == 3:
-                                ratioRaw = (
-                                    (fvPos[2] - zmin) /
-                                    float(zmax - zmin))
-                            ratio = max(min(ratioRaw, 1), 0)
-                            outColor = maya.cmds.colorAtPoint(
-                                'SXRamp', o='RGB', u=(ratio), v=(ratio))
-                            outAlpha = maya.cmds.colorAtPoint(
-                                'SXAlphaRamp', o='A', u=(ratio), v=(ratio))
-                            if outAlpha[0] > 0:
-                                fvColors[idx].r = outColor[0]
-                                fvColors[idx].g = outColor[1]
-                                fvColors[idx].b = outColor[2]
-                            else:
-                                fvColors[idx].r = outAlpha[0]
-                                fvColors[idx].g = outAlpha[0]
-                                fvColors[idx].b = outAlpha[0]
-                            fvColors[idx].a = outAlpha[0]
-                            break
+                    idx = sxglobals.topology.getIndex(
+                        topology, fvIt.faceId(), fvIt.faceVertexId())
+                    if compDagPath == selDagPath:
+                        indices.append(idx)
+                        ratioRaw = None
+                        ratio = None
+                        fvPos = fvIt.position(space)
+                        if axis == 1:
+                            ratioRaw = (
+                                (fvPos[0] - xmin) /
+                                float(xmax - xmin))
+                        elif axis == 2:
+                            ratioRaw = (
+                                (fvPos[1] - ymin) /
+                                float(ymax - ymin))
+                        elif axis == 3:
+                            ratioRaw = (
+                                (fvPos[2] - zmin) /
+                                float(zmax - zmin))
+                        ratio = max(min(ratioRaw, 1), 0)
+                        outColor = maya.cmds.colorAtPoint(
+                            'SXRamp', o='RGB', u=(ratio), v=(ratio))
+                        outAlpha = maya.cmds.colorAtPoint(
+                            'SXAlphaRamp', o='A', u=(ratio), v=(ratio))
+                        if outAlpha[0] > 0:
+                            fvColors[idx].r = outColor[0]
+                            fvColors[idx].g = outColor[1]
+                            fvColors[idx].b = outColor[2]
+                        else:
+                            fvColors[idx].r = outAlpha[0]
+                            fvColors[idx].g = outAlpha[0]
+                            fvColors[idx].b = outAlpha[0]
+                        fvColors[idx].a = outAlpha[0]
                     fvIt.next()
             else:
-                fvIt = OM.MItMeshFaceVertex(selDagPath)
-                k = 0
-                while not fvIt.isDone():
+                points = mesh.getPoints(space)
+                for k in xrange(selLen):
                     ratioRaw = None
                     ratio = None
-                    # faceIds[k] = fvIt.faceId()
-                    # vtxIds[k] = fvIt.vertexId()
-                    fvPos = fvIt.position(space)
+                    fvPos = points[int(topology['vtxIds'][k])]
                     if axis == 1:
                         ratioRaw = (
                             (fvPos[0] - xmin) /
@@ -1099,19 +1399,16 @@ class ToolActions(object):
                         fvColors[k].g = outAlpha[0]
                         fvColors[k].b = outAlpha[0]
                     fvColors[k].a = outAlpha[0]
-                    k += 1
-                    fvIt.next()
 
             # sxglobals.layers.setColorSet(sxglobals.settings.tools['selectedLayer'])
             mesh.setFaceVertexColors(fvColors, faceIds, vtxIds, mod, colorRep)
             selectionIter.next()
 
         mod.doIt()
-        totalTime = maya.cmds.timerX(startTime=startTimeOcc)
-        print('SX Tools: Gradient Fill duration ' + str(totalTime))
+        return components
 
+    @profiler.profile('tools.colorFill')
     def colorFill(self, overwriteAlpha=False, palette=False):
-        #startTimeOcc = maya.cmds.timerX()
         layer = sxglobals.settings.tools['selectedLayer']
         sxglobals.layers.setColorSet(layer)
         fillColor = OM.MColor()
@@ -1138,10 +1435,12 @@ class ToolActions(object):
         fVert = OM.MObject()
         fvColors = OM.MColorArray()
         vtxIds = OM.MIntArray()
-        fvIds = OM.MIntArray()
         faceIds = OM.MIntArray()
         compDagPath = OM.MDagPath()
 
+        # Edited face vertex indices per shape for compositing
+        components = {}
+
         selectionIter = OM.MItSelectionList(selectionList)
         while not selectionIter.isDone():
             # Gather full mesh data to compare selection against
@@ -1150,34 +1449,22 @@ class ToolActions(object):
             fvColors.clear()
             fvColors = mesh.getFaceVertexColors(colorSet=layer)
             selLen = len(fvColors)
-            vtxIds.setLength(selLen)
-            fvIds.setLength(selLen)
-            faceIds.setLength(selLen)
-
-            meshIter = OM.MItMeshFaceVertex(selDagPath)
-            i = 0
-            while not meshIter.isDone():
-                vtxIds[i] = meshIter.vertexId()
-                faceIds[i] = meshIter.faceId()
-                fvIds[i] = meshIter.faceVertexId()
-                i += 1
-                meshIter.next()
+            topology = sxglobals.topology.getTopology(selDagPath, mesh)
+            faceIds = topology['faceIdArray']
+            vtxIds = topology['vtxIdArray']
 
             if selectionIter.hasComponents():
                 (compDagPath, fVert) = selectionIter.getComponent()
+                indices = components.setdefault(
+                    selDagPath.fullPathName(), [])
                 # Iterate through selected vertices on current selection
                 fvIt = OM.MItMeshFaceVertex(selDagPath, fVert)
                 while not fvIt.isDone():
-                    faceId = fvIt.faceId()
-                    fvId = fvIt.faceVertexId()
-                    vtxId = fvIt.vertexId()
-                    for idx in xrange(selLen):
-                        if (faceId == faceIds[idx] and
-                           fvId == fvIds[idx] and
-                           vtxId == vtxIds[idx] and
-                           compDagPath == selDagPath):
-                            fvColors[idx] = fillColor
-                            break
+                    idx = sxglobals.topology.getIndex(
+                        topology, fvIt.faceId(), fvIt.faceVertexId())
+                    if compDagPath == selDagPath:
+                        indices.append(idx)
+                        fvColors[idx] = fillColor
                     fvIt.next()
             else:
                 if palette:
@@ -1208,16 +1495,17 @@ class ToolActions(object):
             mod.doIt()
             selectionIter.next()
 
+        # Noise is applied per vertex, which can reach
+        # beyond the selected face vertices
         if sxglobals.settings.tools['noiseValue'] > 0:
             self.colorNoise()
-
-        #totalTime = maya.cmds.timerX(startTime=startTimeOcc)
-        #print('SX Tools: Apply Color duration ' + str(totalTime))
+            components = None
 
         if not palette:
             sxglobals.layers.refreshLayerList()
-            sxglobals.layers.compositeLayers()
+            sxglobals.layers.compositeLayers([layer, ], components)
 
+    @profiler.profile('tools.colorNoise')
     def colorNoise(self):
         mono = sxglobals.settings.tools['noiseMonochrome']
         color = sxglobals.settings.currentColor
@@ -1312,8 +1600,8 @@ class ToolActions(object):
                 mesh.setVertexColors(vtxColors, vtxIds)
                 selectionIter.next()
 
+    @profiler.profile('tools.remapRamp')
     def remapRamp(self):
-        startTimeOcc = maya.cmds.timerX()
         layer = sxglobals.settings.tools['selectedLayer']
         sxglobals.layers.setColorSet(sxglobals.settings.tools['selectedLayer'])
         fvCol = OM.MColor()
@@ -1334,10 +1622,12 @@ class ToolActions(object):
         fVert = OM.MObject()
         fvColors = OM.MColorArray()
         vtxIds = OM.MIntArray()
-        fvIds = OM.MIntArray()
         faceIds = OM.MIntArray()
         compDagPath = OM.MDagPath()
 
+        # Edited face vertex indices per shape for compositing
+        components = {}
+
         selectionIter = OM.MItSelectionList(selectionList)
         while not selectionIter.isDone():
             # Gather full mesh data to compare selection against
@@ -1346,53 +1636,39 @@ class ToolActions(object):
             fvColors.clear()
             fvColors = mesh.getFaceVertexColors(colorSet=layer)
             selLen = len(fvColors)
-            vtxIds.setLength(selLen)
-            fvIds.setLength(selLen)
-            faceIds.setLength(selLen)
-
-            meshIter = OM.MItMeshFaceVertex(selDagPath)
-            i = 0
-            while not meshIter.isDone():
-                vtxIds[i] = meshIter.vertexId()
-                faceIds[i] = meshIter.faceId()
-                fvIds[i] = meshIter.faceVertexId()
-                i += 1
-                meshIter.next()
+            topology = sxglobals.topology.getTopology(selDagPath, mesh)
+            faceIds = topology['faceIdArray']
+            vtxIds = topology['vtxIdArray']
 
             if selectionIter.hasComponents():
                 (compDagPath, fVert) = selectionIter.getComponent()
+                indices = components.setdefault(
+                    selDagPath.fullPathName(), [])
                 # Iterate through selected facevertices on current selection
                 fvIt = OM.MItMeshFaceVertex(selDagPath, fVert)
                 while not fvIt.isDone():
-                    faceId = fvIt.faceId()
-                    fvId = fvIt.faceVertexId()
-                    vtxId = fvIt.vertexId()
-                    for idx in xrange(selLen):
-                        if (faceId == faceIds[idx] and
-                           fvId == fvIds[idx] and
-                           vtxId == vtxIds[idx] and
-                           compDagPath == selDagPath):
-                            fvCol = fvColors[idx]
-                            luminance = ((fvCol.r +
-                                          fvCol.r +
-                                          fvCol.b +
-                                          fvCol.g +
-                                          fvCol.g +
-                                          fvCol.g) / float(6.0))
-                            outColor = maya.cmds.colorAtPoint(
-                                'SXRamp', o='RGB', u=luminance, v=luminance)
-                            outAlpha = maya.cmds.colorAtPoint(
-                                'SXAlphaRamp', o='A', u=luminance, v=luminance)
-                            fvColors[idx].r = outColor[0]
-                            fvColors[idx].g = outColor[1]
-                            fvColors[idx].b = outColor[2]
-                            fvColors[idx].a = outAlpha[0]
-                            break
+                    idx = sxglobals.topology.getIndex(
+                        topology, fvIt.faceId(), fvIt.faceVertexId())
+                    if compDagPath == selDagPath:
+                        indices.append(idx)
+                        fvCol = fvColors[idx]
+                        luminance = ((fvCol.r +
+                                      fvCol.r +
+                                      fvCol.b +
+                                      fvCol.g +
+                                      fvCol.g +
+                                      fvCol.g) / float(6.0))
+                        outColor = maya.cmds.colorAtPoint(
+                            'SXRamp', o='RGB', u=luminance, v=luminance)
+                        outAlpha = maya.cmds.colorAtPoint(
+                            'SXAlphaRamp', o='A', u=luminance, v=luminance)
+                        fvColors[idx].r = outColor[0]
+                        fvColors[idx].g = outColor[1]
+                        fvColors[idx].b = outColor[2]
+                        fvColors[idx].a = outAlpha[0]
                     fvIt.next()
             else:
-                fvIt = OM.MItMeshFaceVertex(selDagPath)
-                k = 0
-                while not fvIt.isDone():
+                for k in xrange(selLen):
                     fvCol = fvColors[k]
                     luminance = ((fvCol.r +
                                   fvCol.r +
@@ -1408,16 +1684,13 @@ class ToolActions(object):
                     fvColors[k].g = outColor[1]
                     fvColors[k].b = outColor[2]
                     fvColors[k].a = outAlpha[0]
-                    k += 1
-                    fvIt.next()
 
             mesh.setFaceVertexColors(fvColors, faceIds, vtxIds)
             selectionIter.next()
 
-        totalTime = maya.cmds.timerX(startTime=startTimeOcc)
-        print(
-            'SX Tools: Surface luminance remap duration ' + str(totalTime))
+        return components
 
+    @profiler.profile('tools.copyLayer')
     def copyLayer(self, shapes, mode=1):
         refLayers = sxglobals.layers.sortLayers(
             sxglobals.settings.project['LayerData'].keys())
@@ -1447,22 +1720,9 @@ class ToolActions(object):
                     temp = OM.MColorArray()
                     temp = layerBColors
 
-                faceIds = OM.MIntArray()
-                vtxIds = OM.MIntArray()
-
-                lenSel = len(layerAColors)
-
-                faceIds.setLength(lenSel)
-                vtxIds.setLength(lenSel)
-
-                fvIt = OM.MItMeshFaceVertex(nodeDagPath)
-
-                k = 0
-                while not fvIt.isDone():
-                    faceIds[k] = fvIt.faceId()
-                    vtxIds[k] = fvIt.vertexId()
-                    k += 1
-                    fvIt.next()
+                topology = sxglobals.topology.getTopology(shape, MFnMesh)
+                faceIds = topology['faceIdArray']
+                vtxIds = topology['vtxIdArray']
 
                 maya.cmds.polyColorSet(shape, currentColorSet=True, colorSet=layerB)
                 MFnMesh.setFaceVertexColors(layerAColors, faceIds, vtxIds)
@@ -1485,7 +1745,7 @@ class ToolActions(object):
     def verifyShadingMode(self):
         if len(sxglobals.settings.shapeArray) > 0:
             obj = sxglobals.settings.shapeArray[len(sxglobals.settings.shapeArray)-1]
-            mode = int(maya.cmds.getAttr(obj + '.shadingMode') + 1)
+            mode = int(sxglobals.primvars.getAttr(obj, 'shadingMode') + 1)
 
             objectLabel = (
                 'Selected Objects: ' +
@@ -1535,67 +1795,6 @@ class ToolActions(object):
 
         sxglobals.layers.compositeLayers()
 
-    # check for non-safe history
-    # and double shapes under one transform
-    def checkHistory(self, objList):
-        del sxglobals.settings.multiShapeArray[:]
-        sxglobals.ui.history = False
-        sxglobals.ui.multiShapes = False
-
-        for obj in objList:
-            if maya.cmds.attributeQuery('exportMesh', node=obj, exists=True):
-                print('SX Tools: Deforming export mesh selected')
-                return
-            if '_skinned' in obj:
-                print('SX Tools: Skinning Mesh Selected')
-                return
-
-            histList = maya.cmds.listHistory(obj)
-            shapeList = maya.cmds.listRelatives(
-                obj, shapes=True, fullPath=True)
-
-            objName = str(obj).rstrip('0123456789')
-            if '|' in objName:
-                objName = objName.rsplit('|', 1)[1]
-
-            for hist in reversed(histList):
-                if objName in str(hist):
-                    histList.remove(hist)
-            for hist in reversed(histList):
-                if 'assetsLayer' in str(hist):
-                    histList.remove(hist)
-            for hist in reversed(histList):
-                if 'exportsLayer' in str(hist):
-                    histList.remove(hist)
-            for hist in reversed(histList):
-                if 'sxCrease' in str(hist):
-                    histList.remove(hist)
-            for hist in reversed(histList):
-                if 'sxSubMesh' in str(hist):
-                    histList.remove(hist)
-            for hist in reversed(histList):
-                if 'set' in str(hist):
-                    histList.remove(hist)
-            for hist in reversed(histList):
-                if 'groupId' in str(hist):
-                    histList.remove(hist)
-            for hist in reversed(histList):
-                if 'topoSymmetrySet' in str(hist):
-                    histList.remove(hist)
-
-            if len(histList) > 0:
-                print('SX Tools: History found: ' + str(histList))
-                sxglobals.ui.history = True
-
-            if len(shapeList) > 1:
-                print('SX Tools: Multiple shape nodes in ' + str(obj))
-                sxglobals.ui.multiShapes = True
-                for shape in shapeList:
-                    if '|' in shape:
-                        shapeShort = shape.rsplit('|', 1)[1]
-                    if objName not in shapeShort:
-                        sxglobals.settings.multiShapeArray.append(shape)
-
     # Called from a button the tool UI
     # that clears either the selected layer
     # or the selected components in a layer
@@ -1621,6 +1820,7 @@ class ToolActions(object):
                     [sxglobals.settings.tools['selectedLayer'], ],
                     sxglobals.settings.shapeArray)
 
+    @profiler.profile('tools.setLayerOpacity')
     def setLayerOpacity(self):
         alphaMax = sxglobals.settings.layerAlphaMax
         sxglobals.layers.setColorSet(sxglobals.settings.tools['selectedLayer'])
@@ -1638,23 +1838,14 @@ class ToolActions(object):
 
             layerColorArray = OM.MColorArray()
             layerColorArray = MFnMesh.getFaceVertexColors(colorSet=layer)
-            faceIds = OM.MIntArray()
-            vtxIds = OM.MIntArray()
+            topology = sxglobals.topology.getTopology(shape, MFnMesh)
 
             testColor = OM.MColor()
 
             lenSel = len(layerColorArray)
 
-            faceIds.setLength(lenSel)
-            vtxIds.setLength(lenSel)
-
-            fvIt = OM.MItMeshFaceVertex(nodeDagPath)
-
-            k = 0
-            while not fvIt.isDone():
-                faceIds[k] = fvIt.faceId()
-                vtxIds[k] = fvIt.vertexId()
-                testColor = fvIt.getColor(layer)
+            for k in xrange(lenSel):
+                testColor = layerColorArray[k]
                 if ((alphaMax == 0) and
                     (testColor.r > 0 or
                      testColor.g > 0 or
@@ -1666,10 +1857,11 @@ class ToolActions(object):
                       testColor.b > 0):
                         layerColorArray[k].a = (layerColorArray[k].a /
                                                 alphaMax * sliderAlpha)
-                k += 1
-                fvIt.next()
 
-            MFnMesh.setFaceVertexColors(layerColorArray, faceIds, vtxIds)
+            MFnMesh.setFaceVertexColors(
+                layerColorArray,
+                topology['faceIdArray'],
+                topology['vtxIdArray'])
 
             # TODO: Support for transparency in layer1 with sw compositing
             if (str(layer) == 'layer1') and (sliderAlpha < 1):
@@ -1850,11 +2042,13 @@ class ToolActions(object):
                 if cat.keys()[0] == category:
                     sxglobals.settings.masterPaletteArray[i][
                         category][preset] = paletteArray
+            sxglobals.library.invalidate(1)
         elif 'Material' in paletteUI:
             for i, cat in enumerate(sxglobals.settings.materialArray):
                 if cat.keys()[0] == category:
                     sxglobals.settings.materialArray[i][
                         category][preset] = paletteArray
+            sxglobals.library.invalidate(2)
         maya.cmds.palettePort(
             paletteUI,
             edit=True,
@@ -1877,34 +2071,33 @@ class ToolActions(object):
                     presetColors = sxglobals.settings.materialArray[i][
                         category][preset]
 
-        for idx, color in enumerate(presetColors):
-            maya.cmds.palettePort(
-                paletteUI,
-                edit=True,
-                rgb=(idx, color[0], color[1], color[2]))
-        maya.cmds.palettePort(paletteUI, edit=True, redraw=True)
+        sxglobals.library.setSwatches([(paletteUI, presetColors), ])
 
     def deleteCategory(self, category):
         for i, cat in enumerate(sxglobals.settings.masterPaletteArray):
             if cat.keys()[0] == category:
                 sxglobals.settings.masterPaletteArray.pop(i)
         sxglobals.settings.tools['categoryPreset'] = None
+        sxglobals.library.invalidate(1)
 
     def deleteMaterialCategory(self, category):
         for i, cat in enumerate(sxglobals.settings.materialArray):
             if cat.keys()[0] == category:
                 sxglobals.settings.materialArray.pop(i)
         sxglobals.settings.tools['materialCategoryPreset'] = None
+        sxglobals.library.invalidate(2)
 
     def deletePalette(self, category, preset):
         for i, cat in enumerate(sxglobals.settings.masterPaletteArray):
             if cat.keys()[0] == category:
                 sxglobals.settings.masterPaletteArray[i][category].pop(preset)
+        sxglobals.library.invalidate(1)
 
     def deleteMaterial(self, category, preset):
         for i, cat in enumerate(sxglobals.settings.materialArray):
             if cat.keys()[0] == category:
                 sxglobals.settings.materialArray[i][category].pop(preset)
+        sxglobals.library.invalidate(2)
 
     def saveMasterCategory(self):
         modifiers = maya.cmds.getModifiers()
@@ -1935,6 +2128,7 @@ class ToolActions(object):
                 categoryDict = {}
                 categoryDict[category] = {}
                 sxglobals.settings.masterPaletteArray.append(categoryDict)
+                sxglobals.library.invalidate(1)
                 maya.cmds.menuItem(
                     category,
                     label=category,
@@ -1983,6 +2177,7 @@ class ToolActions(object):
                 categoryDict = {}
                 categoryDict[category] = {}
                 sxglobals.settings.materialArray.append(categoryDict)
+                sxglobals.library.invalidate(2)
                 maya.cmds.menuItem(
                     category,
                     label=category,
@@ -2147,13 +2342,15 @@ class ToolActions(object):
             sxglobals.layers.refreshLayerList()
             sxglobals.layers.compositeLayers()
         elif mode == 4:
-            self.remapRamp()
+            components = self.remapRamp()
             sxglobals.layers.refreshLayerList()
-            sxglobals.layers.compositeLayers()
+            sxglobals.layers.compositeLayers(
+                [sxglobals.settings.tools['selectedLayer'], ], components)
         else:
-            self.gradientFill(mode)
+            components = self.gradientFill(mode)
             sxglobals.layers.refreshLayerList()
-            sxglobals.layers.compositeLayers()
+            sxglobals.layers.compositeLayers(
+                [sxglobals.settings.tools['selectedLayer'], ], components)
 
     def clearRamp(self, rampName):
         indexList = maya.cmds.getAttr(
@@ -2173,8 +2370,10 @@ class ToolActions(object):
             maya.cmds.setAttr(str(shape) + attr, mode)
 
         #sxglobals.layers.setSelectedLayer()
-        sxglobals.layers.compositeLayers()
+        sxglobals.layers.compositeLayers(
+            [sxglobals.settings.tools['selectedLayer'], ])
 
+    @profiler.profile('tools.swapLayerSets')
     def swapLayerSets(self, objects, targetSet, offset=False):
         if offset:
             targetSet -= 1
@@ -2223,6 +2422,7 @@ class ToolActions(object):
         # sxglobals.export.compositeLayers()
         # maya.cmds.shaderfx(sfxnode='SXShader', update=True)
 
+    @profiler.profile('tools.removeLayerSet')
     def removeLayerSet(self, objects):
         modifiers = maya.cmds.getModifiers()
         shift = bool((modifiers & 1) > 0)
@@ -2305,6 +2505,7 @@ class ToolActions(object):
                             colorSet=layer,
                             newColorSet=newSet)
 
+    @profiler.profile('tools.copyFaceVertexColors')
     def copyFaceVertexColors(self, objects, sourceLayers, targetLayers):
         for object in objects:
             selectionList = OM.MSelectionList()
@@ -2314,24 +2515,9 @@ class ToolActions(object):
             MFnMesh = OM.MFnMesh(nodeDagPath)
 
             layerAColors = OM.MColorArray()
-            layerAColors = MFnMesh.getFaceVertexColors(colorSet='layer1')
-
-            faceIds = OM.MIntArray()
-            vtxIds = OM.MIntArray()
-
-            lenSel = len(layerAColors)
-
-            faceIds.setLength(lenSel)
-            vtxIds.setLength(lenSel)
-
-            fvIt = OM.MItMeshFaceVertex(nodeDagPath)
-
-            k = 0
-            while not fvIt.isDone():
-                faceIds[k] = fvIt.faceId()
-                vtxIds[k] = fvIt.vertexId()
-                k += 1
-                fvIt.next()
+            topology = sxglobals.topology.getTopology(object, MFnMesh)
+            faceIds = topology['faceIdArray']
+            vtxIds = topology['vtxIdArray']
 
             for source, target in zip(sourceLayers, targetLayers):
                 maya.cmds.polyColorSet(
@@ -2341,6 +2527,7 @@ class ToolActions(object):
                 layerAColors = MFnMesh.getFaceVertexColors(colorSet=source)
                 MFnMesh.setFaceVertexColors(layerAColors, faceIds, vtxIds)
 
+    @profiler.profile('tools.createSkinMesh')
     def createSkinMesh(self, objects):
         skinMeshArray = []
         for obj in objects:
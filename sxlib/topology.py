@@ -0,0 +1,124 @@
+# ----------------------------------------------------------------------------
+#   SX Tools - Maya vertex painting toolkit
+#   (c) 2017-2019  Jani Kahrama / Secret Exit Ltd
+#   Released under MIT license
+#
+#   Face vertex topology index per shape. The face, vertex and
+#   face-relative vertex ids of every face vertex are derived from
+#   MFnMesh.getVertices() in face vertex order, which is the order
+#   getFaceVertexColors() uses. Entries are keyed by node, validated
+#   against the mesh component counts, and dropped by topology change
+#   callbacks and when the node is removed.
+# ----------------------------------------------------------------------------
+
+import zlib
+import maya.api.OpenMaya as OM
+import numpy as np
+
+
+class TopologyCache(object):
+    def __init__(self):
+        self.shapeDict = {}
+        self.callbackDict = {}
+        return None
+
+    def __del__(self):
+        self.clear()
+        print('SX Tools: Exiting topology')
+
+    def getFingerprint(self, MFnMesh):
+        return (
+            MFnMesh.numPolygons,
+            MFnMesh.numVertices,
+            MFnMesh.numFaceVertices,
+            MFnMesh.numEdges)
+
+    # Returns the cached topology dict of a shape,
+    # re-indexing the mesh only if it has changed.
+    # A deleted node can be replaced by another with
+    # the same hash code and component counts, so
+    # entries are checked against the node itself.
+    def getTopology(self, shape, MFnMesh=None):
+        if MFnMesh is None:
+            selectionList = OM.MSelectionList()
+            selectionList.add(str(shape))
+            MFnMesh = OM.MFnMesh(selectionList.getDagPath(0))
+        mObject = MFnMesh.object()
+        hashCode = OM.MObjectHandle(mObject).hashCode()
+
+        fingerprint = self.getFingerprint(MFnMesh)
+        topology = self.shapeDict.get(hashCode)
+        if ((topology is not None) and
+           topology['handle'].isValid() and
+           (topology['handle'].object() == mObject) and
+           (topology['fingerprint'] == fingerprint)):
+            return topology
+
+        topology = self.indexMesh(MFnMesh)
+        topology['fingerprint'] = fingerprint
+        topology['handle'] = OM.MObjectHandle(mObject)
+        self.shapeDict[hashCode] = topology
+        self.addCallbacks(hashCode, mObject)
+        return topology
+
+    def indexMesh(self, MFnMesh):
+        polygonCounts, polygonConnects = MFnMesh.getVertices()
+        counts = np.array(polygonCounts, dtype=np.int32)
+        vtxIds = np.array(polygonConnects, dtype=np.int32)
+
+        faceOffsets = (np.cumsum(counts) - counts).astype(np.int32)
+        faceIds = np.repeat(
+            np.arange(len(counts), dtype=np.int32), counts)
+        faceVertexIds = (
+            np.arange(len(vtxIds), dtype=np.int32) - faceOffsets[faceIds])
+
+        topology = {
+            'faceIds': faceIds,
+            'vtxIds': vtxIds,
+            'faceVertexIds': faceVertexIds,
+            'faceOffsets': faceOffsets,
+            'faceIdArray': OM.MIntArray(faceIds.tolist()),
+            'vtxIdArray': OM.MIntArray(vtxIds.tolist()),
+            'connectivityHash': zlib.crc32(
+                counts.tobytes() + vtxIds.tobytes())}
+        return topology
+
+    # Flat face vertex index, as used by getFaceVertexColors,
+    # of a face-relative vertex
+    def getIndex(self, topology, faceId, faceVertexId):
+        return int(topology['faceOffsets'][faceId]) + faceVertexId
+
+    # Callbacks are registered once per node. A deleted node
+    # keeps its callbacks until the delete can no longer be
+    # undone, so a node that comes back reuses them.
+    def addCallbacks(self, hashCode, mObject):
+        if hashCode in self.callbackDict:
+            handle, callbackIDs = self.callbackDict[hashCode]
+            if handle.isValid() and (handle.object() == mObject):
+                return
+            self.removeCallbacks(callbackIDs)
+        self.callbackDict[hashCode] = (
+            OM.MObjectHandle(mObject), (
+                OM.MPolyMessage.addPolyTopologyChangedCallback(
+                    mObject,
+                    lambda *args: self.invalidate(hashCode)),
+                OM.MNodeMessage.addNodePreRemovalCallback(
+                    mObject,
+                    lambda *args: self.invalidate(hashCode))))
+
+    def removeCallbacks(self, callbackIDs):
+        for callbackID in callbackIDs:
+            # Callbacks of deleted nodes are already gone
+            try:
+                OM.MMessage.removeCallback(callbackID)
+            except RuntimeError:
+                pass
+
+    def invalidate(self, hashCode):
+        self.shapeDict.pop(hashCode, None)
+
+    def clear(self):
+        self.shapeDict.clear()
+        for handle, callbackIDs in self.callbackDict.values():
+            self.removeCallbacks(callbackIDs)
+        self.callbackDict.clear()
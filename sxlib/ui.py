@@ -6,6 +6,7 @@
 
 import maya.cmds
 import maya.mel as mel
+import sxlib.blendmodes as blendmodes
 import sxglobals
 
 
@@ -13,11 +14,79 @@ class UI(object):
     def __init__(self):
         self.history = False
         self.multiShapes = False
+        # Layout of the layer tools view currently built,
+        # None if another view is shown
+        self.layoutKey = None
+        # Tool frames are filled in when first expanded
+        self.frameBuilders = {}
+        self.builtFrames = set()
         return None
 
     def __del__(self):
         print('SX Tools: Exiting UI')
 
+    # Everything that changes the structure of the layer tools view.
+    # Selection changes with the same key only update control values.
+    def getLayoutKey(self):
+        return (
+            self.history,
+            self.multiShapes,
+            sxglobals.settings.project['LayerCount'],
+            sxglobals.settings.project['ChannelCount'],
+            tuple(sxglobals.settings.refArray),
+            sxglobals.settings.tools['displayScale'],
+            sxglobals.settings.tools['profilerEnable'])
+
+    # Pushes the values of the current selection
+    # into the controls of the layer tools view
+    def updateLayerToolsUI(self):
+        sxglobals.tools.verifyShadingMode()
+        self.refreshLayerSetButtons()
+        self.refreshClearButton()
+        if 'creaseFrame' in self.builtFrames:
+            self.refreshCreaseButtons()
+        if 'skinMeshFrame' in self.builtFrames:
+            self.refreshSkinMeshUI()
+        if 'exportFlagsFrame' in self.builtFrames:
+            self.refreshExportFlags()
+        if 'profilerFrame' in self.builtFrames:
+            self.refreshProfilerUI()
+
+    # Creates a collapsable tool frame. The contents of a collapsed
+    # frame are only built by buildFrame when the user expands it.
+    def toolFrame(self, frame, parent, collapseKey, buildFunction, **kwargs):
+        collapsed = sxglobals.settings.frames[collapseKey]
+        maya.cmds.frameLayout(
+            frame,
+            parent=parent,
+            collapsable=True,
+            collapse=collapsed,
+            collapseCommand=(
+                "sxtools.sxglobals.settings.frames['" + collapseKey + "']=True"),
+            expandCommand=(
+                "sxtools.sxglobals.settings.frames['" + collapseKey + "']=False\n"
+                "sxtools.sxglobals.ui.buildFrame('" + frame + "')"),
+            **kwargs)
+        self.frameBuilders[frame] = buildFunction
+        self.builtFrames.discard(frame)
+        if collapsed:
+            maya.cmds.text(frame + 'Placeholder', parent=frame, label='')
+        else:
+            self.buildFrame(frame)
+        maya.cmds.setParent(parent)
+
+    def buildFrame(self, frame):
+        if (frame in self.builtFrames or
+                not maya.cmds.frameLayout(frame, exists=True)):
+            return
+        if maya.cmds.text(frame + 'Placeholder', exists=True):
+            maya.cmds.deleteUI(frame + 'Placeholder')
+        parent = maya.cmds.setParent(query=True)
+        maya.cmds.setParent(frame)
+        self.builtFrames.add(frame)
+        self.frameBuilders[frame]()
+        maya.cmds.setParent(parent)
+
     def calculateDivision(self):
         paneHeight = maya.cmds.workspaceControl(sxglobals.dockID, query=True, height=True)
         if sxglobals.settings.frames['paneDivision'] == 0:
@@ -131,6 +200,75 @@ class UI(object):
             onCommand='maya.cmds.constructionHistory(toggle=True)',
             offCommand='maya.cmds.constructionHistory(toggle=False)')
 
+        maya.cmds.checkBox(
+            'profilerToggle',
+            label='Profiler Enabled',
+            value=sxglobals.settings.tools['profilerEnable'],
+            ann=(
+                'Records the timings of refreshes, tools and exports,\n'
+                'and shows a summary below the layer tools.'),
+            onCommand='sxtools.sxglobals.profiler.setEnabled(True)',
+            offCommand='sxtools.sxglobals.profiler.setEnabled(False)')
+
+        maya.cmds.rowColumnLayout(
+            'compositeWorkersRowColumns',
+            parent='prefsFrame',
+            numberOfColumns=2,
+            columnWidth=((1, 130), (2, 60)),
+            columnAttach=[(1, 'left', 0), (2, 'both', 5)])
+
+        maya.cmds.text('compositeWorkersLabel', label='Compositing threads:')
+        maya.cmds.intField(
+            'compositeWorkers',
+            value=sxglobals.settings.tools['compositeWorkers'],
+            ann=(
+                'The number of threads used to blend layers when\n'
+                'several objects are selected.'),
+            minValue=1,
+            maxValue=64,
+            changeCommand=(
+                "sxtools.sxglobals.settings.tools['compositeWorkers'] = ("
+                "maya.cmds.intField('compositeWorkers', query=True, value=True))"))
+
+        maya.cmds.text('compositeCacheSizeLabel', label='Composite cache (MB):')
+        maya.cmds.intField(
+            'compositeCacheSize',
+            value=sxglobals.settings.tools['compositeCacheSize'],
+            ann=(
+                'Memory used to keep finished composites, so that\n'
+                'refreshes without color changes skip compositing.'),
+            minValue=0,
+            maxValue=65536,
+            changeCommand=(
+                "sxtools.sxglobals.settings.tools['compositeCacheSize'] = ("
+                "maya.cmds.intField('compositeCacheSize', query=True, value=True))"))
+
+        maya.cmds.text('occlusionWorkersLabel', label='Occlusion processes:')
+        maya.cmds.intField(
+            'occlusionWorkers',
+            value=sxglobals.settings.tools['occlusionWorkers'],
+            ann=(
+                'The number of processes used to bake occlusion,\n'
+                '0 uses all CPU cores.'),
+            minValue=0,
+            maxValue=256,
+            changeCommand=(
+                "sxtools.sxglobals.settings.tools['occlusionWorkers'] = ("
+                "maya.cmds.intField('occlusionWorkers', query=True, value=True))"))
+
+        maya.cmds.text('occlusionChunkSizeLabel', label='Occlusion chunk size:')
+        maya.cmds.intField(
+            'occlusionChunkSize',
+            value=sxglobals.settings.tools['occlusionChunkSize'],
+            ann=(
+                'The largest number of vertices baked\n'
+                'by a process at a time.'),
+            minValue=64,
+            maxValue=65536,
+            changeCommand=(
+                "sxtools.sxglobals.settings.tools['occlusionChunkSize'] = ("
+                "maya.cmds.intField('occlusionChunkSize', query=True, value=True))"))
+
         maya.cmds.button(
             'resetButton',
             label='Reset SX Tools',
@@ -820,50 +958,7 @@ class UI(object):
                 '+".activeLayerSet"))+2, True)\n'
                 'sxtools.sxglobals.core.updateSXTools()'))
 
-        # Validity check for adding Layer Sets
-        setNums = []
-        for object in sxglobals.settings.objectArray:
-            setNums.append(int(maya.cmds.getAttr(object + '.numLayerSets')))
-        if all(num == setNums[0] for num in setNums):
-            maya.cmds.button(
-                'addNewLayerSetButton',
-                edit=True,
-                enable=True)
-        else:
-            print('SX Tools: Objects with mismatching Layer Sets selected!')
-
-
-        if sxglobals.layers.getLayerSets(sxglobals.settings.objectArray[0]) > 0:
-            maya.cmds.button(
-                'deleteLayerSetButton',
-                edit=True,
-                enable=True)
-            maya.cmds.button(
-                'nextLayerSetButton',
-                edit=True,
-                enable=True)
-            maya.cmds.button(
-                'previousLayerSetButton',
-                edit=True,
-                enable=True)
-
-        if sxglobals.layers.getLayerSets(sxglobals.settings.objectArray[0]) == 9:
-            maya.cmds.button(
-                'addNewLayerSetButton',
-                edit=True,
-                enable=False)
-
-        if maya.cmds.getAttr(str(sxglobals.settings.shapeArray[0]) + '.activeLayerSet') == sxglobals.layers.getLayerSets(sxglobals.settings.objectArray[0]):
-            maya.cmds.button(
-                'nextLayerSetButton',
-                edit=True,
-                enable=False)
-
-        if maya.cmds.getAttr(str(sxglobals.settings.shapeArray[0]) + '.activeLayerSet') == 0:
-            maya.cmds.button(
-                'previousLayerSetButton',
-                edit=True,
-                enable=False)
+        self.refreshLayerSetButtons()
 
         maya.cmds.popupMenu(
             'layerPopUp',
@@ -936,32 +1031,15 @@ class UI(object):
             height=20,
             statusBarMessage='Shift-click button to invert selection',
             command="maya.cmds.select(sxtools.sxglobals.tools.getLayerMask())")
-        if len(sxglobals.settings.componentArray) > 0:
-            maya.cmds.button(
-                'clearButton',
-                label='Clear Selected',
-                statusBarMessage=(
-                    'Shift-click button to clear '
-                    'all layers on selected components'),
-                width=100,
-                height=20,
-                command=(
-                    "sxtools.sxglobals.tools.clearSelector()\n"
-                    "sxtools.sxglobals.layers.refreshLayerList()\n"
-                    "sxtools.sxglobals.layers.compositeLayers()"))
-        else:
-            maya.cmds.button(
-                'clearButton',
-                label='Clear Layer',
-                statusBarMessage=(
-                    'Shift-click button to clear'
-                    'all layers on selected objects'),
-                width=100,
-                height=20,
-                command=(
-                    "sxtools.sxglobals.tools.clearSelector()\n"
-                    "sxtools.sxglobals.layers.refreshLayerList()\n"
-                    "sxtools.sxglobals.layers.compositeLayers()"))
+        maya.cmds.button(
+            'clearButton',
+            width=100,
+            height=20,
+            command=(
+                "sxtools.sxglobals.tools.clearSelector()\n"
+                "sxtools.sxglobals.layers.refreshLayerList()\n"
+                "sxtools.sxglobals.layers.compositeLayers()"))
+        self.refreshClearButton()
 
         maya.cmds.rowColumnLayout(
             'layerRowColumns',
@@ -978,18 +1056,10 @@ class UI(object):
             'layerBlendModes',
             parent='layerRowColumns',
             changeCommand='sxtools.sxglobals.tools.setLayerBlendMode()')
-        maya.cmds.menuItem(
-            'alphaBlend',
-            label='Alpha',
-            parent='layerBlendModes')
-        maya.cmds.menuItem(
-            'additiveBlend',
-            label='Add',
-            parent='layerBlendModes')
-        maya.cmds.menuItem(
-            'multiplyBlend',
-            label='Multiply',
-            parent='layerBlendModes')
+        for blendMode in blendmodes.blendModes:
+            maya.cmds.menuItem(
+                label=blendMode[0],
+                parent='layerBlendModes')
 
         maya.cmds.text(
             'layerColorLabel',
@@ -1017,22 +1087,69 @@ class UI(object):
             changeCommand=(
                 "sxtools.sxglobals.tools.setLayerOpacity()\n"
                 "sxtools.sxglobals.layers.refreshLayerList()\n"
-                "sxtools.sxglobals.layers.compositeLayers()"))
+                "sxtools.sxglobals.layers.compositeLayers("
+                "[sxtools.sxglobals.settings.tools['selectedLayer'], ])"))
+
+    def refreshLayerSetButtons(self):
+        # Validity check for adding Layer Sets
+        setNums = []
+        for object in sxglobals.settings.objectArray:
+            setNums.append(int(maya.cmds.getAttr(object + '.numLayerSets')))
+        matchingSets = all(num == setNums[0] for num in setNums)
+        if not matchingSets:
+            print('SX Tools: Objects with mismatching Layer Sets selected!')
+
+        layerSets = sxglobals.layers.getLayerSets(sxglobals.settings.objectArray[0])
+        activeLayerSet = maya.cmds.getAttr(
+            str(sxglobals.settings.shapeArray[0]) + '.activeLayerSet')
+
+        maya.cmds.button(
+            'addNewLayerSetButton',
+            edit=True,
+            enable=(matchingSets and (layerSets != 9)))
+        maya.cmds.button(
+            'deleteLayerSetButton',
+            edit=True,
+            enable=(layerSets > 0))
+        maya.cmds.button(
+            'nextLayerSetButton',
+            edit=True,
+            enable=((layerSets > 0) and (activeLayerSet != layerSets)))
+        maya.cmds.button(
+            'previousLayerSetButton',
+            edit=True,
+            enable=((layerSets > 0) and (activeLayerSet != 0)))
+
+    def refreshClearButton(self):
+        if len(sxglobals.settings.componentArray) > 0:
+            maya.cmds.button(
+                'clearButton',
+                edit=True,
+                label='Clear Selected',
+                statusBarMessage=(
+                    'Shift-click button to clear '
+                    'all layers on selected components'))
+        else:
+            maya.cmds.button(
+                'clearButton',
+                edit=True,
+                label='Clear Layer',
+                statusBarMessage=(
+                    'Shift-click button to clear'
+                    'all layers on selected objects'))
 
     def applyColorToolUI(self):
-        maya.cmds.frameLayout(
-            "applyColorFrame",
-            parent="canvas",
-            label="Apply Color",
+        self.toolFrame(
+            'applyColorFrame',
+            'canvas',
+            'applyColorCollapse',
+            self.applyColorToolContents,
+            label='Apply Color',
             width=250,
             marginWidth=5,
-            marginHeight=2,
-            collapsable=True,
-            collapse=sxglobals.settings.frames['applyColorCollapse'],
-            collapseCommand=(
-                "sxtools.sxglobals.settings.frames['applyColorCollapse']=True"),
-            expandCommand=(
-                "sxtools.sxglobals.settings.frames['applyColorCollapse']=False"))
+            marginHeight=2)
+
+    def applyColorToolContents(self):
         maya.cmds.button(
             parent='applyColorFrame',
             label='Paint Vertex Colors',
@@ -1183,20 +1300,18 @@ class UI(object):
             maya.cmds.setAttr('SXAlphaRamp.colorEntryList[1].position', 0)
             maya.cmds.setAttr('SXAlphaRamp.colorEntryList[1].color', 1, 1, 1)
 
-        maya.cmds.frameLayout(
-            "gradientFrame",
-            parent="canvas",
-            label="Gradient Fill",
+        self.toolFrame(
+            'gradientFrame',
+            'canvas',
+            'gradientCollapse',
+            self.gradientToolContents,
+            label='Gradient Fill',
             width=250,
             marginWidth=5,
             marginHeight=2,
-            collapsable=True,
-            collapse=sxglobals.settings.frames['gradientCollapse'],
-            collapseCommand=(
-                "sxtools.sxglobals.settings.frames['gradientCollapse']=True"),
-            expandCommand=(
-                "sxtools.sxglobals.settings.frames['gradientCollapse']=False"),
             borderVisible=False)
+
+    def gradientToolContents(self):
         maya.cmds.rowColumnLayout(
             'gradientRowColumns',
             parent='gradientFrame',
@@ -1299,19 +1414,17 @@ class UI(object):
         maya.cmds.setParent('canvas')
 
     def bakeOcclusionToolUI(self):
-        maya.cmds.frameLayout(
+        self.toolFrame(
             'occlusionFrame',
-            parent='canvas',
+            'canvas',
+            'occlusionCollapse',
+            self.bakeOcclusionToolContents,
             label='Bake Occlusion',
             width=250,
             marginWidth=5,
-            marginHeight=2,
-            collapsable=True,
-            collapse=sxglobals.settings.frames['occlusionCollapse'],
-            collapseCommand=(
-                "sxtools.sxglobals.settings.frames['occlusionCollapse']=True"),
-            expandCommand=(
-                "sxtools.sxglobals.settings.frames['occlusionCollapse']=False"))
+            marginHeight=2)
+
+    def bakeOcclusionToolContents(self):
         maya.cmds.text(
             label=(
                 "Occlusion groundplane is placed "
@@ -1379,6 +1492,46 @@ class UI(object):
                 "sxtools.sxglobals.settings.tools['bias'] = ("
                 "maya.cmds.floatField('bias', query=True, value=True))"))
 
+        maya.cmds.text('occlusionProgressiveLabel', label='Progressive:')
+        maya.cmds.checkBox(
+            'occlusionProgressive',
+            label='',
+            value=sxglobals.settings.tools['occlusionProgressive'],
+            ann=(
+                'Bakes with 16 and 64 rays before the full ray count.\n'
+                'Press Esc to stop and keep the last finished pass.'),
+            changeCommand=(
+                "sxtools.sxglobals.settings.tools['occlusionProgressive'] = ("
+                "maya.cmds.checkBox('occlusionProgressive', query=True, value=True))"))
+
+        maya.cmds.text('occlusionSamplingLabel', label='Sampling:')
+        maya.cmds.optionMenu(
+            'occlusionSampling',
+            ann=(
+                'Hammersley rays give the least noise for a ray count,\n'
+                'every method gives the same result on every bake.'),
+            changeCommand=(
+                "sxtools.sxglobals.settings.tools['occlusionSampling'] = ("
+                "str(maya.cmds.optionMenu('occlusionSampling', query=True, value=True).lower()))"))
+        for method in ('Hammersley', 'Stratified', 'Random'):
+            maya.cmds.menuItem(label=method)
+        maya.cmds.optionMenu(
+            'occlusionSampling',
+            edit=True,
+            value=sxglobals.settings.tools['occlusionSampling'].capitalize())
+
+        maya.cmds.text('occlusionCacheLabel', label='Cache Results:')
+        maya.cmds.checkBox(
+            'occlusionCache',
+            label='',
+            value=sxglobals.settings.tools['occlusionCache'],
+            ann=(
+                'Stores bakes in the cache folder of the Maya project.\n'
+                'Objects that have not changed since are not baked again.'),
+            changeCommand=(
+                "sxtools.sxglobals.settings.tools['occlusionCache'] = ("
+                "maya.cmds.checkBox('occlusionCache', query=True, value=True))"))
+
         maya.cmds.rowColumnLayout(
             'occlusionRowColumns',
             parent='occlusionFrame',
@@ -1456,6 +1609,13 @@ class UI(object):
                 'sxtools.sxglobals.tools.bakeBlendOcclusion()\n'
                 'sxtools.sxglobals.settings.saveFile(0)'))
 
+        maya.cmds.button(
+            label='Clear Occlusion Cache',
+            parent='occlusionFrame',
+            height=20,
+            width=100,
+            command='sxtools.sxglobals.tools.clearOcclusionCache()')
+
         plugList = maya.cmds.pluginInfo(query=True, listPlugins=True)
         if 'Mayatomr' in plugList:
             maya.cmds.button(
@@ -1502,22 +1662,20 @@ class UI(object):
                 select=sxglobals.settings.tools['materialCategoryPreset'])
 
     def masterPaletteToolUI(self):
-        if ((maya.cmds.optionVar(exists='SXToolsPalettesFile')) and
-           (len(str(maya.cmds.optionVar(query='SXToolsPalettesFile'))) > 0)):
-            sxglobals.settings.loadFile(1)
-        maya.cmds.frameLayout(
+        self.toolFrame(
             'masterPaletteFrame',
-            parent='canvas',
+            'canvas',
+            'masterPaletteCollapse',
+            self.masterPaletteToolContents,
             label='Apply Master Palette',
             width=250,
             marginWidth=5,
-            marginHeight=5,
-            collapsable=True,
-            collapse=sxglobals.settings.frames['masterPaletteCollapse'],
-            collapseCommand=(
-                "sxtools.sxglobals.settings.frames['masterPaletteCollapse']=True"),
-            expandCommand=(
-                "sxtools.sxglobals.settings.frames['masterPaletteCollapse']=False"))
+            marginHeight=5)
+
+    def masterPaletteToolContents(self):
+        if ((maya.cmds.optionVar(exists='SXToolsPalettesFile')) and
+           (len(str(maya.cmds.optionVar(query='SXToolsPalettesFile'))) > 0)):
+            sxglobals.settings.loadFile(1)
 
         maya.cmds.frameLayout(
             'paletteCategoryFrame',
@@ -1531,82 +1689,7 @@ class UI(object):
                 "sxtools.sxglobals.settings.frames['paletteCategoryCollapse']=True"),
             expandCommand=(
                 "sxtools.sxglobals.settings.frames['paletteCategoryCollapse']=False"))
-        if len(sxglobals.settings.masterPaletteArray) > 0:
-            for categoryDict in sxglobals.settings.masterPaletteArray:
-                if categoryDict.keys()[0]+'Collapse' not in sxglobals.settings.frames:
-                    sxglobals.settings.frames[categoryDict.keys()[0]+'Collapse'] = True
-                maya.cmds.frameLayout(
-                    categoryDict.keys()[0],
-                    parent='paletteCategoryFrame',
-                    label=categoryDict.keys()[0],
-                    marginWidth=0,
-                    marginHeight=0,
-                    enableBackground=True,
-                    backgroundColor=[0.32, 0.32, 0.32],
-                    collapsable=True,
-                    collapse=(
-                        sxglobals.settings.frames[categoryDict.keys()[0]+'Collapse']),
-                    collapseCommand=(
-                        'sxtools.sxglobals.settings.frames["' +
-                        categoryDict.keys()[0]+'"+"Collapse"]=True'),
-                    expandCommand=(
-                        'sxtools.sxglobals.settings.frames["' +
-                        categoryDict.keys()[0]+'"+"Collapse"]=False'))
-                if len(categoryDict[categoryDict.keys()[0]]) > 0:
-                    for i, (name) in enumerate(
-                       categoryDict[categoryDict.keys()[0]].keys()):
-                        stripeColor = []
-                        if i % 2 == 0:
-                            stripeColor = [0.22, 0.22, 0.22]
-                        else:
-                            stripeColor = [0.24, 0.24, 0.24]
-                        maya.cmds.rowColumnLayout(
-                            categoryDict.keys()[0]+name,
-                            parent=categoryDict.keys()[0],
-                            numberOfColumns=3,
-                            enableBackground=True,
-                            backgroundColor=stripeColor,
-                            columnWidth=((1, 90), (2, 90), (3, 40)),
-                            columnAttach=[
-                                (1, 'both', 0),
-                                (2, 'right', 5),
-                                (3, 'right', 0)],
-                            rowSpacing=(1, 0))
-                        maya.cmds.text(
-                            label=name,
-                            align='right',
-                            font='smallPlainLabelFont')
-                        maya.cmds.palettePort(
-                            categoryDict.keys()[0]+name+'Palette',
-                            dimensions=(5, 1),
-                            width=80,
-                            height=20,
-                            actualTotal=5,
-                            editable=True,
-                            colorEditable=False,
-                            changeCommand=(
-                                'sxtools.sxglobals.settings.currentColor = '
-                                'maya.cmds.palettePort(' +
-                                '\"'+categoryDict.keys()[0]+name +
-                                'Palette'+'\", query=True, rgb=True)\n'
-                                'sxtools.sxglobals.tools.setMasterPalette(' +
-                                '\"'+categoryDict.keys()[0] +
-                                '\", \"'+name+'\")\n'
-                                'sxtools.sxglobals.tools.setPaintColor('
-                                'sxtools.sxglobals.settings.currentColor)'))
-                        sxglobals.tools.getPalette(
-                            categoryDict.keys()[0]+name+'Palette',
-                            categoryDict.keys()[0],
-                            name)
-                        maya.cmds.button(
-                            categoryDict.keys()[0]+name+'Button',
-                            label='Apply',
-                            height=20,
-                            ann='Shift-click to delete palette',
-                            command=(
-                                'sxtools.sxglobals.tools.paletteButtonManager(' +
-                                '\"'+categoryDict.keys()[0] +
-                                '\", \"'+name+'\")'))
+        self.paletteLibraryUI(1)
 
         maya.cmds.frameLayout(
             'createPaletteFrame',
@@ -1836,22 +1919,20 @@ class UI(object):
         maya.cmds.setParent('canvas')
 
     def materialToolUI(self):
-        if ((maya.cmds.optionVar(exists='SXToolsMaterialsFile')) and
-           (len(str(maya.cmds.optionVar(query='SXToolsMaterialsFile'))) > 0)):
-            sxglobals.settings.loadFile(2)
-        maya.cmds.frameLayout(
+        self.toolFrame(
             'materialsFrame',
-            parent='canvas',
+            'canvas',
+            'materialsCollapse',
+            self.materialToolContents,
             label='Apply PBR Material',
             width=250,
             marginWidth=5,
-            marginHeight=5,
-            collapsable=True,
-            collapse=sxglobals.settings.frames['materialsCollapse'],
-            collapseCommand=(
-                "sxtools.sxglobals.settings.frames['materialsCollapse']=True"),
-            expandCommand=(
-                "sxtools.sxglobals.settings.frames['materialsCollapse']=False"))
+            marginHeight=5)
+
+    def materialToolContents(self):
+        if ((maya.cmds.optionVar(exists='SXToolsMaterialsFile')) and
+           (len(str(maya.cmds.optionVar(query='SXToolsMaterialsFile'))) > 0)):
+            sxglobals.settings.loadFile(2)
 
         maya.cmds.frameLayout(
             'materialCategoryFrame',
@@ -1865,82 +1946,7 @@ class UI(object):
                 "sxtools.sxglobals.settings.frames['materialCategoryCollapse']=True"),
             expandCommand=(
                 "sxtools.sxglobals.settings.frames['materialCategoryCollapse']=False"))
-        if len(sxglobals.settings.materialArray) > 0:
-            for categoryDict in sxglobals.settings.materialArray:
-                if categoryDict.keys()[0]+'Collapse' not in sxglobals.settings.frames:
-                    sxglobals.settings.frames[categoryDict.keys()[0]+'Collapse'] = True
-                maya.cmds.frameLayout(
-                    categoryDict.keys()[0],
-                    parent='materialCategoryFrame',
-                    label=categoryDict.keys()[0],
-                    marginWidth=0,
-                    marginHeight=0,
-                    enableBackground=True,
-                    backgroundColor=[0.32, 0.32, 0.32],
-                    collapsable=True,
-                    collapse=(
-                        sxglobals.settings.frames[categoryDict.keys()[0]+'Collapse']),
-                    collapseCommand=(
-                        'sxtools.sxglobals.settings.frames["' +
-                        categoryDict.keys()[0]+'"+"Collapse"]=True'),
-                    expandCommand=(
-                        'sxtools.sxglobals.settings.frames["' +
-                        categoryDict.keys()[0]+'"+"Collapse"]=False'))
-                if len(categoryDict[categoryDict.keys()[0]]) > 0:
-                    for i, (name) in enumerate(
-                       categoryDict[categoryDict.keys()[0]].keys()):
-                        stripeColor = []
-                        if i % 2 == 0:
-                            stripeColor = [0.22, 0.22, 0.22]
-                        else:
-                            stripeColor = [0.24, 0.24, 0.24]
-                        maya.cmds.rowColumnLayout(
-                            categoryDict.keys()[0]+name,
-                            parent=categoryDict.keys()[0],
-                            numberOfColumns=3,
-                            enableBackground=True,
-                            backgroundColor=stripeColor,
-                            columnWidth=((1, 90), (2, 90), (3, 40)),
-                            columnAttach=[
-                                (1, 'both', 0),
-                                (2, 'right', 5),
-                                (3, 'right', 0)],
-                            rowSpacing=(1, 0))
-                        maya.cmds.text(
-                            label=name,
-                            align='right',
-                            font='smallPlainLabelFont')
-                        maya.cmds.palettePort(
-                            categoryDict.keys()[0]+name+'Material',
-                            dimensions=(3, 1),
-                            width=80,
-                            height=20,
-                            actualTotal=3,
-                            editable=True,
-                            colorEditable=False,
-                            changeCommand=(
-                                'sxtools.sxglobals.settings.currentColor = '
-                                'maya.cmds.palettePort(' +
-                                '\"'+categoryDict.keys()[0]+name +
-                                'Material'+'\", query=True, rgb=True)\n'
-                                'sxtools.sxglobals.tools.setMaterialPalette(' +
-                                '\"'+categoryDict.keys()[0] +
-                                '\", \"'+name+'\")\n'
-                                'sxtools.sxglobals.tools.setPaintColor('
-                                'sxtools.sxglobals.settings.currentColor)'))
-                        sxglobals.tools.getPalette(
-                            categoryDict.keys()[0]+name+'Material',
-                            categoryDict.keys()[0],
-                            name)
-                        maya.cmds.button(
-                            categoryDict.keys()[0]+name+'Button',
-                            label='Apply',
-                            height=20,
-                            ann='Shift-click to delete material',
-                            command=(
-                                'sxtools.sxglobals.tools.materialButtonManager(' +
-                                '\"'+categoryDict.keys()[0] +
-                                '\", \"'+name+'\")'))
+        self.paletteLibraryUI(2)
 
         maya.cmds.frameLayout(
             'createMaterialFrame',
@@ -2106,6 +2112,166 @@ class UI(object):
 
         maya.cmds.setParent('canvas')
 
+    # Search field and category list of the master palette (mode 1)
+    # or material (mode 2) library
+    def paletteLibraryUI(self, mode):
+        if mode == 1:
+            frame = 'paletteCategoryFrame'
+        else:
+            frame = 'materialCategoryFrame'
+        maya.cmds.textField(
+            frame + 'Search',
+            parent=frame,
+            text=sxglobals.library.filterDict[mode],
+            placeholderText='Search',
+            changeCommand=(
+                'sxtools.sxglobals.library.setFilter(' + str(mode) + ', '
+                'maya.cmds.textField("' + frame + 'Search", '
+                'query=True, text=True))\n'
+                'sxtools.sxglobals.ui.refreshPaletteLibrary(' + str(mode) + ')'),
+            enterCommand=("maya.cmds.setFocus('MayaWindow')"))
+        maya.cmds.columnLayout(
+            frame + 'Column',
+            parent=frame,
+            adjustableColumn=True)
+        self.paletteCategoriesUI(mode)
+        maya.cmds.setParent(frame)
+
+    # Category frames are built collapsed and empty,
+    # rows are only created for expanded categories
+    def paletteCategoriesUI(self, mode):
+        if mode == 1:
+            column = 'paletteCategoryFrameColumn'
+        else:
+            column = 'materialCategoryFrameColumn'
+        results = sxglobals.library.search(mode)
+        for category, entries in results:
+            if category+'Collapse' not in sxglobals.settings.frames:
+                sxglobals.settings.frames[category+'Collapse'] = True
+            self.toolFrame(
+                category,
+                column,
+                category+'Collapse',
+                (lambda mode=mode, category=category:
+                    self.paletteCategoryContents(mode, category)),
+                label=category,
+                marginWidth=0,
+                marginHeight=0,
+                enableBackground=True,
+                backgroundColor=[0.32, 0.32, 0.32])
+        if len(results) == 0 and len(sxglobals.library.filterDict[mode]) > 0:
+            maya.cmds.text(
+                parent=column,
+                label='No matches',
+                height=20)
+
+    def refreshPaletteLibrary(self, mode):
+        if mode == 1:
+            column = 'paletteCategoryFrameColumn'
+        else:
+            column = 'materialCategoryFrameColumn'
+        if maya.cmds.columnLayout(column, exists=True):
+            children = maya.cmds.columnLayout(
+                column, query=True, childArray=True)
+            if children is not None:
+                maya.cmds.deleteUI(children)
+            self.paletteCategoriesUI(mode)
+
+    # Builds the rows of a category from the start index up to
+    # the current page size, and sets their swatches in one batch
+    def paletteCategoryContents(self, mode, category, start=0):
+        entries = []
+        for resultCategory, resultEntries in sxglobals.library.search(mode):
+            if resultCategory == category:
+                entries = resultEntries
+        pageSize = sxglobals.library.getPageSize(mode, category)
+
+        if mode == 1:
+            suffix = 'Palette'
+            numColors = 5
+            setCommand = 'sxtools.sxglobals.tools.setMasterPalette('
+            buttonCommand = 'sxtools.sxglobals.tools.paletteButtonManager('
+            annotation = 'Shift-click to delete palette'
+        else:
+            suffix = 'Material'
+            numColors = 3
+            setCommand = 'sxtools.sxglobals.tools.setMaterialPalette('
+            buttonCommand = 'sxtools.sxglobals.tools.materialButtonManager('
+            annotation = 'Shift-click to delete material'
+
+        swatches = []
+        for i in xrange(start, min(pageSize, len(entries))):
+            name = entries[i]['name']
+            stripeColor = []
+            if i % 2 == 0:
+                stripeColor = [0.22, 0.22, 0.22]
+            else:
+                stripeColor = [0.24, 0.24, 0.24]
+            maya.cmds.rowColumnLayout(
+                category+name,
+                parent=category,
+                numberOfColumns=3,
+                enableBackground=True,
+                backgroundColor=stripeColor,
+                columnWidth=((1, 90), (2, 90), (3, 40)),
+                columnAttach=[
+                    (1, 'both', 0),
+                    (2, 'right', 5),
+                    (3, 'right', 0)],
+                rowSpacing=(1, 0))
+            maya.cmds.text(
+                label=name,
+                align='right',
+                font='smallPlainLabelFont')
+            maya.cmds.palettePort(
+                category+name+suffix,
+                dimensions=(numColors, 1),
+                width=80,
+                height=20,
+                actualTotal=numColors,
+                editable=True,
+                colorEditable=False,
+                changeCommand=(
+                    'sxtools.sxglobals.settings.currentColor = '
+                    'maya.cmds.palettePort(' +
+                    '\"'+category+name+suffix +
+                    '\", query=True, rgb=True)\n' +
+                    setCommand +
+                    '\"'+category +
+                    '\", \"'+name+'\")\n'
+                    'sxtools.sxglobals.tools.setPaintColor('
+                    'sxtools.sxglobals.settings.currentColor)'))
+            swatches.append((category+name+suffix, entries[i]['colors']))
+            maya.cmds.button(
+                category+name+'Button',
+                label='Apply',
+                height=20,
+                ann=annotation,
+                command=(
+                    buttonCommand +
+                    '\"'+category +
+                    '\", \"'+name+'\")'))
+
+        if len(entries) > pageSize:
+            maya.cmds.button(
+                category+'MoreButton',
+                parent=category,
+                label='Show More (' + str(len(entries) - pageSize) + ')',
+                height=20,
+                command=(
+                    'sxtools.sxglobals.ui.showMoreRows(' +
+                    str(mode) + ', \"' + category + '\")'))
+
+        sxglobals.library.setSwatches(swatches)
+        maya.cmds.setParent(category)
+
+    def showMoreRows(self, mode, category):
+        start = sxglobals.library.getPageSize(mode, category)
+        sxglobals.library.nextPage(mode, category)
+        if maya.cmds.button(category+'MoreButton', exists=True):
+            maya.cmds.deleteUI(category+'MoreButton')
+        self.paletteCategoryContents(mode, category, start)
+
     def assignCreaseToolUI(self):
         if not maya.cmds.objExists('SXCreaseRamp'):
             maya.cmds.createNode('ramp', name='SXCreaseRamp', skipSelect=True)
@@ -2128,19 +2294,17 @@ class UI(object):
         maya.cmds.setAttr(
             'SXCreaseRamp.interpolation', 0)
 
-        maya.cmds.frameLayout(
+        self.toolFrame(
             'creaseFrame',
-            parent='canvas',
+            'canvas',
+            'creaseCollapse',
+            self.assignCreaseToolContents,
             label='Assign to Crease Set',
             width=250,
             marginWidth=5,
-            marginHeight=2,
-            collapsable=True,
-            collapse=sxglobals.settings.frames['creaseCollapse'],
-            collapseCommand=(
-                "sxtools.sxglobals.settings.frames['creaseCollapse']=True"),
-            expandCommand=(
-                "sxtools.sxglobals.settings.frames['creaseCollapse']=False"))
+            marginHeight=2)
+
+    def assignCreaseToolContents(self):
         maya.cmds.frameLayout(
             'autoCreaseFrame',
             parent='creaseFrame',
@@ -2200,21 +2364,6 @@ class UI(object):
                 "sxtools.sxglobals.tools.curvatureSelect("
                 "sxtools.sxglobals.settings.shapeArray)"))
 
-        bgc1 = (0.365, 0.365, 0.365)
-        bgc2 = (0.365, 0.365, 0.365)
-        bgc3 = (0.365, 0.365, 0.365)
-        bgc4 = (0.365, 0.365, 0.365)
-
-        if len(sxglobals.settings.componentArray) > 0:
-            if maya.cmds.sets(sxglobals.settings.componentArray, im='sxCrease4'):
-                bgc4 = (0.255, 0.302, 0.353)
-            elif maya.cmds.sets(sxglobals.settings.componentArray, im='sxCrease3'):
-                bgc3 = (0.255, 0.302, 0.353)
-            elif maya.cmds.sets(sxglobals.settings.componentArray, im='sxCrease2'):
-                bgc2 = (0.255, 0.302, 0.353)
-            elif maya.cmds.sets(sxglobals.settings.componentArray, im='sxCrease1'):
-                bgc1 = (0.255, 0.302, 0.353)
-
         maya.cmds.rowColumnLayout(
             'creaseRowColumns',
             parent='creaseFrame',
@@ -2223,28 +2372,28 @@ class UI(object):
             columnAttach=[(1, 'both', 5), (2, 'both', 5), (3, 'both', 5), (4, 'both', 5)],
             rowSpacing=(1, 5))
         maya.cmds.button(
+            'crease1Button',
             label='25%',
             parent='creaseRowColumns',
             height=30,
-            bgc=bgc1,
             command=("sxtools.sxglobals.tools.assignToCreaseSet('sxCrease1')"))
         maya.cmds.button(
+            'crease2Button',
             label='50%',
             parent='creaseRowColumns',
             height=30,
-            bgc=bgc2,
             command=("sxtools.sxglobals.tools.assignToCreaseSet('sxCrease2')"))
         maya.cmds.button(
+            'crease3Button',
             label='75%',
             parent='creaseRowColumns',
             height=30,
-            bgc=bgc3,
             command=("sxtools.sxglobals.tools.assignToCreaseSet('sxCrease3')"))
         maya.cmds.button(
+            'crease4Button',
             label='Hard',
             parent='creaseRowColumns',
             height=30,
-            bgc=bgc4,
             command=("sxtools.sxglobals.tools.assignToCreaseSet('sxCrease4')"))
 
         maya.cmds.button(
@@ -2254,54 +2403,81 @@ class UI(object):
             height=30,
             width=100,
             command=("sxtools.sxglobals.tools.assignToCreaseSet('sxCrease0')"))
+        self.refreshCreaseButtons()
+
+    # Highlights the crease set of the selected components
+    def refreshCreaseButtons(self):
+        creaseSet = None
+        if len(sxglobals.settings.componentArray) > 0:
+            for i in (4, 3, 2, 1):
+                if maya.cmds.sets(sxglobals.settings.componentArray, im='sxCrease' + str(i)):
+                    creaseSet = i
+                    break
+
+        for i in range(1, 5):
+            if i == creaseSet:
+                bgc = (0.255, 0.302, 0.353)
+            else:
+                bgc = (0.365, 0.365, 0.365)
+            maya.cmds.button('crease' + str(i) + 'Button', edit=True, bgc=bgc)
 
     # TODO: create visibility management buttons,
     # assign joints to skinMeshLayer
     def createSkinMeshUI(self):
-        maya.cmds.frameLayout(
+        self.toolFrame(
             'skinMeshFrame',
-            parent='canvas',
+            'canvas',
+            'skinMeshCollapse',
+            self.createSkinMeshContents,
             label='Create Skinning Mesh',
             width=250,
             marginWidth=5,
-            marginHeight=5,
-            collapsable=True,
-            collapse=sxglobals.settings.frames['skinMeshCollapse'],
-            collapseCommand=(
-                "sxtools.sxglobals.settings.frames['skinMeshCollapse']=True"),
-            expandCommand=(
-                "sxtools.sxglobals.settings.frames['skinMeshCollapse']=False"))
+            marginHeight=5)
 
-        if maya.cmds.objExists(str(sxglobals.settings.objectArray[0]).split('|')[-1].split('_var')[0] + '_skinned'):
-            maya.cmds.text(
-                parent='skinMeshFrame',
-                label=(
-                    'Skinning Mesh already exists for ' +
-                    str(sxglobals.settings.objectArray[0]).split('|')[-1]),
-                ww=True)
-        else:
-            maya.cmds.button(
-                label='Create Skinning Mesh',
-                parent='skinMeshFrame',
-                height=30,
-                command=(
-                    'sxtools.sxglobals.tools.createSkinMesh('
-                    'sxtools.sxglobals.settings.objectArray)'))
+    def createSkinMeshContents(self):
+
+        maya.cmds.text(
+            'skinMeshExistsText',
+            parent='skinMeshFrame',
+            label='',
+            ww=True)
+        maya.cmds.button(
+            'createSkinMeshButton',
+            label='Create Skinning Mesh',
+            parent='skinMeshFrame',
+            height=30,
+            command=(
+                'sxtools.sxglobals.tools.createSkinMesh('
+                'sxtools.sxglobals.settings.objectArray)'))
         maya.cmds.setParent('canvas')
+        self.refreshSkinMeshUI()
+
+    # Shows either the create button or a note about
+    # the existing skinning mesh of the selected object
+    def refreshSkinMeshUI(self):
+        objectName = str(sxglobals.settings.objectArray[0]).split('|')[-1]
+        exists = maya.cmds.objExists(objectName.split('_var')[0] + '_skinned')
+        maya.cmds.text(
+            'skinMeshExistsText',
+            edit=True,
+            manage=exists,
+            label='Skinning Mesh already exists for ' + objectName)
+        maya.cmds.button(
+            'createSkinMeshButton',
+            edit=True,
+            manage=(not exists))
 
     def exportFlagsUI(self):
-        maya.cmds.frameLayout(
+        self.toolFrame(
             'exportFlagsFrame',
-            parent='canvas',
+            'canvas',
+            'exportFlagsCollapse',
+            self.exportFlagsContents,
             label='Export Flags',
             marginWidth=5,
-            marginHeight=0,
-            collapsable=True,
-            collapse=sxglobals.settings.frames['exportFlagsCollapse'],
-            collapseCommand=(
-                "sxtools.sxglobals.settings.frames['exportFlagsCollapse']=True"),
-            expandCommand=(
-                "sxtools.sxglobals.settings.frames['exportFlagsCollapse']=False"))
+            marginHeight=0)
+
+    def exportFlagsContents(self):
 
         maya.cmds.rowColumnLayout(
             'subMeshRowColumns',
@@ -2344,9 +2520,6 @@ class UI(object):
             ann=(
                 'If enabled, up to three different materials'
                 'can be assigned to the object.'),
-            value=(
-                maya.cmds.getAttr(
-                    sxglobals.settings.objectArray[0]+'.subMeshes')),
             onCommand=(
                 'sxtools.sxglobals.tools.setSubMeshFlags('
                 'sxtools.sxglobals.settings.objectArray, True)'),
@@ -2364,9 +2537,6 @@ class UI(object):
             ann=(
                 'If enabled, the object vertex colors '
                 'remain exactly as applied in Maya.'),
-            value=(
-                maya.cmds.getAttr(
-                    sxglobals.settings.objectArray[0]+'.staticVertexColors')),
             onCommand=(
                 'sxtools.sxglobals.tools.setExportFlags('
                 'sxtools.sxglobals.settings.objectArray, True)'),
@@ -2381,10 +2551,6 @@ class UI(object):
             'hardEdgeCheckbox',
             parent='exportFlagsRowColumns',
             label='',
-            value=(
-                maya.cmds.getAttr(
-                    str(sxglobals.settings.objectArray[0]) +
-                    '.hardEdges')),
             onCommand=(
                 'sxtools.sxglobals.tools.setHardEdgeFlag('
                 'sxtools.sxglobals.settings.objectArray, True)'),
@@ -2402,10 +2568,6 @@ class UI(object):
             ann=(
                 'Improves mesh detail at lower '
                 'subdivision levels.'),
-            value=(
-                maya.cmds.getAttr(
-                    str(sxglobals.settings.objectArray[0]) +
-                    '.creaseBevels')),
             onCommand=(
                 'sxtools.sxglobals.tools.setCreaseBevelFlag('
                 'sxtools.sxglobals.settings.objectArray, True)'),
@@ -2422,10 +2584,6 @@ class UI(object):
             min=0,
             max=5,
             step=1,
-            value=(
-                maya.cmds.getAttr(
-                    str(sxglobals.settings.objectArray[0]) +
-                    '.subdivisionLevel')),
             changeCommand=(
                 'sxtools.sxglobals.tools.setSubdivisionFlag('
                 'sxtools.sxglobals.settings.objectArray,'
@@ -2441,15 +2599,90 @@ class UI(object):
             min=0,
             max=180,
             step=1,
-            value=(
-                maya.cmds.getAttr(
-                    str(sxglobals.settings.objectArray[0]) +
-                    '.smoothingAngle')),
             changeCommand=(
                 'sxtools.sxglobals.tools.setSmoothingFlag('
                 'sxtools.sxglobals.settings.objectArray,'
                 'maya.cmds.intField("smoothAngle",'
                 ' query=True, value=True))'))
+        self.refreshExportFlags()
+
+    # Export flags are shown as set on the first selected object
+    def refreshExportFlags(self):
+        obj = str(sxglobals.settings.objectArray[0])
+        maya.cmds.checkBox(
+            'subMeshCheckbox',
+            edit=True,
+            value=maya.cmds.getAttr(obj + '.subMeshes'))
+        maya.cmds.checkBox(
+            'staticPaletteCheckbox',
+            edit=True,
+            value=maya.cmds.getAttr(obj + '.staticVertexColors'))
+        maya.cmds.checkBox(
+            'hardEdgeCheckbox',
+            edit=True,
+            value=maya.cmds.getAttr(obj + '.hardEdges'))
+        maya.cmds.checkBox(
+            'creaseBevelCheckbox',
+            edit=True,
+            value=maya.cmds.getAttr(obj + '.creaseBevels'))
+        maya.cmds.intField(
+            'smoothSteps',
+            edit=True,
+            value=maya.cmds.getAttr(obj + '.subdivisionLevel'))
+        maya.cmds.intField(
+            'smoothAngle',
+            edit=True,
+            value=maya.cmds.getAttr(obj + '.smoothingAngle'))
+
+    def profilerUI(self):
+        self.toolFrame(
+            'profilerFrame',
+            'canvas',
+            'profilerCollapse',
+            self.profilerContents,
+            label='Profiler',
+            width=250,
+            marginWidth=5,
+            marginHeight=5)
+
+    def profilerContents(self):
+        maya.cmds.scrollField(
+            'profilerSummary',
+            parent='profilerFrame',
+            editable=False,
+            wordWrap=False,
+            font='fixedWidthFont',
+            height=150)
+        maya.cmds.rowColumnLayout(
+            'profilerRowColumns',
+            parent='profilerFrame',
+            numberOfColumns=2,
+            columnWidth=((1, 120), (2, 120)),
+            columnAttach=[(1, 'both', 0), (2, 'both', 5)],
+            rowSpacing=(1, 5))
+        maya.cmds.button(
+            label='Refresh',
+            command='sxtools.sxglobals.ui.refreshProfilerUI()')
+        maya.cmds.button(
+            label='Clear',
+            command=(
+                'sxtools.sxglobals.profiler.clear()\n'
+                'sxtools.sxglobals.ui.refreshProfilerUI()'))
+        maya.cmds.button(
+            label='Save JSON',
+            command="sxtools.sxglobals.profiler.saveSamples('json')")
+        maya.cmds.button(
+            label='Save CSV',
+            command="sxtools.sxglobals.profiler.saveSamples('csv')")
+        maya.cmds.setParent('canvas')
+        self.refreshProfilerUI()
+
+    def refreshProfilerUI(self):
+        if maya.cmds.scrollField('profilerSummary', exists=True):
+            maya.cmds.scrollField(
+                'profilerSummary',
+                edit=True,
+                text=sxglobals.profiler.getSummaryText())
 
     def exportButtonUI(self):
         maya.cmds.text(label=' ', parent='canvas')
@@ -0,0 +1,116 @@
+# ----------------------------------------------------------------------------
+#   SX Tools - Maya vertex painting toolkit
+#   (c) 2017-2019  Jani Kahrama / Secret Exit Ltd
+#   Released under MIT license
+#
+#   Records which layered objects and shapes have been verified
+#   against the current project schema (layer names, layer count
+#   and blend modes), and the color set state found for each shape.
+#   Only nodes that are new, or that an attribute callback reports
+#   as changed since the last check, are verified again, so a
+#   refresh of an unchanged selection does not write any attributes.
+# ----------------------------------------------------------------------------
+
+import maya.api.OpenMaya as OM
+import sxlib.blendmodes as blendmodes
+import sxglobals
+
+
+class ValidationCache(object):
+    def __init__(self):
+        self.nodeDict = {}
+        self.callbackDict = {}
+        return None
+
+    def __del__(self):
+        self.clear()
+        print('SX Tools: Exiting validation')
+
+    def getSchema(self):
+        refLayers = sxglobals.layers.sortLayers(
+            sxglobals.settings.project['LayerData'].keys())
+        return (
+            tuple(refLayers),
+            sxglobals.settings.project['LayerCount'],
+            len(blendmodes.blendModes))
+
+    def getNode(self, node):
+        selectionList = OM.MSelectionList()
+        selectionList.add(str(node))
+        return (
+            selectionList.getDagPath(0).fullPathName(),
+            selectionList.getDependNode(0))
+
+    # Returns the nodes that have not been verified against
+    # the current schema, or have changed since
+    def getStale(self, nodes):
+        schema = self.getSchema()
+        stale = []
+        for node in nodes:
+            fullPath, mObject = self.getNode(node)
+            entry = self.nodeDict.get(fullPath)
+            # A deleted node can be replaced by another with the same name
+            if ((entry is None) or
+               (entry['schema'] != schema) or
+               (not entry['handle'].isValid()) or
+               (entry['handle'].hashCode() != OM.MObjectHandle(mObject).hashCode())):
+                stale.append(node)
+        return stale
+
+    # Marks nodes as verified, layerState is the result of the
+    # color set check: 0 valid, 1 no color sets, 2 nonstandard
+    def setState(self, nodes, layerState=0):
+        schema = self.getSchema()
+        for node in nodes:
+            fullPath, mObject = self.getNode(node)
+            self.nodeDict[fullPath] = {
+                'schema': schema,
+                'handle': OM.MObjectHandle(mObject),
+                'layerState': layerState}
+            self.addCallbacks(fullPath, mObject)
+
+    def getState(self, node):
+        return self.nodeDict[self.getNode(node)[0]]['layerState']
+
+    def addCallbacks(self, fullPath, mObject):
+        handle = OM.MObjectHandle(mObject)
+        if fullPath in self.callbackDict:
+            if self.callbackDict[fullPath][0] == handle.hashCode():
+                return
+            self.removeCallbacks(self.callbackDict[fullPath][1])
+        self.callbackDict[fullPath] = (
+            handle.hashCode(), (
+                OM.MNodeMessage.addAttributeAddedOrRemovedCallback(
+                    mObject,
+                    lambda *args: self.invalidate(fullPath)),
+                OM.MNodeMessage.addAttributeChangedCallback(
+                    mObject,
+                    lambda msg, plug, *args: self.attributeChanged(fullPath, plug))))
+
+    def removeCallbacks(self, callbackIDs):
+        for callbackID in callbackIDs:
+            # Callbacks of deleted nodes are already gone
+            try:
+                OM.MMessage.removeCallback(callbackID)
+            except RuntimeError:
+                pass
+
+    # Color sets being added, removed or renamed, and the smooth
+    # draw settings written by the check, change the verified state.
+    # Edits to color values do not.
+    def attributeChanged(self, fullPath, plug):
+        attrName = plug.partialName(useLongNames=True)
+        if attrName in ('useGlobalSmoothDrawType', 'smoothDrawType'):
+            self.invalidate(fullPath)
+        elif (attrName.startswith('colorSet[') and
+              (('.' not in attrName) or attrName.endswith('.colorName'))):
+            self.invalidate(fullPath)
+
+    def invalidate(self, fullPath):
+        self.nodeDict.pop(fullPath, None)
+
+    def clear(self):
+        self.nodeDict.clear()
+        for hashCode, callbackIDs in self.callbackDict.values():
+            self.removeCallbacks(callbackIDs)
+        self.callbackDict.clear()
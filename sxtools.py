@@ -34,6 +34,8 @@
 # ----------------------------------------------------------------------------
 
 import maya.cmds
+import importlib
+import timeit
 import sxglobals
 
 
@@ -48,6 +50,20 @@ def start():
             print('SX Tools: Old instance still shutting down!')
             return
 
+    try:
+        importlib.import_module('numpy')
+    except ImportError:
+        print('SX Tools Error: NumPy is required but could not be imported')
+        return
+
+    startTime = timeit.default_timer()
     sxglobals.initialize()
     sxglobals.core.startSXTools()
-    print('SX Tools: Plugin started')
+    startupTime = timeit.default_timer() - startTime
+    sxglobals.startupTimes['start'] = startupTime
+    print('SX Tools: Plugin started in ' + str(round(startupTime, 3)) + ' seconds')
+    if startupTime > sxglobals.settings.tools['startupBudget']:
+        print(
+            'SX Tools Warning: Startup exceeded ' +
+            str(sxglobals.settings.tools['startupBudget']) + ' seconds, '
+            'see sxtools.sxglobals.printStartupTimes()')